@@ -1,9 +1,12 @@
 from django.contrib import admin
-from django.urls import path
+from django.http import FileResponse, Http404
+from django.urls import path, reverse
+from django.utils.html import format_html
 from django.shortcuts import render
-from django.db.models import Count, Q
-from django.utils import timezone
-from datetime import timedelta
+from auth_api.attempt_metrics import rollup_metrics
+from auth_api.rollups import app_scope, user_scope
+from facial_auth_app.thumbnails import THUMBNAIL_SIZES, get_thumbnail, thumbnail_version
+
 from .models import CustomUser, ClientApp, EndUser, EndUserFeedback, EndUserLoginAttempt, CustomUserLoginAttempt
 
 
@@ -49,72 +52,9 @@ class CustomUserAdmin(admin.ModelAdmin):
                 {"message": "Usuario no encontrado."},
             )
 
-        now = timezone.now()
-        time_ranges = {
-            "last_24_hours": now - timedelta(hours=24),
-            "last_7_days": now - timedelta(days=7),
-            "last_30_days": now - timedelta(days=30),
-            "all_time": None,
-        }
-
-        metrics_data = {}
-
-        for period_name, start_time in time_ranges.items():
-            attempts_query = CustomUserLoginAttempt.objects.filter(user=user)
-            if start_time:
-                attempts_query = attempts_query.filter(timestamp__gte=start_time)
-
-            total_attempts = attempts_query.count()
-
-            initial_success = attempts_query.filter(initial_status="success").count()
-            initial_ambiguous = attempts_query.filter(
-                initial_status="ambiguous_match"
-            ).count()
-            initial_no_match = attempts_query.filter(initial_status="no_match").count()
-            initial_error = attempts_query.filter(initial_status="error").count()
-
-            # Métricas basadas en el feedback del usuario
-            confirmed_correct_by_feedback = attempts_query.filter(
-                user_feedback="correcto", is_verified_and_correct=True
-            ).count()
-            rejected_incorrect_by_feedback = attempts_query.filter(
-                user_feedback="incorrecto", is_verified_and_correct=False
-            ).count()
-
-            # Tasa de Verdaderos Positivos (TP Rate): Éxitos confirmados por el usuario / Total de intentos con feedback
-            # Esto es más preciso que solo initial_success
-            total_feedback_attempts = (
-                confirmed_correct_by_feedback + rejected_incorrect_by_feedback
-            )
-            true_positive_rate = (
-                f"{confirmed_correct_by_feedback / total_feedback_attempts * 100:.2f}%"
-                if total_feedback_attempts > 0
-                else "N/A"
-            )
-
-            # Tasa de Falsos Positivos (FP Rate): Rechazados por el usuario / Total de intentos con feedback
-            false_positive_rate = (
-                f"{rejected_incorrect_by_feedback / total_feedback_attempts * 100:.2f}%"
-                if total_feedback_attempts > 0
-                else "N/A"
-            )
-
-            metrics_data[period_name] = {
-                "total_attempts": total_attempts,
-                "initial_success": initial_success,
-                "initial_ambiguous": initial_ambiguous,
-                "initial_no_match": initial_no_match,
-                "initial_error": initial_error,
-                "confirmed_correct_by_feedback": confirmed_correct_by_feedback,
-                "rejected_incorrect_by_feedback": rejected_incorrect_by_feedback,
-                "true_positive_rate": true_positive_rate,
-                "false_positive_rate": false_positive_rate,
-                "initial_success_rate": (
-                    f"{initial_success / total_attempts * 100:.2f}%"
-                    if total_attempts > 0
-                    else "0.00%"
-                ),
-            }
+        metrics_data = rollup_metrics(
+            user_scope(user.id), CustomUserLoginAttempt.objects.filter(user=user)
+        )
 
         context = self.admin_site.each_context(request)
         context.update(
@@ -178,68 +118,9 @@ class ClientAppAdmin(admin.ModelAdmin):
                 {"message": "Aplicación no encontrada."},
             )
 
-        now = timezone.now()
-        time_ranges = {
-            "last_24_hours": now - timedelta(hours=24),
-            "last_7_days": now - timedelta(days=7),
-            "last_30_days": now - timedelta(days=30),
-            "all_time": None,
-        }
-
-        metrics_data = {}
-
-        for period_name, start_time in time_ranges.items():
-            attempts_query = EndUserLoginAttempt.objects.filter(app=app)
-            if start_time:
-                attempts_query = attempts_query.filter(timestamp__gte=start_time)
-
-            total_attempts = attempts_query.count()
-
-            initial_success = attempts_query.filter(initial_status="success").count()
-            initial_ambiguous = attempts_query.filter(
-                initial_status="ambiguous_match"
-            ).count()
-            initial_no_match = attempts_query.filter(initial_status="no_match").count()
-            initial_error = attempts_query.filter(initial_status="error").count()
-
-            # Métricas basadas en el feedback del usuario
-            confirmed_correct_by_feedback = attempts_query.filter(
-                user_feedback="correcto", is_verified_and_correct=True
-            ).count()
-            rejected_incorrect_by_feedback = attempts_query.filter(
-                user_feedback="incorrecto", is_verified_and_correct=False
-            ).count()
-
-            total_feedback_attempts = (
-                confirmed_correct_by_feedback + rejected_incorrect_by_feedback
-            )
-            true_positive_rate = (
-                f"{confirmed_correct_by_feedback / total_feedback_attempts * 100:.2f}%"
-                if total_feedback_attempts > 0
-                else "N/A"
-            )
-            false_positive_rate = (
-                f"{rejected_incorrect_by_feedback / total_feedback_attempts * 100:.2f}%"
-                if total_feedback_attempts > 0
-                else "N/A"
-            )
-
-            metrics_data[period_name] = {
-                "total_attempts": total_attempts,
-                "initial_success": initial_success,
-                "initial_ambiguous": initial_ambiguous,
-                "initial_no_match": initial_no_match,
-                "initial_error": initial_error,
-                "confirmed_correct_by_feedback": confirmed_correct_by_feedback,
-                "rejected_incorrect_by_feedback": rejected_incorrect_by_feedback,
-                "true_positive_rate": true_positive_rate,
-                "false_positive_rate": false_positive_rate,
-                "initial_success_rate": (
-                    f"{initial_success / total_attempts * 100:.2f}%"
-                    if total_attempts > 0
-                    else "0.00%"
-                ),
-            }
+        metrics_data = rollup_metrics(
+            app_scope(app.id), EndUserLoginAttempt.objects.filter(app=app)
+        )
 
         context = self.admin_site.each_context(request)
         context.update(
@@ -263,8 +144,56 @@ class EndUserAdmin(admin.ModelAdmin):
     raw_id_fields = ("app",)
 
 
+class ThumbnailAdminMixin:
+    """
+    Sirve miniaturas cacheadas de `submitted_image` en lugar de la imagen original,
+    con cabeceras de caché de larga duración (la URL cambia si cambia la imagen).
+    """
+
+    thumbnail_field = "submitted_image"
+
+    def get_urls(self):
+        urls = super().get_urls()
+        opts = self.model._meta
+        custom_urls = [
+            path(
+                "<path:object_id>/thumbnail/<str:size>/",
+                self.admin_site.admin_view(self.thumbnail_view),
+                name=f"{opts.app_label}_{opts.model_name}_thumbnail",
+            ),
+        ]
+        return custom_urls + urls
+
+    def thumbnail_view(self, request, object_id, size):
+        obj = self.get_object(request, object_id)
+        image = getattr(obj, self.thumbnail_field) if obj else None
+        if not image or size not in THUMBNAIL_SIZES:
+            raise Http404("Imagen no encontrada.")
+        try:
+            thumbnail = get_thumbnail(image, size)
+        except (OSError, ValueError):
+            raise Http404("Imagen no encontrada.")
+
+        response = FileResponse(open(thumbnail, "rb"), content_type="image/webp")
+        response["Cache-Control"] = "private, max-age=31536000, immutable"
+        return response
+
+    def thumbnail_html(self, obj, size, style):
+        image = getattr(obj, self.thumbnail_field)
+        if not image:
+            return "No Image"
+        opts = self.model._meta
+        url = reverse(
+            f"admin:{opts.app_label}_{opts.model_name}_thumbnail",
+            args=[obj.pk, size],
+        )
+        return format_html(
+            '<img src="{}?v={}" style="{}" />', url, thumbnail_version(image.name), style
+        )
+
+
 @admin.register(EndUserFeedback)
-class EndUserFeedbackAdmin(admin.ModelAdmin):
+class EndUserFeedbackAdmin(ThumbnailAdminMixin, admin.ModelAdmin):
     list_display = ("end_user", "app", "timestamp", "submitted_image_thumbnail")
     search_fields = ("end_user__full_name", "end_user__email", "app__name")
     list_filter = ("app", "timestamp")
@@ -277,32 +206,20 @@ class EndUserFeedbackAdmin(admin.ModelAdmin):
     )
 
     def submitted_image_thumbnail(self, obj):
-        from django.utils.html import format_html
-
-        if obj.submitted_image:
-            return format_html(
-                '<img src="{}" width="50" height="50" style="border-radius: 5px;" />',
-                obj.submitted_image.url,
-            )
-        return "No Image"
+        return self.thumbnail_html(
+            obj, "small", "width: 50px; height: 50px; object-fit: cover; border-radius: 5px;"
+        )
 
     submitted_image_thumbnail.short_description = "Miniatura"
 
     def submitted_image_preview(self, obj):
-        from django.utils.html import format_html
-
-        if obj.submitted_image:
-            return format_html(
-                '<img src="{}" style="max-width: 300px; height: auto;" />',
-                obj.submitted_image.url,
-            )
-        return "No Image"
+        return self.thumbnail_html(obj, "preview", "max-width: 300px; height: auto;")
 
     submitted_image_preview.short_description = "Previsualización de Imagen"
 
 
 @admin.register(EndUserLoginAttempt)
-class EndUserLoginAttemptAdmin(admin.ModelAdmin):
+class EndUserLoginAttemptAdmin(ThumbnailAdminMixin, admin.ModelAdmin):
     list_display = (
         "app",
         "timestamp",
@@ -339,20 +256,13 @@ class EndUserLoginAttemptAdmin(admin.ModelAdmin):
     )
 
     def submitted_image_preview(self, obj):
-        from django.utils.html import format_html
-
-        if obj.submitted_image:
-            return format_html(
-                '<img src="{}" style="max-width: 300px; height: auto;" />',
-                obj.submitted_image.url,
-            )
-        return "No Image"
+        return self.thumbnail_html(obj, "preview", "max-width: 300px; height: auto;")
 
     submitted_image_preview.short_description = "Imagen Enviada"
 
 
 @admin.register(CustomUserLoginAttempt)
-class CustomUserLoginAttemptAdmin(admin.ModelAdmin):
+class CustomUserLoginAttemptAdmin(ThumbnailAdminMixin, admin.ModelAdmin):
     list_display = (
         "user",
         "timestamp",
@@ -383,13 +293,6 @@ class CustomUserLoginAttemptAdmin(admin.ModelAdmin):
     )
 
     def submitted_image_preview(self, obj):
-        from django.utils.html import format_html
-
-        if obj.submitted_image:
-            return format_html(
-                '<img src="{}" style="max-width: 300px; height: auto;" />',
-                obj.submitted_image.url,
-            )
-        return "No Image"
+        return self.thumbnail_html(obj, "preview", "max-width: 300px; height: auto;")
 
     submitted_image_preview.short_description = "Imagen Enviada"
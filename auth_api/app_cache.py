@@ -0,0 +1,78 @@
+"""
+Caché de ClientApp por token para los endpoints públicos de EndUsers.
+
+Guarda solo los campos que necesitan el registro, el login y el feedback (ID,
+dueño, umbrales...) en el alias `FACE_CLIENT_APP_CACHE_ALIAS`, con el TTL de ese
+alias. Las señales de `auth_api.signals` borran la entrada al guardar o eliminar
+la app (API, admin o cascada). Con la caché en memoria local los demás procesos
+la ven como muy tarde al vencer el TTL; con Redis/Memcached, al instante.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import ClientApp
+
+KEY_PREFIX = "client-app"
+
+CACHED_FIELDS = [
+    field.attname
+    for field in ClientApp._meta.concrete_fields
+    if field.attname
+    in {
+        "id",
+        "owner_id",
+        "name",
+        "token",
+        "CONFIDENCE_THRESHOLD",
+        "FALLBACK_THRESHOLD",
+        "login_attempt_retention_days",
+    }
+]
+
+
+def _backend():
+    return caches[settings.FACE_CLIENT_APP_CACHE_ALIAS]
+
+
+def _key(token: str) -> str:
+    return f"{KEY_PREFIX}:{token}"
+
+
+def _from_values(values):
+    # Los campos no cacheados quedan diferidos y se cargan solo si se usan
+    return ClientApp.from_db(ClientApp.objects.db, CACHED_FIELDS, values)
+
+
+def _queryset(token):
+    return ClientApp.objects.filter(token=token).values_list(*CACHED_FIELDS)
+
+
+def get_app_by_token(token: str) -> ClientApp:
+    """Devuelve la ClientApp del token. Lanza ClientApp.DoesNotExist si no existe."""
+    values = _backend().get(_key(token))
+    if values is None:
+        values = _queryset(token).first()
+        if values is None:
+            raise ClientApp.DoesNotExist
+        _backend().set(_key(token), values)
+    return _from_values(values)
+
+
+async def aget_app_by_token(token: str) -> ClientApp:
+    values = await _backend().aget(_key(token))
+    if values is None:
+        values = await _queryset(token).afirst()
+        if values is None:
+            raise ClientApp.DoesNotExist
+        await _backend().aset(_key(token), values)
+    return _from_values(values)
+
+
+def invalidate_app(token: str) -> None:
+    """
+    Borra la entrada del token ahora y otra vez al confirmar la transacción, por
+    si una petición concurrente la repobló con los datos anteriores.
+    """
+    _backend().delete(_key(token))
+    transaction.on_commit(lambda: _backend().delete(_key(token)))
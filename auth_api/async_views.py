@@ -0,0 +1,202 @@
+"""
+Versiones async de las vistas de registro, login y feedback facial.
+
+Se sirven en lugar de las síncronas cuando FACE_AUTH_ASYNC_VIEWS está activo y la
+app corre bajo ASGI. El acceso a la base de datos pasa por `sync_to_async` y la
+inferencia de TF corre en el executor acotado de `facial_auth_app.services`, así
+un worker mantiene muchas peticiones en vuelo sin superar
+FACE_INFERENCE_MAX_WORKERS inferencias simultáneas.
+"""
+from adrf.views import APIView
+from asgiref.sync import sync_to_async
+from rest_framework.response import Response
+from rest_framework import status, permissions
+
+from facial_auth_app.services import _aembed_image_bytes, probe_versions
+from facial_auth_app.gallery import SYSTEM_SCOPE, app_scope, galleries_for
+from facial_auth_app.admission import InferenceOverloadedError, request_deadline
+
+from auth_api.app_cache import aget_app_by_token
+from auth_api.models import ClientApp
+from auth_api.serializers import (
+    RegistrationSerializer,
+    FaceLoginSerializer,
+    FaceLoginFeedbackSerializer,
+    EndUserRegistrationSerializer,
+)
+from auth_api.views import (
+    _rejected_image_response,
+    _register_user_response,
+    _start_system_login_attempt,
+    _finish_system_login,
+    _login_error_response,
+    _load_system_feedback,
+    _store_system_feedback,
+    _register_end_user_response,
+    _start_end_user_login_attempt,
+    _finish_end_user_login,
+    _load_end_user_feedback,
+    _store_end_user_feedback,
+)
+
+
+async def _adetect_upload(upload, deadline):
+    """Calcula detección + embedding de un archivo subido y rebobina el archivo."""
+    upload.seek(0)
+    detection = await _aembed_image_bytes(upload.read(), deadline=deadline)
+    upload.seek(0)
+    return detection
+
+
+async def _alogin_probes(scope, img_bytes, deadline):
+    """Versión async de `_login_probes`."""
+    galleries = await sync_to_async(galleries_for)(scope)
+    detections = {}
+    for version in probe_versions(galleries):
+        detections[version] = await _aembed_image_bytes(
+            img_bytes, deadline=deadline, version=version
+        )
+    return detections
+
+
+class AsyncRegisterView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    async def post(self, request):
+        force_register = request.data.get("force_register", "false").lower() == "true"
+        context = {"force_register": force_register}
+
+        # Primero los campos y la imagen (tamaño, píxeles), sin gastar inferencia
+        precheck = RegistrationSerializer(
+            data=request.data, context={**context, "detection_pending": True}
+        )
+        rejected = await sync_to_async(_register_user_response)(precheck, validate_only=True)
+        if rejected:
+            return rejected
+
+        context["detection"] = await _adetect_upload(
+            request.FILES["face_image"], request_deadline(request)
+        )
+        serializer = RegistrationSerializer(data=request.data, context=context)
+        return await sync_to_async(_register_user_response)(serializer)
+
+
+class AsyncFaceLoginView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    async def post(self, request):
+        serializer = FaceLoginSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        image_file = request.FILES.get("face_image")
+
+        img_bytes = image_file.read()
+        login_attempt = await sync_to_async(_start_system_login_attempt)(request, img_bytes)
+
+        try:
+            detections = await _alogin_probes(SYSTEM_SCOPE, img_bytes, request_deadline(request))
+            return await sync_to_async(_finish_system_login)(login_attempt, detections)
+        except InferenceOverloadedError:
+            raise
+        except Exception as e:
+            return await sync_to_async(_login_error_response)(login_attempt, e)
+
+
+class AsyncFaceLoginFeedbackView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    async def post(self, request):
+        serializer = FaceLoginFeedbackSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        face_image = request.FILES.get("face_image")
+
+        login_attempt, user, response = await sync_to_async(_load_system_feedback)(
+            serializer.validated_data
+        )
+        if response:
+            return response
+
+        result = await _adetect_upload(face_image, request_deadline(request))
+        return await sync_to_async(_store_system_feedback)(
+            login_attempt, user, face_image, result
+        )
+
+
+class AsyncEndUserRegisterView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    async def post(self, request, app_token):
+        try:
+            app = await aget_app_by_token(app_token)
+        except ClientApp.DoesNotExist:
+            return Response(
+                {"detail": "Token inválido"}, status=status.HTTP_403_FORBIDDEN
+            )
+
+        context = {"app": app}
+
+        # Primero los campos y la imagen (tamaño, píxeles, email), sin gastar inferencia
+        precheck = EndUserRegistrationSerializer(data=request.data, context=context)
+        rejected = await sync_to_async(_register_end_user_response)(
+            precheck, validate_only=True
+        )
+        if rejected:
+            return rejected
+
+        context["detection"] = await _adetect_upload(
+            request.FILES["face_image"], request_deadline(request)
+        )
+        serializer = EndUserRegistrationSerializer(data=request.data, context=context)
+        return await sync_to_async(_register_end_user_response)(serializer)
+
+
+class AsyncEndUserFaceLoginView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    async def post(self, request, app_token):
+        try:
+            app = await aget_app_by_token(app_token)
+        except ClientApp.DoesNotExist:
+            return Response(
+                {"detail": "Token inválido"}, status=status.HTTP_403_FORBIDDEN
+            )
+
+        image = request.FILES.get("face_image")
+        if not image:
+            return Response(
+                {"detail": "Imagen requerida"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        rejected = _rejected_image_response(image)
+        if rejected:
+            return rejected
+
+        img_bytes = image.read()
+        login_attempt = await sync_to_async(_start_end_user_login_attempt)(app, img_bytes)
+
+        try:
+            detections = await _alogin_probes(
+                app_scope(app.id), img_bytes, request_deadline(request)
+            )
+            return await sync_to_async(_finish_end_user_login)(
+                app, login_attempt, detections
+            )
+        except InferenceOverloadedError:
+            raise
+        except Exception as e:
+            return await sync_to_async(_login_error_response)(login_attempt, e)
+
+
+class AsyncEndUserFaceFeedbackView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    async def post(self, request, app_token):
+        face_image = request.FILES.get("face_image")
+        app, login_attempt, end_user, response = await sync_to_async(
+            _load_end_user_feedback
+        )(request.data, face_image, app_token)
+        if response:
+            return response
+
+        detection = await _adetect_upload(face_image, request_deadline(request))
+        return await sync_to_async(_store_end_user_feedback)(
+            app, login_attempt, end_user, face_image, detection
+        )
@@ -0,0 +1,219 @@
+"""
+Registro de los intentos de login facial con una sola inserción por petición.
+
+La vista prepara el intento sin guardarlo (`stage`) y lo registra una única vez
+con su estado final, mejor coincidencia y distancia (`record`). Con
+FACE_LOGIN_ATTEMPT_BATCH_SIZE > 1 y PostgreSQL, los intentos se acumulan y se
+insertan con `bulk_create` en lotes pequeños; el id se reserva de la secuencia
+de la tabla al registrar, así el flujo de feedback lo recibe en la respuesta
+aunque la fila todavía no exista. Las vistas de feedback buscan el intento con
+`find_attempt`, que vacía el búfer local y espera un ciclo de vaciado solo si el
+id pudo quedar en el búfer de otro worker.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .image_writer import assign_pending_image, image_writer
+from .rollups import track_created
+
+logger = logging.getLogger(__name__)
+
+IMAGE_FIELD = "submitted_image"
+# Ciclos de vaciado que se reintenta un intento si la base de datos falla
+MAX_FLUSH_RETRIES = 5
+
+
+def stage(login_attempt, img_bytes: bytes):
+    """Asigna la referencia de la imagen al intento sin tocar la base de datos."""
+    assign_pending_image(login_attempt, IMAGE_FIELD)
+    login_attempt._pending_image_bytes = img_bytes
+    return login_attempt
+
+
+def _buffering_enabled() -> bool:
+    # Reservar ids por adelantado necesita la secuencia de PostgreSQL
+    return settings.FACE_LOGIN_ATTEMPT_BATCH_SIZE > 1 and connection.vendor == "postgresql"
+
+
+def _reserve_id(model) -> int:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id'))", [model._meta.db_table]
+        )
+        return cursor.fetchone()[0]
+
+
+def _last_reserved_id(model):
+    """Último id entregado por la secuencia de la tabla (None si aún no entregó ninguno)."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_sequence_last_value(pg_get_serial_sequence(%s, 'id')::regclass)",
+            [model._meta.db_table],
+        )
+        return cursor.fetchone()[0]
+
+
+def _may_be_buffered(model, attempt_id) -> bool:
+    """
+    Indica si un intento que no está en la tabla puede seguir en el búfer de otro
+    worker: su id ya salió de la secuencia y ninguna fila con un id mayor se
+    insertó antes de los dos últimos ciclos de vaciado. Los ids se reservan en
+    orden, así que un id anterior a esa fila ya tendría que estar insertado.
+    """
+    try:
+        attempt_id = int(attempt_id)
+    except (TypeError, ValueError):
+        return False
+    last_reserved = _last_reserved_id(model)
+    if last_reserved is None or attempt_id > last_reserved:
+        return False
+    cutoff = timezone.now() - timedelta(seconds=2 * settings.FACE_LOGIN_ATTEMPT_FLUSH_SECONDS)
+    return not model.objects.filter(id__gt=attempt_id, timestamp__lt=cutoff).exists()
+
+
+def _write_image(login_attempt) -> None:
+    img_bytes = getattr(login_attempt, "_pending_image_bytes", None)
+    if img_bytes is not None:
+        del login_attempt._pending_image_bytes
+        image_writer.write_later(login_attempt, IMAGE_FIELD, img_bytes)
+
+
+class _AttemptBuffer:
+    def __init__(self):
+        self._pending = defaultdict(list)
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def add(self, login_attempt) -> None:
+        with self._lock:
+            pending = self._pending[type(login_attempt)]
+            pending.append(login_attempt)
+            full = len(pending) >= settings.FACE_LOGIN_ATTEMPT_BATCH_SIZE
+        self._ensure_flusher()
+        if full:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            batches, self._pending = self._pending, defaultdict(list)
+        for model, attempts in batches.items():
+            inserted = self._insert(model, attempts)
+            # La imagen se escribe cuando la fila ya existe
+            for login_attempt in inserted:
+                _write_image(login_attempt)
+
+    def _insert(self, model, attempts) -> list:
+        """
+        Inserta el lote y devuelve los intentos insertados. Si el `bulk_create`
+        falla, inserta fila a fila: un intento que choca con una fila existente se
+        descarta y los que fallan por la base de datos vuelven al búfer.
+        """
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(attempts)
+            # bulk_create no emite señales; save() sí, así que ese camino ya cuenta
+            track_created(attempts)
+            return attempts
+        except DatabaseError:
+            logger.exception("Falló la inserción en lote de %d intentos", len(attempts))
+
+        inserted, retry = [], []
+        for login_attempt in attempts:
+            try:
+                with transaction.atomic():
+                    login_attempt.save(force_insert=True)
+                inserted.append(login_attempt)
+            except IntegrityError:
+                logger.exception(
+                    "Se descarta el intento %s: no se puede insertar", login_attempt.pk
+                )
+            except DatabaseError:
+                login_attempt._flush_retries = getattr(login_attempt, "_flush_retries", 0) + 1
+                if login_attempt._flush_retries < MAX_FLUSH_RETRIES:
+                    retry.append(login_attempt)
+                else:
+                    logger.error(
+                        "Se descarta el intento %s tras %d reintentos",
+                        login_attempt.pk,
+                        MAX_FLUSH_RETRIES,
+                    )
+        if retry:
+            with self._lock:
+                self._pending[model][:0] = retry
+        return inserted
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(
+                target=self._run, name="login-attempt-flusher", daemon=True
+            )
+            self._flusher.start()
+            atexit.register(self.flush)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(settings.FACE_LOGIN_ATTEMPT_FLUSH_SECONDS)
+            try:
+                self.flush()
+            except Exception:
+                # El hilo no puede morir: los intentos siguientes quedarían sin guardar
+                logger.exception("Error al vaciar el búfer de intentos de login")
+            finally:
+                close_old_connections()
+
+
+_buffer = _AttemptBuffer()
+
+
+def record(login_attempt) -> None:
+    """
+    Registra el intento con su estado actual. Si ya se registró, guarda los
+    cambios: una fila todavía en el búfer los recoge al insertarse.
+    """
+    if getattr(login_attempt, "_recorded", False):
+        if not login_attempt._state.adding:
+            login_attempt.save()
+        return
+    login_attempt._recorded = True
+
+    if _buffering_enabled():
+        login_attempt.pk = _reserve_id(type(login_attempt))
+        _buffer.add(login_attempt)
+        return
+
+    login_attempt.save(force_insert=True)
+    _write_image(login_attempt)
+
+
+def flush() -> None:
+    """Inserta ya los intentos pendientes de este proceso."""
+    _buffer.flush()
+
+
+def find_attempt(queryset, **lookup):
+    """
+    `queryset.get(**lookup)` para el feedback de un intento recién registrado
+    (`lookup` lleva su `id`). Lanza DoesNotExist si el intento no existe; solo se
+    espera un ciclo de vaciado cuando el id pudo quedar en el búfer de otro worker,
+    así un id inventado o antiguo no retiene la petición.
+    """
+    flush()
+    try:
+        return queryset.get(**lookup)
+    except queryset.model.DoesNotExist:
+        if not _buffering_enabled() or not _may_be_buffered(queryset.model, lookup.get("id")):
+            raise
+    time.sleep(settings.FACE_LOGIN_ATTEMPT_FLUSH_SECONDS)
+    return queryset.get(**lookup)
@@ -0,0 +1,98 @@
+"""
+Métricas de los intentos de login facial para las vistas de métricas del admin.
+
+Las horas completas se leen de `LoginAttemptRollup` y solo la hora en curso se
+calcula sobre los intentos. Las ventanas se alinean a horas: "last_24_hours"
+son las 24 horas más recientes, incluida la actual. Cada lectura es una sola
+consulta de agregación condicional (`Sum`/`Count` con `filter=Q(...)`).
+"""
+from datetime import timedelta
+
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .models import LoginAttemptRollup
+from .rollups import truncate_hour
+
+WINDOWS = {
+    "last_24_hours": timedelta(hours=24),
+    "last_7_days": timedelta(days=7),
+    "last_30_days": timedelta(days=30),
+    "all_time": None,
+}
+
+COUNTERS = {
+    "total_attempts": Q(),
+    "initial_success": Q(initial_status="success"),
+    "initial_ambiguous": Q(initial_status="ambiguous_match"),
+    "initial_no_match": Q(initial_status="no_match"),
+    "initial_error": Q(initial_status="error"),
+    "confirmed_correct_by_feedback": Q(user_feedback="correcto", is_verified_and_correct=True),
+    "rejected_incorrect_by_feedback": Q(
+        user_feedback="incorrecto", is_verified_and_correct=False
+    ),
+}
+
+ROLLUP_COUNTERS = {
+    "total_attempts": Q(),
+    "initial_success": Q(initial_status="success"),
+    "initial_ambiguous": Q(initial_status="ambiguous_match"),
+    "initial_no_match": Q(initial_status="no_match"),
+    "initial_error": Q(initial_status="error"),
+    "confirmed_correct_by_feedback": Q(feedback_outcome="confirmed"),
+    "rejected_incorrect_by_feedback": Q(feedback_outcome="rejected"),
+}
+
+
+def _rate(part, total, empty):
+    return f"{part / total * 100:.2f}%" if total > 0 else empty
+
+
+def summarize(counts: dict) -> dict:
+    """Añade a los contadores de una ventana las tasas que muestran las plantillas."""
+    confirmed = counts["confirmed_correct_by_feedback"]
+    rejected = counts["rejected_incorrect_by_feedback"]
+    total_feedback_attempts = confirmed + rejected
+    return {
+        **counts,
+        # TP Rate: éxitos confirmados por el usuario / total de intentos con feedback
+        "true_positive_rate": _rate(confirmed, total_feedback_attempts, "N/A"),
+        # FP Rate: rechazados por el usuario / total de intentos con feedback
+        "false_positive_rate": _rate(rejected, total_feedback_attempts, "N/A"),
+        "initial_success_rate": _rate(
+            counts["initial_success"], counts["total_attempts"], "0.00%"
+        ),
+    }
+
+
+def rollup_metrics(scope: str, live_queryset, now=None) -> dict:
+    """
+    Devuelve {ventana: métricas} del ámbito con dos consultas: las horas completas
+    desde los rollups y la hora en curso desde `live_queryset` (los intentos del
+    mismo ámbito).
+    """
+    now = now or timezone.now()
+    current_hour = truncate_hour(now)
+
+    aggregates = {}
+    for window, span in WINDOWS.items():
+        # La hora en curso cuenta como la última hora de la ventana
+        in_window = Q(hour__gt=current_hour - span) if span else Q()
+        for counter, condition in ROLLUP_COUNTERS.items():
+            aggregates[f"{window}__{counter}"] = Sum("count", filter=in_window & condition)
+    past = LoginAttemptRollup.objects.filter(scope=scope, hour__lt=current_hour).aggregate(
+        **aggregates
+    )
+
+    live = live_queryset.filter(timestamp__gte=current_hour).aggregate(
+        **{counter: Count("pk", filter=condition) for counter, condition in COUNTERS.items()}
+    )
+    return {
+        window: summarize(
+            {
+                counter: (past[f"{window}__{counter}"] or 0) + live[counter]
+                for counter in COUNTERS
+            }
+        )
+        for window in WINDOWS
+    }
@@ -0,0 +1,285 @@
+"""
+Inscripción masiva de EndUsers a partir de un archivo ZIP.
+
+El ZIP trae las imágenes y un manifiesto (`manifest.csv` o `manifest.json`) con una
+fila por usuario: `email`, `image` (ruta dentro del ZIP) y, opcionalmente,
+`full_name`, `role` y `password`. Los usuarios se procesan por lotes: la inferencia
+de cada lote pasa una sola vez por el control de admisión (y se reparte entre los
+procesos del pool de inferencia si está activo), los duplicados (dentro del lote y
+contra la galería de la app, con embeddings del modelo activo) se detectan con un
+único producto de matrices y las filas nuevas se escriben con `bulk_create`.
+`BulkEnrollment.run` produce un resultado por elemento a medida que termina cada
+lote. Si un lote no consigue turno de inferencia en FACE_BULK_ENROLL_MAX_WAIT
+segundos, la inscripción se detiene con una última línea de error que indica desde
+qué fila reanudarla.
+"""
+import csv
+import io
+import json
+import time
+import zipfile
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+
+from facial_auth_app.admission import InferenceOverloadedError, inference_admission
+from facial_auth_app.gallery import app_scope, bump_gallery, galleries_for
+from facial_auth_app.image_probe import ImageRejectedError
+from facial_auth_app.model_versions import current_model_version
+from facial_auth_app.services import _bytes_to_array, _compute_embedding_batch
+from auth_api.models import EndUser
+
+MANIFEST_NAMES = ("manifest.csv", "manifest.json")
+TEXT_FIELDS = ("email", "image", "full_name", "role", "password")
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def clean_row(row: dict) -> dict:
+    """
+    Devuelve la fila con sus campos de texto como cadenas (sin espacios en los
+    extremos, salvo la contraseña). En manifest.json pueden venir números, que se
+    convierten, u otros tipos, que son un error de la fila.
+    """
+    cleaned = dict(row)
+    for field in TEXT_FIELDS:
+        value = row.get(field)
+        if value is None:
+            value = ""
+        elif not isinstance(value, (str, int, float)) or isinstance(value, bool):
+            raise ValidationError(f"El campo '{field}' debe ser texto.")
+        value = str(value)
+        cleaned[field] = value if field == "password" else value.strip()
+    return cleaned
+
+
+def read_manifest(archive: zipfile.ZipFile) -> list[dict]:
+    """Lee el manifiesto del ZIP y devuelve sus filas como diccionarios."""
+    names = set(archive.namelist())
+    manifest_name = next((name for name in MANIFEST_NAMES if name in names), None)
+    if manifest_name is None:
+        raise ValidationError("El archivo debe incluir manifest.csv o manifest.json.")
+
+    raw = archive.read(manifest_name).decode("utf-8-sig")
+    if manifest_name.endswith(".json"):
+        try:
+            rows = json.loads(raw)
+        except json.JSONDecodeError:
+            raise ValidationError("manifest.json no es un JSON válido.")
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValidationError("manifest.json debe ser una lista de objetos.")
+    else:
+        rows = list(csv.DictReader(io.StringIO(raw)))
+
+    if not rows:
+        raise ValidationError("El manifiesto está vacío.")
+    if len(rows) > settings.FACE_BULK_ENROLL_MAX_ITEMS:
+        raise ValidationError(
+            f"El manifiesto supera el máximo de {settings.FACE_BULK_ENROLL_MAX_ITEMS} usuarios."
+        )
+    return rows
+
+
+def open_archive(fileobj) -> tuple[zipfile.ZipFile, list[dict]]:
+    """Abre el ZIP subido y valida su manifiesto."""
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile:
+        raise ValidationError("El archivo enviado no es un ZIP válido.")
+    return archive, read_manifest(archive)
+
+
+class BulkEnrollment:
+    def __init__(self, app, archive, force_register=False, batch_size=None):
+        self.app = app
+        self.archive = archive
+        self.force_register = force_register
+        self.batch_size = batch_size or settings.FACE_BULK_ENROLL_BATCH_SIZE
+        self._seen_emails = set()
+
+    def run(self, rows):
+        """Procesa el manifiesto por lotes y produce un dict de resultado por fila."""
+        # La galería y los emails existentes se cargan una sola vez; cada lote
+        # agrega sus altas para que los lotes siguientes las tengan en cuenta.
+        gallery = galleries_for(app_scope(self.app.id)).get(current_model_version())
+        self._gallery = gallery.matrix if gallery is not None else None
+        self._existing = {
+            user.email: user
+            for user in self.app.end_users.only("id", "email", "deleted")
+        }
+
+        for start in range(0, len(rows), self.batch_size):
+            batch = list(enumerate(rows[start:start + self.batch_size], start=start))
+            try:
+                yield from self._process_batch(batch)
+            except InferenceOverloadedError:
+                yield {
+                    "index": start,
+                    "status": "error",
+                    "detail": (
+                        "El servicio de reconocimiento facial está saturado; la inscripción "
+                        f"se detuvo. Reanúdala desde la fila {start}."
+                    ),
+                }
+                return
+
+    def _process_batch(self, batch):
+        results = {}
+        pending = []
+        for index, row in batch:
+            try:
+                row = clean_row(row)
+                pending.append((index, row, self._load_row(row)))
+            except ValidationError as e:
+                results[index] = self._result(index, row, "error", detail=e.messages[0])
+
+        detections = self._embed([image_np for _, _, image_np in pending])
+
+        accepted = []
+        for (index, row, _), detection in zip(pending, detections):
+            if detection is None:
+                results[index] = self._result(
+                    index, row, "error", detail="No se detectó ningún rostro en la imagen."
+                )
+            else:
+                accepted.append((index, row, detection["embedding"].astype(np.float32)))
+
+        if accepted:
+            results.update(self._store(accepted))
+
+        for index, row in batch:
+            yield results[index]
+
+    def _load_row(self, row):
+        email, image_name = row["email"], row["image"]
+        if not email or not image_name:
+            raise ValidationError("Cada fila requiere 'email' e 'image'.")
+        try:
+            validate_email(email)
+        except ValidationError:
+            raise ValidationError("El email no es válido.")
+        if email in self._seen_emails:
+            raise ValidationError("El email está repetido en el manifiesto.")
+        self._seen_emails.add(email)
+
+        existing = self._existing.get(email)
+        if existing and not existing.deleted and not self.force_register:
+            raise ValidationError("El email ya está registrado para esta aplicación.")
+
+        try:
+            info = self.archive.getinfo(image_name)
+        except KeyError:
+            raise ValidationError(f"La imagen '{image_name}' no está en el archivo.")
+        # Comprobamos el tamaño declarado antes de descomprimir
+        if info.file_size > settings.FACE_IMAGE_MAX_BYTES:
+            raise ValidationError("La imagen supera el tamaño máximo permitido.")
+
+        try:
+            return _bytes_to_array(self.archive.read(info))
+        except ImageRejectedError:
+            raise
+        except Exception:
+            raise ValidationError("El archivo de la imagen no es una imagen válida.")
+
+    def _embed(self, images_np):
+        if not images_np:
+            return []
+        # Un lote ocupa un solo turno de inferencia; si el servicio está saturado
+        # esperamos en lugar de competir con los logins interactivos, pero como
+        # mucho FACE_BULK_ENROLL_MAX_WAIT segundos por lote.
+        give_up_at = time.monotonic() + settings.FACE_BULK_ENROLL_MAX_WAIT
+        while True:
+            try:
+                with inference_admission.admit(jobs=len(images_np)):
+                    return _compute_embedding_batch(images_np)
+            except InferenceOverloadedError as e:
+                if time.monotonic() + e.wait > give_up_at:
+                    raise
+                time.sleep(e.wait)
+
+    def _store(self, accepted):
+        """Descarta duplicados faciales con un producto de matrices y guarda el lote."""
+        threshold = self.app.CONFIDENCE_THRESHOLD
+        embeddings = np.stack([embedding for _, _, embedding in accepted])
+        batch = _normalize(embeddings)
+
+        # Distancias coseno contra la galería y el propio lote en una sola operación
+        reference = batch if self._gallery is None else np.vstack([self._gallery, batch])
+        distances = 1.0 - batch @ reference.T
+        offset = 0 if self._gallery is None else len(self._gallery)
+
+        results = {}
+        to_create, to_update, kept = [], [], []
+        for position, (index, row, embedding) in enumerate(accepted):
+            if not self.force_register:
+                gallery_hit = offset > 0 and distances[position, :offset].min() < threshold
+                # Dentro del lote solo cuentan los elementos anteriores ya aceptados
+                batch_hit = any(distances[position, offset + k] < threshold for k in kept)
+                if gallery_hit or batch_hit:
+                    results[index] = self._result(
+                        index, row, "duplicate",
+                        detail="Este rostro ya está registrado para esta aplicación.",
+                    )
+                    continue
+            kept.append(position)
+
+            fields = {
+                "full_name": row["full_name"],
+                "role": row["role"],
+                "password": row["password"],
+                "face_encoding": embedding.tobytes(),
+                "embedding_model_version": current_model_version(),
+            }
+            existing = self._existing.get(row["email"])
+            if existing:
+                # Reactivamos (o, con force_register, actualizamos) el usuario existente
+                for name, value in fields.items():
+                    setattr(existing, name, value)
+                existing.deleted = False
+                to_update.append((index, row, existing))
+            else:
+                to_create.append(
+                    (index, row, EndUser(app=self.app, email=row["email"], **fields))
+                )
+
+        with transaction.atomic():
+            created = EndUser.objects.bulk_create([user for _, _, user in to_create])
+            EndUser.objects.bulk_update(
+                [user for _, _, user in to_update],
+                [
+                    "full_name",
+                    "role",
+                    "password",
+                    "face_encoding",
+                    "embedding_model_version",
+                    "deleted",
+                ],
+            )
+            # bulk_create/bulk_update no emiten señales: invalidamos la galería una vez por lote
+            bump_gallery(app_scope(self.app.id))
+
+        for (index, row, _), user in zip(to_create, created):
+            results[index] = self._result(index, row, "created", user_id=user.id)
+        for index, row, user in to_update:
+            results[index] = self._result(index, row, "updated", user_id=user.id)
+
+        if kept:
+            added = batch[kept]
+            self._gallery = added if self._gallery is None else np.vstack([self._gallery, added])
+        return results
+
+    @staticmethod
+    def _result(index, row, status, detail=None, user_id=None):
+        result = {"index": index, "email": row.get("email"), "status": status}
+        if user_id is not None:
+            result["id"] = user_id
+        if detail:
+            result["detail"] = detail
+        return result
@@ -0,0 +1,132 @@
+"""
+Calibración de CONFIDENCE_THRESHOLD con el histórico de intentos con feedback.
+
+Un intento es genuino si el usuario que lo confirmó ("correcto") es su mejor
+coincidencia: `best_match_distance` es entonces la distancia a su propio rostro.
+Son impostores los rechazados ("incorrecto") y los confirmados por otro usuario,
+porque su distancia es la de un rostro ajeno. Los confirmados sin coincidencia no
+tienen distancia que evaluar y se descartan. Para cada umbral candidato:
+
+- FAR: fracción de impostores que se habrían aceptado directamente.
+- FRR: fracción de genuinos que no se habrían aceptado directamente.
+- success / ambiguous / no_match: cómo se habrían repartido los intentos.
+
+Como la búsqueda en la galería solo devuelve coincidencias dentro del umbral de
+fallback, un intento se acepta si su distancia es <= min(umbral, fallback). Toda
+la rejilla se evalúa de una vez con `searchsorted` sobre las distancias ordenadas.
+"""
+import numpy as np
+from django.db.models import BooleanField, ExpressionWrapper, F, Q
+
+from .attempt_metrics import COUNTERS
+
+MAX_GRID_POINTS = 1000
+
+CONFIRMED = COUNTERS["confirmed_correct_by_feedback"]
+GENUINE = CONFIRMED & Q(confirmed_by_feedback=F("best_match_user"))
+IMPOSTOR = COUNTERS["rejected_incorrect_by_feedback"] | (
+    CONFIRMED
+    & Q(best_match_user__isnull=False)
+    & ~Q(confirmed_by_feedback=F("best_match_user"))
+)
+
+
+def threshold_grid(start: float, stop: float, step: float) -> np.ndarray:
+    """Umbrales de `start` a `stop` (incluido) cada `step`."""
+    if step <= 0:
+        raise ValueError("El paso debe ser mayor que 0.")
+    if start > stop:
+        raise ValueError("El umbral inicial no puede ser mayor que el final.")
+    points = int(round((stop - start) / step)) + 1
+    if points > MAX_GRID_POINTS:
+        raise ValueError(f"La rejilla no puede tener más de {MAX_GRID_POINTS} umbrales.")
+    return np.round(start + step * np.arange(points), 6)
+
+
+def load_labeled(queryset):
+    """
+    Devuelve (distancias, genuinos) de los intentos etiquetados del queryset.
+    Los intentos sin distancia (sin coincidencia) cuentan como distancia infinita.
+    """
+    rows = list(
+        queryset.filter(GENUINE | IMPOSTOR)
+        .annotate(genuine=ExpressionWrapper(GENUINE, output_field=BooleanField()))
+        .values_list("best_match_distance", "genuine")
+    )
+    distances = np.fromiter(
+        (np.inf if distance is None else distance for distance, _ in rows),
+        dtype=np.float64,
+        count=len(rows),
+    )
+    genuine = np.fromiter((bool(label) for _, label in rows), dtype=bool, count=len(rows))
+    return distances, genuine
+
+
+def _accepted(sorted_distances, limits):
+    return np.searchsorted(sorted_distances, limits, side="right")
+
+
+def _rates(part, total):
+    if total == 0:
+        return [None] * len(part)
+    return np.round(part / total, 4).tolist()
+
+
+def evaluate(distances, genuine, grid, fallback: float) -> dict:
+    """Evalúa todos los umbrales de `grid` a la vez. Devuelve listas alineadas con `grid`."""
+    limits = np.minimum(grid, fallback)
+    everyone = np.sort(distances)
+    genuine_distances = np.sort(distances[genuine])
+    impostor_distances = np.sort(distances[~genuine])
+
+    success = _accepted(everyone, limits)
+    within_fallback = _accepted(everyone, fallback)
+    accepted_genuine = _accepted(genuine_distances, limits)
+    accepted_impostor = _accepted(impostor_distances, limits)
+
+    return {
+        "threshold": grid.tolist(),
+        "far": _rates(accepted_impostor, len(impostor_distances)),
+        "frr": _rates(len(genuine_distances) - accepted_genuine, len(genuine_distances)),
+        "success": success.tolist(),
+        "ambiguous": (within_fallback - success).tolist(),
+        "no_match": np.full_like(success, len(everyone) - within_fallback).tolist(),
+    }
+
+
+def _rows(columns) -> list:
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+
+def calibrate(app, start=0.05, stop=0.5, step=0.01, fallback=None, max_far=0.01) -> dict:
+    """
+    Calibra los umbrales de `app` con sus intentos con feedback. Recomienda el
+    mayor umbral de la rejilla (sin pasar del fallback) con FAR <= `max_far`.
+    """
+    grid = threshold_grid(start, stop, step)
+    fallback = app.FALLBACK_THRESHOLD if fallback is None else fallback
+    distances, genuine = load_labeled(app.login_attempts.all())
+
+    table = evaluate(distances, genuine, grid, fallback)
+    current = evaluate(distances, genuine, np.array([app.CONFIDENCE_THRESHOLD]), fallback)
+
+    recommended = None
+    if len(distances[~genuine]):
+        # Por encima del fallback todos los umbrales se comportan igual
+        allowed = (np.asarray(table["far"]) <= max_far) & (grid <= fallback)
+        if allowed.any():
+            recommended = float(grid[np.flatnonzero(allowed)[-1]])
+
+    return {
+        "labeled_attempts": {
+            "genuine": int(genuine.sum()),
+            "impostor": int((~genuine).sum()),
+        },
+        "confidence_threshold": app.CONFIDENCE_THRESHOLD,
+        "fallback_threshold": fallback,
+        "current": _rows(current)[0],
+        "max_far": max_far,
+        "recommended_threshold": recommended,
+        "thresholds": _rows(table),
+    }
@@ -0,0 +1,57 @@
+"""
+Baja, restauración y borrado definitivo de EndUsers en bloque.
+
+La baja y la restauración son un único UPDATE. El borrado definitivo va por
+lotes, porque cada EndUser arrastra su feedback (y sus imágenes), y sus
+intentos de login pasan a NULL. En todos los casos la galería de la app se
+invalida una sola vez por llamada.
+"""
+from django.db import transaction
+
+from facial_auth_app.gallery import app_scope, bump_gallery, deferred_bumps
+
+from .models import EndUser
+
+PURGE_CHUNK_SIZE = 200
+
+
+def select_end_users(app, ids=None, role=None, email=None):
+    """EndUsers de la app que cumplen todos los criterios indicados."""
+    end_users = app.end_users.all()
+    if ids:
+        end_users = end_users.filter(id__in=ids)
+    if role:
+        end_users = end_users.filter(role=role)
+    if email:
+        end_users = end_users.filter(email__istartswith=email)
+    return end_users
+
+
+def soft_delete(app, end_users) -> int:
+    count = end_users.filter(deleted=False).update(deleted=True)
+    if count:
+        bump_gallery(app_scope(app.id))
+    return count
+
+
+def restore(app, end_users) -> int:
+    count = end_users.filter(deleted=True).update(deleted=False)
+    if count:
+        bump_gallery(app_scope(app.id))
+    return count
+
+
+def purge(app, end_users, chunk_size=PURGE_CHUNK_SIZE) -> int:
+    """Borra definitivamente los EndUsers ya dados de baja de la selección."""
+    end_users = end_users.filter(deleted=True)
+    total = 0
+    # delete() emite post_delete por fila; la galería se invalida una vez al final
+    with deferred_bumps():
+        while True:
+            ids = list(end_users.values_list("id", flat=True)[:chunk_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                EndUser.objects.filter(id__in=ids).delete()
+            total += len(ids)
+    return total
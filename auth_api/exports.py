@@ -0,0 +1,113 @@
+"""
+Exportación en streaming (CSV o NDJSON) de los intentos de login y los EndUsers
+de una app.
+
+Las filas se leen con `.values(...).iterator(chunk_size=...)` (o `aiterator`
+bajo ASGI; cursor del lado del servidor en PostgreSQL) y se escriben a medida
+que llegan, así que la memoria no depende del número de filas exportadas.
+"""
+import csv
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+LOGIN_ATTEMPT_FIELDS = [
+    "id",
+    "timestamp",
+    "initial_status",
+    "attempting_end_user_id",
+    "best_match_user_id",
+    "best_match_distance",
+    "embedding_model_version",
+    "user_feedback",
+    "is_verified_and_correct",
+    "confirmed_by_feedback_id",
+]
+
+END_USER_FIELDS = [
+    "id",
+    "email",
+    "full_name",
+    "role",
+    "embedding_model_version",
+    "created_at",
+]
+
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+# Una celda que empieza así se interpreta como fórmula al abrir el CSV en una hoja
+# de cálculo; los datos vienen de los usuarios finales
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+class _Echo:
+    """Pseudo-archivo para csv.writer: devuelve la línea en vez de guardarla."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _formatter(fmt: str, fields):
+    """Devuelve (cabecera o None, función que convierte una fila en una línea)."""
+    if fmt == "csv":
+        writer = csv.writer(_Echo())
+        return writer.writerow(fields), lambda row: writer.writerow(
+            [_csv_value(row[field]) for field in fields]
+        )
+    return None, lambda row: json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+def _lines(rows, header, format_row):
+    if header:
+        yield header
+    for row in rows:
+        yield format_row(row)
+
+
+async def _alines(rows, header, format_row):
+    if header:
+        yield header
+    async for row in rows:
+        yield format_row(row)
+
+
+def is_asgi(request) -> bool:
+    return isinstance(getattr(request, "_request", request), ASGIRequest)
+
+
+def export_response(
+    queryset, fields, fmt: str, filename: str, asynchronous=False
+) -> StreamingHttpResponse:
+    """
+    Respuesta que va enviando las filas de `queryset` en el formato `fmt`. Bajo
+    ASGI (`asynchronous=True`) el contenido tiene que ser un iterador asíncrono:
+    Django 4.2 acumula en memoria los iteradores síncronos antes de enviarlos.
+    """
+    rows = queryset.values(*fields)
+    chunk_size = settings.FACE_EXPORT_CHUNK_SIZE
+    header, format_row = _formatter(fmt, fields)
+    if asynchronous:
+        lines = _alines(rows.aiterator(chunk_size=chunk_size), header, format_row)
+    else:
+        lines = _lines(rows.iterator(chunk_size=chunk_size), header, format_row)
+    response = StreamingHttpResponse(lines, content_type=CONTENT_TYPES[fmt])
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{fmt}"'
+    return response
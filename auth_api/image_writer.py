@@ -0,0 +1,135 @@
+"""
+Escritura diferida de las imágenes de los intentos de login.
+
+El intento se inserta con el nombre definitivo de su imagen ya asignado y la
+subida al storage se encola para hilos en segundo plano, así la latencia del
+storage no se suma al login: la inferencia trabaja con los bytes en memoria.
+La cola es acotada (FACE_IMAGE_WRITER_QUEUE); si está llena, la imagen se
+escribe en la propia petición. Cada escritura se reintenta con espera
+exponencial y, si falla definitivamente, se borra la referencia del intento.
+Con FACE_IMAGE_WRITER_THREADS = 0 las imágenes se escriben en la petición.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+
+from facial_auth_app import metrics
+from facial_auth_app.stored_images import encode_for_storage, storage_extension
+
+logger = logging.getLogger(__name__)
+
+
+def assign_pending_image(instance, field_name: str) -> str:
+    """
+    Asigna al campo de imagen un nombre único y definitivo sin subir nada todavía.
+    La instancia se guarda después con la referencia pendiente de escritura.
+    """
+    field = instance._meta.get_field(field_name)
+    name = field.generate_filename(instance, f"{uuid.uuid4().hex}{storage_extension()}")
+    setattr(instance, field_name, name)
+    return name
+
+
+class ImageWriter:
+    def __init__(self):
+        self._queue = None
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def write_later(self, instance, field_name: str, content: bytes) -> None:
+        """Programa la escritura de `content` en la referencia ya asignada de la instancia."""
+        job = (type(instance), instance.pk, field_name, getattr(instance, field_name).name, content)
+        # Se encola al confirmar la transacción para que el hilo vea la fila
+        transaction.on_commit(lambda: self._submit(job))
+
+    def _submit(self, job) -> None:
+        if settings.FACE_IMAGE_WRITER_THREADS <= 0:
+            self._write_with_retry(job)
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            # Contrapresión: si el storage no da abasto, la petición paga la escritura
+            metrics.incr("image_writer.sync_fallback")
+            self._write_with_retry(job)
+
+    def _ensure_started(self) -> None:
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            self._queue = queue.Queue(maxsize=settings.FACE_IMAGE_WRITER_QUEUE)
+            for i in range(settings.FACE_IMAGE_WRITER_THREADS):
+                thread = threading.Thread(
+                    target=self._run, name=f"image-writer-{i}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+            atexit.register(self.flush, timeout=settings.FACE_IMAGE_WRITER_FLUSH_TIMEOUT)
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                self._write_with_retry(job)
+            finally:
+                self._queue.task_done()
+                close_old_connections()
+
+    def _write_with_retry(self, job) -> None:
+        model, pk, field_name, name, _ = job
+        retries = settings.FACE_IMAGE_WRITER_RETRIES
+        for attempt in range(retries + 1):
+            try:
+                self._write(job)
+                return
+            except Exception:
+                if attempt == retries:
+                    logger.exception("No se pudo escribir la imagen %s", name)
+                    break
+                metrics.incr("image_writer.retried")
+                time.sleep(0.5 * 2**attempt)
+
+        metrics.incr("image_writer.failed")
+        # La referencia apunta a un archivo que nunca existirá
+        model.objects.filter(pk=pk).update(**{field_name: ""})
+
+    def _write(self, job) -> None:
+        model, pk, field_name, name, content = job
+        rows = model.objects.filter(pk=pk)
+        if not rows.exists():
+            # El intento se descartó (p. ej. 503 por saturación) antes de escribirse
+            return
+
+        storage = model._meta.get_field(field_name).storage
+        # Se guarda la copia re-codificada, igual que al asignar el archivo al campo
+        saved_name = storage.save(name, ContentFile(encode_for_storage(content, model)))
+        if saved_name != name:
+            rows.update(**{field_name: saved_name})
+        if not rows.exists():
+            storage.delete(saved_name)
+            return
+        metrics.incr("image_writer.written")
+
+    def flush(self, timeout=None) -> bool:
+        """Espera a que se vacíe la cola. Devuelve False si se agotó el tiempo."""
+        if self._queue is None:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+
+image_writer = ImageWriter()
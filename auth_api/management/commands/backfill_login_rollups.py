@@ -0,0 +1,118 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Case, CharField, Count, F, IntegerField, Min, Q, Value, When
+from django.db.models.functions import Cast, Coalesce, Floor, TruncHour
+from django.utils import timezone
+
+from auth_api.models import CustomUserLoginAttempt, EndUserLoginAttempt, LoginAttemptRollup
+from auth_api.rollups import DISTANCE_BUCKET_WIDTH, app_scope, apply, truncate_hour, user_scope
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula LoginAttemptRollup a partir de los intentos de login guardados, "
+        "día a día y por ámbito. Solo reemplaza las horas en las que todavía hay "
+        "intentos, así no borra el histórico de los intentos ya purgados. La hora en "
+        "curso no se toca: la mantiene el conteo incremental."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="Fecha inicial (YYYY-MM-DD, UTC).")
+        parser.add_argument("--app", type=int, help="Procesa solo la ClientApp con este ID.")
+        parser.add_argument(
+            "--only", choices=("endusers", "customusers"), help="Procesa solo un tipo de intento."
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options["since"]:
+            try:
+                since = datetime.strptime(options["since"], "%Y-%m-%d").replace(
+                    tzinfo=dt_timezone.utc
+                )
+            except ValueError:
+                raise CommandError("--since debe tener el formato YYYY-MM-DD.")
+        self.since = since
+        self.until = truncate_hour(timezone.now())
+
+        if options["only"] in (None, "endusers"):
+            attempts = EndUserLoginAttempt.objects.all()
+            if options["app"] is not None:
+                attempts = attempts.filter(app_id=options["app"])
+            self._backfill(attempts, "app_id", app_scope)
+        if options["only"] in (None, "customusers") and options["app"] is None:
+            self._backfill(CustomUserLoginAttempt.objects.all(), "user_id", user_scope)
+
+    def _backfill(self, attempts, owner_field, scope_for):
+        # Cada ámbito empieza en su intento más antiguo: lo anterior ya se purgó
+        starts = attempts.values(owner_field).annotate(first=Min("timestamp"))
+        for row in starts.iterator():
+            owner_id, start = row[owner_field], truncate_hour(row["first"])
+            if self.since and start < self.since:
+                start = self.since
+            scope = scope_for(owner_id)
+            owned = attempts.filter(**{owner_field: owner_id})
+
+            total = 0
+            day = start
+            while day < self.until:
+                end = min(day + timedelta(days=1), self.until)
+                total += self._replace_range(owned, scope, day, end)
+                day = end
+            self.stdout.write(f"{scope}: {total} intentos contados.")
+        self.stdout.write(self.style.SUCCESS("Rollups recalculados."))
+
+    def _replace_range(self, attempts, scope, start, end):
+        grouped = (
+            attempts.filter(timestamp__gte=start, timestamp__lt=end)
+            .annotate(
+                rollup_hour=TruncHour("timestamp", tzinfo=dt_timezone.utc),
+                outcome=Case(
+                    When(Q(user_feedback__isnull=True) | Q(user_feedback=""), then=Value("none")),
+                    When(
+                        user_feedback="correcto",
+                        is_verified_and_correct=True,
+                        then=Value("confirmed"),
+                    ),
+                    When(
+                        user_feedback="incorrecto",
+                        is_verified_and_correct=False,
+                        then=Value("rejected"),
+                    ),
+                    default=Value("other"),
+                    output_field=CharField(),
+                ),
+                bucket=Coalesce(
+                    Cast(
+                        Floor(F("best_match_distance") / Value(DISTANCE_BUCKET_WIDTH)),
+                        IntegerField(),
+                    ),
+                    Value(-1),
+                ),
+            )
+            .values("rollup_hour", "initial_status", "outcome", "bucket")
+            .annotate(n=Count("pk"))
+            .order_by()
+        )
+        in_range = LoginAttemptRollup.objects.filter(scope=scope, hour__gte=start, hour__lt=end)
+        with transaction.atomic():
+            # Las filas bloqueadas hacen esperar a los `apply` concurrentes, que suman
+            # su delta después; las filas nuevas se crean con el mismo `apply`, así que
+            # un login simultáneo nunca pierde su incremento ni choca con la clave única
+            current = Counter()
+            for rollup in in_range.select_for_update():
+                key = (scope, rollup.hour, rollup.initial_status, rollup.feedback_outcome)
+                current[key + (rollup.distance_bucket,)] = rollup.count
+            counted = Counter()
+            for row in grouped:
+                key = (scope, row["rollup_hour"], row["initial_status"], row["outcome"])
+                counted[key + (row["bucket"],)] = row["n"]
+            deltas = Counter(counted)
+            deltas.subtract(current)
+            apply(deltas)
+            in_range.filter(count=0).delete()
+        return sum(counted.values())
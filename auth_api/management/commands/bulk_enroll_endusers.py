@@ -0,0 +1,55 @@
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from auth_api.bulk_enrollment import BulkEnrollment, open_archive
+from auth_api.models import ClientApp
+
+
+class Command(BaseCommand):
+    help = (
+        "Inscribe EndUsers en una app a partir de un ZIP con imágenes y un "
+        "manifest.csv/manifest.json. Escribe un resultado NDJSON por fila."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("app", help="ID o token de la ClientApp.")
+        parser.add_argument("archive", help="Ruta del ZIP con las imágenes y el manifiesto.")
+        parser.add_argument(
+            "--force-register",
+            action="store_true",
+            help="Actualiza los emails existentes y omite la comprobación de rostros duplicados.",
+        )
+        parser.add_argument("--batch-size", type=int, help="Imágenes por lote de inferencia.")
+
+    def handle(self, *args, **options):
+        app_ref = options["app"]
+        lookup = {"id": int(app_ref)} if app_ref.isdigit() else {"token": app_ref}
+        try:
+            app = ClientApp.objects.get(**lookup)
+        except ClientApp.DoesNotExist:
+            raise CommandError(f"No existe la app '{app_ref}'.")
+
+        if options["batch_size"] is not None and options["batch_size"] < 1:
+            raise CommandError("--batch-size debe ser mayor que 0.")
+
+        with open(options["archive"], "rb") as f:
+            try:
+                archive, rows = open_archive(f)
+            except ValidationError as e:
+                raise CommandError(e.messages[0])
+
+            enrollment = BulkEnrollment(
+                app,
+                archive,
+                force_register=options["force_register"],
+                batch_size=options["batch_size"],
+            )
+            counts = {}
+            for result in enrollment.run(rows):
+                counts[result["status"]] = counts.get(result["status"], 0) + 1
+                self.stdout.write(json.dumps(result, ensure_ascii=False))
+
+        summary = ", ".join(f"{status}: {count}" for status, count in sorted(counts.items()))
+        self.stderr.write(self.style.SUCCESS(f"Inscripción terminada ({summary})."))
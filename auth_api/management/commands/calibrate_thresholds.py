@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from auth_api.calibration import calibrate
+from auth_api.models import ClientApp
+
+
+def _percent(rate):
+    return "N/A" if rate is None else f"{rate * 100:.2f}%"
+
+
+def _format_row(row):
+    return (
+        f"{row['threshold']:>6.3f} {_percent(row['far']):>8} {_percent(row['frr']):>8} "
+        f"{row['success']:>8} {row['ambiguous']:>10} {row['no_match']:>9}"
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Calcula FAR/FRR y el reparto success/ambiguous/no_match de una rejilla de "
+        "umbrales con los intentos con feedback de una ClientApp. No modifica la app."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("app", type=int, help="ID de la ClientApp.")
+        parser.add_argument("--start", type=float, default=0.05, help="Primer umbral.")
+        parser.add_argument("--stop", type=float, default=0.5, help="Último umbral.")
+        parser.add_argument("--step", type=float, default=0.01, help="Paso de la rejilla.")
+        parser.add_argument(
+            "--fallback", type=float, help="Umbral de fallback (por defecto, el de la app)."
+        )
+        parser.add_argument(
+            "--max-far", type=float, default=0.01, help="FAR máximo para la recomendación."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            app = ClientApp.objects.get(id=options["app"])
+        except ClientApp.DoesNotExist:
+            raise CommandError(f"No existe la ClientApp {options['app']}.")
+
+        try:
+            report = calibrate(
+                app,
+                start=options["start"],
+                stop=options["stop"],
+                step=options["step"],
+                fallback=options["fallback"],
+                max_far=options["max_far"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        labeled = report["labeled_attempts"]
+        self.stdout.write(
+            f"{app.name}: {labeled['genuine']} genuinos, {labeled['impostor']} impostores "
+            f"(fallback {report['fallback_threshold']})."
+        )
+        self.stdout.write("umbral      FAR      FRR  success  ambiguous  no_match")
+        for row in report["thresholds"]:
+            self.stdout.write(_format_row(row))
+        self.stdout.write(f"Actual:\n{_format_row(report['current'])}")
+        if report["recommended_threshold"] is None:
+            self.stdout.write(
+                "Sin recomendación: no hay impostores etiquetados o ningún umbral cumple el FAR."
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Umbral recomendado (FAR <= {_percent(report['max_far'])}): "
+                    f"{report['recommended_threshold']} (actual: {report['confidence_threshold']})."
+                )
+            )
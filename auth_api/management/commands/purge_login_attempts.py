@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from auth_api.retention import expired_attempts, purge
+
+
+class Command(BaseCommand):
+    help = (
+        "Elimina los intentos de login facial vencidos según la retención de cada "
+        "ClientApp y FACE_CUSTOMUSER_ATTEMPT_RETENTION_DAYS, junto con sus imágenes. "
+        "Trabaja por lotes, así que puede interrumpirse y relanzarse."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--images-only",
+            action="store_true",
+            help="Conserva las filas (y las métricas) y solo elimina las imágenes.",
+        )
+        parser.add_argument("--app", type=int, help="Procesa solo la ClientApp con este ID.")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Filas por lote.")
+        parser.add_argument(
+            "--sleep", type=float, default=0.0, help="Segundos de pausa entre lotes."
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Solo cuenta lo que se eliminaría."
+        )
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size debe ser mayor que 0.")
+
+        for label, queryset in expired_attempts(options["app"]):
+            if options["dry_run"]:
+                self.stdout.write(f"{label}: {queryset.count()} intentos vencidos.")
+                continue
+
+            rows, files = purge(
+                queryset,
+                images_only=options["images_only"],
+                chunk_size=options["chunk_size"],
+                sleep=options["sleep"],
+            )
+            action = "sin imagen" if options["images_only"] else "eliminados"
+            self.stdout.write(
+                self.style.SUCCESS(f"{label}: {rows} intentos {action}, {files} imágenes borradas.")
+            )
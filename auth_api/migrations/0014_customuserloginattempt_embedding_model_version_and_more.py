@@ -0,0 +1,24 @@
+# Generated by Django 4.2.23 on 2026-10-18 23:53
+
+from django.db import migrations, models
+import facial_auth_app.model_versions
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_api', '0013_enduser_embedding_model_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuserloginattempt',
+            name='embedding_model_version',
+            field=models.CharField(default=facial_auth_app.model_versions.current_model_version, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='enduserloginattempt',
+            name='embedding_model_version',
+            field=models.CharField(default=facial_auth_app.model_versions.current_model_version, max_length=32),
+        ),
+    ]
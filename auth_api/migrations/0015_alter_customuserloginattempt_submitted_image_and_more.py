@@ -0,0 +1,29 @@
+# Generated by Django 4.2.23 on 2026-10-19 00:07
+
+from django.db import migrations
+import facial_auth_app.stored_images
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_api', '0014_customuserloginattempt_embedding_model_version_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuserloginattempt',
+            name='submitted_image',
+            field=facial_auth_app.stored_images.StoredFaceImageField(blank=True, null=True, upload_to='customuser_login_attempts_images/'),
+        ),
+        migrations.AlterField(
+            model_name='enduserfeedback',
+            name='submitted_image',
+            field=facial_auth_app.stored_images.StoredFaceImageField(upload_to='enduser_feedback_images/'),
+        ),
+        migrations.AlterField(
+            model_name='enduserloginattempt',
+            name='submitted_image',
+            field=facial_auth_app.stored_images.StoredFaceImageField(blank=True, null=True, upload_to='login_attempts_images/'),
+        ),
+    ]
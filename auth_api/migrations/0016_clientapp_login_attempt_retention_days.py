@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-19 00:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_api', '0015_alter_customuserloginattempt_submitted_image_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clientapp',
+            name='login_attempt_retention_days',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
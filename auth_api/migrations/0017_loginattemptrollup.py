@@ -0,0 +1,28 @@
+# Generated by Django 4.2.23 on 2026-10-19 00:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_api', '0016_clientapp_login_attempt_retention_days'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoginAttemptRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=64)),
+                ('hour', models.DateTimeField()),
+                ('initial_status', models.CharField(max_length=20)),
+                ('feedback_outcome', models.CharField(choices=[('none', 'Sin feedback'), ('confirmed', 'Confirmado'), ('rejected', 'Rechazado'), ('other', 'Otro')], max_length=10)),
+                ('distance_bucket', models.SmallIntegerField(default=-1)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('scope', 'hour', 'initial_status', 'feedback_outcome', 'distance_bucket')},
+            },
+        ),
+    ]
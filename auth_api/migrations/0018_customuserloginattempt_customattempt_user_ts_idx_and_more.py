@@ -0,0 +1,29 @@
+# Generated by Django 4.2.23 on 2026-10-19 00:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_api', '0017_loginattemptrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customuserloginattempt',
+            index=models.Index(fields=['user', '-timestamp'], name='customattempt_user_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enduser',
+            index=models.Index(condition=models.Q(('deleted', False)), fields=['app', 'created_at', 'id'], name='enduser_app_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enduserloginattempt',
+            index=models.Index(fields=['app', '-timestamp'], name='enduserattempt_app_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enduserloginattempt',
+            index=models.Index(fields=['app', 'initial_status', '-timestamp'], name='enduserattempt_app_status_idx'),
+        ),
+    ]
@@ -3,6 +3,8 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 from django.conf import settings
+from facial_auth_app.model_versions import current_model_version
+from facial_auth_app.stored_images import StoredFaceImageField
 
 
 class CustomUser(AbstractUser):
@@ -31,6 +33,8 @@ class ClientApp(models.Model):
     token = models.CharField(max_length=40, unique=True, editable=False)
     CONFIDENCE_THRESHOLD = models.FloatField(default=0.18)
     FALLBACK_THRESHOLD = models.FloatField(default=0.25)
+    # Días que se conservan los intentos de login (y sus imágenes); vacío = sin límite
+    login_attempt_retention_days = models.PositiveIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def save(self, *args, **kwargs):
@@ -53,6 +57,9 @@ class EndUser(models.Model):
         max_length=128, blank=True
     )
     face_encoding = models.BinaryField()
+    embedding_model_version = models.CharField(
+        max_length=32, default=current_model_version
+    )
     deleted = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -61,6 +68,14 @@ class EndUser(models.Model):
             "app",
             "email",
         )
+        indexes = [
+            # Galería y listado paginado: solo usuarios activos, en orden de alta
+            models.Index(
+                fields=["app", "created_at", "id"],
+                condition=models.Q(deleted=False),
+                name="enduser_app_active_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.full_name} ({self.email}) - App: {self.app.name}"
@@ -74,7 +89,7 @@ class EndUserFeedback(models.Model):
     """
     end_user = models.ForeignKey(EndUser, on_delete=models.CASCADE, related_name="feedback_images")
     app = models.ForeignKey(ClientApp, on_delete=models.CASCADE, related_name="enduser_feedback")
-    submitted_image = models.ImageField(upload_to='enduser_feedback_images/')
+    submitted_image = StoredFaceImageField(upload_to='enduser_feedback_images/')
     timestamp = models.DateTimeField(auto_now_add=True)
     feedback_type = models.CharField(max_length=50, blank=True)
 
@@ -97,7 +112,7 @@ class EndUserLoginAttempt(models.Model):
         ClientApp, on_delete=models.CASCADE, related_name="login_attempts"
     )
     timestamp = models.DateTimeField(auto_now_add=True)
-    submitted_image = models.ImageField(
+    submitted_image = StoredFaceImageField(
         upload_to="login_attempts_images/", null=True, blank=True
     )
 
@@ -120,6 +135,10 @@ class EndUserLoginAttempt(models.Model):
         related_name="login_attempts_as_best_match",
     )
     best_match_distance = models.FloatField(null=True, blank=True)
+    # Versión del modelo con la que se obtuvo la mejor coincidencia
+    embedding_model_version = models.CharField(
+        max_length=32, default=current_model_version
+    )
 
     # Estado inicial del intento de login según el modelo
     STATUS_CHOICES = [
@@ -164,6 +183,13 @@ class EndUserLoginAttempt(models.Model):
         verbose_name = "Intento de Login de Usuario Final"
         verbose_name_plural = "Intentos de Login de Usuarios Finales"
         ordering = ["-timestamp"]
+        indexes = [
+            models.Index(fields=["app", "-timestamp"], name="enduserattempt_app_ts_idx"),
+            models.Index(
+                fields=["app", "initial_status", "-timestamp"],
+                name="enduserattempt_app_status_idx",
+            ),
+        ]
 
     def __str__(self):
         status_display = self.get_initial_status_display()
@@ -185,7 +211,7 @@ class CustomUserLoginAttempt(models.Model):
         blank=True,
     )
     timestamp = models.DateTimeField(auto_now_add=True)
-    submitted_image = models.ImageField(
+    submitted_image = StoredFaceImageField(
         upload_to="customuser_login_attempts_images/", null=True, blank=True
     )
 
@@ -198,6 +224,10 @@ class CustomUserLoginAttempt(models.Model):
         related_name="login_attempts_as_best_match_customuser",
     )
     best_match_distance = models.FloatField(null=True, blank=True)
+    # Versión del modelo con la que se obtuvo la mejor coincidencia
+    embedding_model_version = models.CharField(
+        max_length=32, default=current_model_version
+    )
 
     # Estado inicial del intento de login según el modelo
     STATUS_CHOICES = [
@@ -237,8 +267,46 @@ class CustomUserLoginAttempt(models.Model):
         verbose_name = "Intento de Login de Usuario del Sistema"
         verbose_name_plural = "Intentos de Login de Usuarios del Sistema"
         ordering = ["-timestamp"]
+        indexes = [
+            models.Index(fields=["user", "-timestamp"], name="customattempt_user_ts_idx"),
+        ]
 
     def __str__(self):
         status_display = self.get_initial_status_display()
         user_info = self.best_match_user.full_name if self.best_match_user else "N/A"
         return f"Intento de {status_display} por {user_info} ({self.timestamp.strftime('%Y-%m-%d %H:%M')})"
+
+
+class LoginAttemptRollup(models.Model):
+    """
+    Conteo de intentos de login por ámbito ("app:<id>" o "user:<id>"), hora,
+    estado inicial, resultado del feedback y tramo de distancia. Se mantiene al
+    registrar intentos y feedback (ver `auth_api.rollups`) y sobrevive a la purga
+    de los intentos.
+    """
+    OUTCOME_CHOICES = [
+        ("none", "Sin feedback"),
+        ("confirmed", "Confirmado"),
+        ("rejected", "Rechazado"),
+        ("other", "Otro"),
+    ]
+
+    scope = models.CharField(max_length=64)
+    hour = models.DateTimeField()
+    initial_status = models.CharField(max_length=20)
+    feedback_outcome = models.CharField(max_length=10, choices=OUTCOME_CHOICES)
+    # Tramo de best_match_distance (ver rollups.DISTANCE_BUCKET_WIDTH); -1 sin distancia
+    distance_bucket = models.SmallIntegerField(default=-1)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = (
+            "scope",
+            "hour",
+            "initial_status",
+            "feedback_outcome",
+            "distance_bucket",
+        )
+
+    def __str__(self):
+        return f"{self.scope} {self.hour:%Y-%m-%d %H:00} {self.initial_status}: {self.count}"
@@ -0,0 +1,46 @@
+"""
+Paginación por cursor (keyset) sobre (created_at, id).
+
+A diferencia de OFFSET, cada página es una consulta por índice que empieza
+justo después de la última fila devuelta, así que el coste no crece con el
+número de página y no se saltan ni repiten filas aunque se inserten otras.
+El cursor es opaco para el cliente: base64 de "<created_at ISO>|<id>".
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+
+
+def encode_cursor(obj) -> str:
+    raw = f"{obj.created_at.isoformat()}|{obj.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """Devuelve (created_at, id) del cursor. Lanza ValueError si no es válido."""
+    try:
+        created_at, obj_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(obj_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Cursor inválido.")
+
+
+def keyset_page(queryset, cursor, page_size: int):
+    """
+    Devuelve (filas, cursor_siguiente) de la página que sigue a `cursor`
+    (la primera si es None). `cursor_siguiente` es None en la última página.
+    """
+    queryset = queryset.order_by("created_at", "id")
+    if cursor:
+        created_at, obj_id = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=obj_id)
+        )
+    # Una fila de más indica si hay página siguiente sin un COUNT aparte
+    rows = list(queryset[: page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    return rows, encode_cursor(rows[-1])
@@ -0,0 +1,76 @@
+"""
+Retención de los intentos de login facial.
+
+Cada ClientApp define cuántos días conserva los intentos de sus EndUser
+(`login_attempt_retention_days`) y FACE_CUSTOMUSER_ATTEMPT_RETENTION_DAYS fija la
+de los CustomUser. `purge` borra las filas vencidas, o solo sus imágenes, en
+lotes acotados para no bloquear las tablas ni saturar el storage.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from facial_auth_app.stored_images import release_file
+
+from .models import ClientApp, CustomUserLoginAttempt, EndUserLoginAttempt
+
+
+def expired_attempts(app_id=None):
+    """Devuelve [(etiqueta, queryset)] con los intentos vencidos de cada política."""
+    now = timezone.now()
+    policies = []
+
+    apps = ClientApp.objects.filter(login_attempt_retention_days__isnull=False)
+    if app_id is not None:
+        apps = apps.filter(id=app_id)
+    for app in apps.only("id", "name", "login_attempt_retention_days"):
+        cutoff = now - timedelta(days=app.login_attempt_retention_days)
+        policies.append(
+            (
+                f"app {app.id} ({app.name})",
+                EndUserLoginAttempt.objects.filter(app=app, timestamp__lt=cutoff),
+            )
+        )
+
+    days = settings.FACE_CUSTOMUSER_ATTEMPT_RETENTION_DAYS
+    if app_id is None and days > 0:
+        cutoff = now - timedelta(days=days)
+        policies.append(
+            ("customuser", CustomUserLoginAttempt.objects.filter(timestamp__lt=cutoff))
+        )
+    return policies
+
+
+def purge(queryset, images_only=False, chunk_size=500, sleep=0.0):
+    """
+    Borra los intentos del queryset por lotes de `chunk_size` filas, con una pausa
+    de `sleep` segundos entre lotes. Con `images_only` conserva las filas (y sus
+    columnas de métricas) y solo elimina las imágenes. Devuelve (filas, archivos).
+    """
+    if images_only:
+        queryset = queryset.exclude(submitted_image="").exclude(submitted_image__isnull=True)
+    storage = queryset.model._meta.get_field("submitted_image").storage
+
+    rows = files = 0
+    while True:
+        chunk = list(queryset.order_by("pk").values_list("pk", "submitted_image")[:chunk_size])
+        if not chunk:
+            break
+        pks = [pk for pk, _ in chunk]
+        names = [name for _, name in chunk if name]
+        if images_only:
+            queryset.model.objects.filter(pk__in=pks).update(submitted_image="")
+            # Los archivos se borran después de las filas: un fallo deja huérfanos,
+            # no referencias rotas
+            for name in names:
+                release_file(storage, name)
+        else:
+            # El campo libera la referencia a la imagen de cada fila borrada
+            queryset.model.objects.filter(pk__in=pks).delete()
+        files += len(names)
+        rows += len(chunk)
+        if sleep:
+            time.sleep(sleep)
+    return rows, files
@@ -0,0 +1,128 @@
+"""
+Mantenimiento incremental de `LoginAttemptRollup`.
+
+Cada intento suma 1 a la fila de su clave (ámbito, hora, estado inicial, resultado
+del feedback, tramo de distancia). Al guardar un intento ya contado, si su clave
+cambió (p. ej. llegó el feedback) se mueve el conteo de la clave anterior a la
+nueva. Las señales de `auth_api.signals` cubren los guardados normales;
+`attempt_log` llama a `track_created` tras sus `bulk_create`.
+"""
+import math
+from collections import Counter
+from datetime import timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import EndUserLoginAttempt, LoginAttemptRollup
+
+DISTANCE_BUCKET_WIDTH = 0.05
+
+
+def app_scope(app_id) -> str:
+    return f"app:{app_id}"
+
+
+def user_scope(user_id) -> str:
+    # Los intentos de CustomUser sin usuario identificado comparten "user:"
+    return f"user:{user_id or ''}"
+
+
+def truncate_hour(moment):
+    return moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def feedback_outcome(user_feedback, is_verified_and_correct) -> str:
+    if not user_feedback:
+        return "none"
+    if user_feedback == "correcto" and is_verified_and_correct:
+        return "confirmed"
+    if user_feedback == "incorrecto" and not is_verified_and_correct:
+        return "rejected"
+    return "other"
+
+
+def rollup_key(attempt):
+    """Clave de la fila de rollup del intento, o None si todavía no se insertó."""
+    if attempt.pk is None or attempt.timestamp is None:
+        return None
+    if isinstance(attempt, EndUserLoginAttempt):
+        scope = app_scope(attempt.app_id)
+    else:
+        scope = user_scope(attempt.user_id)
+    distance = attempt.best_match_distance
+    return (
+        scope,
+        truncate_hour(attempt.timestamp),
+        attempt.initial_status,
+        feedback_outcome(attempt.user_feedback, attempt.is_verified_and_correct),
+        -1 if distance is None else math.floor(distance / DISTANCE_BUCKET_WIDTH),
+    )
+
+
+def apply(deltas) -> None:
+    """Suma cada delta ({clave: n}) a su fila de rollup, creándola si no existe."""
+    for (scope, hour, initial_status, outcome, bucket), delta in deltas.items():
+        if not delta:
+            continue
+        lookup = {
+            "scope": scope,
+            "hour": hour,
+            "initial_status": initial_status,
+            "feedback_outcome": outcome,
+            "distance_bucket": bucket,
+        }
+        if LoginAttemptRollup.objects.filter(**lookup).update(count=F("count") + delta):
+            continue
+        try:
+            with transaction.atomic():
+                LoginAttemptRollup.objects.create(count=delta, **lookup)
+        except IntegrityError:
+            LoginAttemptRollup.objects.filter(**lookup).update(count=F("count") + delta)
+
+
+KEY_FIELDS = {
+    "app_id",
+    "user_id",
+    "timestamp",
+    "initial_status",
+    "user_feedback",
+    "is_verified_and_correct",
+    "best_match_distance",
+}
+UNKNOWN = object()
+
+
+def snapshot(attempt) -> None:
+    """Recuerda la clave con la que el intento está contado."""
+    if KEY_FIELDS & attempt.get_deferred_fields():
+        # Cargarlos aquí costaría una consulta por fila (p. ej. en listados con only())
+        attempt._rollup_key = UNKNOWN
+        return
+    attempt._rollup_key = rollup_key(attempt)
+
+
+def track_saved(attempt, created: bool) -> None:
+    previous = None if created else getattr(attempt, "_rollup_key", None)
+    if previous is UNKNOWN:
+        return
+    current = rollup_key(attempt)
+    if previous == current:
+        return
+    deltas = Counter()
+    if current is not None:
+        deltas[current] += 1
+    if previous is not None:
+        deltas[previous] -= 1
+    apply(deltas)
+    attempt._rollup_key = current
+
+
+def track_created(attempts) -> None:
+    """Cuenta intentos insertados con `bulk_create`, que no emite señales."""
+    deltas = Counter()
+    for attempt in attempts:
+        snapshot(attempt)
+        if attempt._rollup_key is not None:
+            deltas[attempt._rollup_key] += 1
+    apply(deltas)
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
@@ -7,17 +8,49 @@ from django.db import transaction
 from facial_auth_app.services import (
     FacialRecognitionService,
     FaceAlreadyRegisteredError,
-    _bytes_to_array,
-    _face_detect_and_align,
-    _preprocess_for_embedding,
-    embedding_model,
+    _embed_image_bytes,
 )
+from facial_auth_app.image_probe import ImageRejectedError, probe_upload
+from facial_auth_app.gallery import app_scope, galleries_for
+from facial_auth_app.model_versions import current_model_version
 from facial_auth_app.models import FacialRecognitionProfile
+from facial_auth_app.stored_images import attach_face_box
 from auth_api.models import ClientApp, EndUser, CustomUserLoginAttempt
+from auth_api.calibration import threshold_grid
+from auth_api.pagination import decode_cursor
 
 User = get_user_model()
 
 
+def _detect_face(serializer, face_image):
+    """
+    Devuelve la detección + embedding de la imagen. Las vistas async la calculan
+    antes en el executor de inferencia y la pasan en el contexto como "detection".
+    """
+    if "detection" in serializer.context:
+        return serializer.context["detection"]
+    return _embed_image_bytes(
+        face_image.read(), deadline=serializer.context.get("deadline")
+    )
+
+
+class FaceImageField(serializers.ImageField):
+    """
+    ImageField que comprueba tamaño y dimensiones leyendo solo la cabecera de la
+    imagen, antes de que DRF o el pipeline de inferencia la decodifiquen.
+    """
+
+    def to_internal_value(self, data):
+        try:
+            probe_upload(data)
+        except ImageRejectedError as e:
+            raise serializers.ValidationError(e.message)
+        except AttributeError:
+            # No es un archivo: ImageField devuelve el error habitual
+            pass
+        return super().to_internal_value(data)
+
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -43,7 +76,7 @@ class RegistrationSerializer(serializers.ModelSerializer):
     )
 
     password_conf = serializers.CharField(write_only=True)
-    face_image = serializers.ImageField(write_only=True)
+    face_image = FaceImageField(write_only=True)
     # Nuevo campo para forzar el registro
     force_register = serializers.BooleanField(default=False, write_only=True)
 
@@ -83,20 +116,20 @@ class RegistrationSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({"password": password_errors})
 
         face_image = data.get("face_image")
-        if face_image:
-            img_np = _bytes_to_array(face_image.read())
-            faces = _face_detect_and_align(img_np)
-            if not faces:
+        if not face_image:
+            raise serializers.ValidationError(
+                {"face_image": "Se requiere una imagen facial."}
+            )
+        # Las vistas async validan primero sin inferencia ("detection_pending")
+        if not self.context.get("detection_pending"):
+            detection = _detect_face(self, face_image)
+            if not detection:
                 raise serializers.ValidationError(
                     {
                         "face_image": "No se detectó ningún rostro en la imagen proporcionada."
                     }
                 )
             face_image.seek(0)
-        else:
-            raise serializers.ValidationError(
-                {"face_image": "Se requiere una imagen facial."}
-            )
 
         return data
 
@@ -124,23 +157,22 @@ class RegistrationSerializer(serializers.ModelSerializer):
             user.save()
 
             # Procesar la imagen para obtener el embedding
-            img_np = _bytes_to_array(face_image.read())
-            faces = _face_detect_and_align(img_np)
-            if not faces:
+            detection = _detect_face(self, face_image)
+            if not detection:
                 user.delete()  # Si no hay rostro, eliminar el usuario recién creado
                 raise serializers.ValidationError(
                     {
                         "face_image": "No se pudo procesar la imagen facial para el perfil."
                     }
                 )
-            processed_face_for_embedding = _preprocess_for_embedding(faces[0])
-            embedding = embedding_model(processed_face_for_embedding)[0].numpy()
+            embedding = detection["embedding"]
             encoding_bytes = embedding.tobytes()
 
             # Lógica de verificación de duplicados basada en force_register
             if not force_register:
+                # Solo se comparan embeddings del mismo modelo que la sonda
                 for existing_profile in FacialRecognitionProfile.objects.filter(
-                    is_active=True
+                    is_active=True, embedding_model_version=current_model_version()
                 ).exclude(
                     user=user
                 ):  # Excluir el usuario recién creado
@@ -157,7 +189,8 @@ class RegistrationSerializer(serializers.ModelSerializer):
                 user=user,
                 defaults={
                     "face_encoding": encoding_bytes,
-                    "face_image": face_image,
+                    "embedding_model_version": current_model_version(),
+                    "face_image": attach_face_box(face_image, detection),
                     "description": (
                         "Initial registration"
                         if not force_register
@@ -173,7 +206,7 @@ class RegistrationSerializer(serializers.ModelSerializer):
 
 
 class FaceLoginSerializer(serializers.Serializer):
-    face_image = serializers.ImageField()
+    face_image = FaceImageField()
 
 
 class FaceLoginFeedbackSerializer(serializers.Serializer):
@@ -182,7 +215,7 @@ class FaceLoginFeedbackSerializer(serializers.Serializer):
     """
     user_id = serializers.IntegerField(required=False)
     password = serializers.CharField(required=False)
-    face_image = serializers.ImageField(
+    face_image = FaceImageField(
         required=False
     )  # Puede ser opcional si solo se envía feedback negativo sin nueva imagen
     login_attempt_id = serializers.IntegerField(required=True)
@@ -235,6 +268,7 @@ class ClientAppSerializer(serializers.ModelSerializer):
             "token",
             "CONFIDENCE_THRESHOLD",
             "FALLBACK_THRESHOLD",
+            "login_attempt_retention_days",
             "created_at",
         ]
         read_only_fields = ["token", "created_at"]
@@ -257,7 +291,7 @@ class ClientAppSerializer(serializers.ModelSerializer):
 
 
 class EndUserRegistrationSerializer(serializers.ModelSerializer):
-    face_image = serializers.ImageField(write_only=True)
+    face_image = FaceImageField(write_only=True)
     force_register = serializers.BooleanField(default=False, write_only=True)
 
     class Meta:
@@ -271,6 +305,18 @@ class EndUserRegistrationSerializer(serializers.ModelSerializer):
             "force_register",
         ]
 
+    def validate(self, data):
+        # Se comprueba antes de la inferencia; create() lo repite por si hay carrera
+        app = self.context.get("app")
+        if (
+            not data.get("force_register")
+            and EndUser.objects.filter(app=app, email=data.get("email"), deleted=False).exists()
+        ):
+            raise serializers.ValidationError(
+                "El email ya está registrado para esta aplicación. Si deseas actualizar tu rostro, marca 'Forzar Registro'."
+            )
+        return data
+
     def create(self, validated_data):
         face_image = validated_data.pop("face_image")
         app = self.context.get("app")
@@ -279,16 +325,13 @@ class EndUserRegistrationSerializer(serializers.ModelSerializer):
             "force_register", False
         )  # Obtener y remover force_register
 
-        image_np = _bytes_to_array(face_image.read())
-
-        faces = _face_detect_and_align(image_np)
-        if not faces:
+        detection = _detect_face(self, face_image)
+        if not detection:
             raise serializers.ValidationError(
                 "No se detectó ningún rostro en la imagen."
             )
 
-        processed_face = _preprocess_for_embedding(faces[0])
-        embedding = embedding_model(processed_face)[0].numpy()
+        embedding = detection["embedding"]
         encoding_bytes = embedding.tobytes()
 
         existing = EndUser.objects.filter(app=app, email=email).first()
@@ -299,6 +342,7 @@ class EndUserRegistrationSerializer(serializers.ModelSerializer):
                 existing.full_name = validated_data.get("full_name")
                 existing.role = validated_data.get("role")
                 existing.face_encoding = encoding_bytes  # Actualizar encoding
+                existing.embedding_model_version = current_model_version()
                 existing.password = validated_data.get(
                     "password"
                 )  # O set_password si es hashed
@@ -315,6 +359,7 @@ class EndUserRegistrationSerializer(serializers.ModelSerializer):
                     existing.full_name = validated_data.get("full_name")
                     existing.role = validated_data.get("role")
                     existing.face_encoding = encoding_bytes  # Actualizar encoding
+                    existing.embedding_model_version = current_model_version()
                     existing.password = validated_data.get(
                         "password"
                     )
@@ -323,16 +368,11 @@ class EndUserRegistrationSerializer(serializers.ModelSerializer):
 
         # Verificar duplicidad facial solo si no se fuerza el registro y el usuario es nuevo
         if not force_register:
-            for end_user_in_app in app.end_users.filter(deleted=False):
-                match, _ = FacialRecognitionService.compare_faces(
-                    end_user_in_app.face_encoding,
-                    encoding_bytes,
-                    threshold=app.CONFIDENCE_THRESHOLD,
+            gallery = galleries_for(app_scope(app.id)).get(current_model_version())
+            if gallery is not None and gallery.search(embedding, app.CONFIDENCE_THRESHOLD):
+                raise FaceAlreadyRegisteredError(
+                    "Este rostro ya está registrado para esta aplicación. Si estás seguro de que no eres tú, marca 'Forzar Registro'."
                 )
-                if match:
-                    raise FaceAlreadyRegisteredError(
-                        "Este rostro ya está registrado para esta aplicación. Si estás seguro de que no eres tú, marca 'Forzar Registro'."
-                    )
 
         # Crear nuevo EndUser si no existe o si se forzó el registro y no había duplicado de email
         validated_data["face_encoding"] = encoding_bytes
@@ -340,6 +380,28 @@ class EndUserRegistrationSerializer(serializers.ModelSerializer):
         return EndUser.objects.create(**validated_data)
 
 
+class EndUserBulkRegistrationSerializer(serializers.Serializer):
+    """ZIP con las imágenes y el manifiesto para la inscripción masiva de EndUsers."""
+    archive = serializers.FileField()
+    force_register = serializers.BooleanField(default=False)
+
+
+class ThresholdCalibrationSerializer(serializers.Serializer):
+    """Rejilla de umbrales para calibrar CONFIDENCE_THRESHOLD."""
+    start = serializers.FloatField(default=0.05, min_value=0.0, max_value=1.0)
+    stop = serializers.FloatField(default=0.5, min_value=0.0, max_value=1.0)
+    step = serializers.FloatField(default=0.01, min_value=0.0001, max_value=1.0)
+    fallback = serializers.FloatField(required=False, min_value=0.0, max_value=1.0)
+    max_far = serializers.FloatField(default=0.01, min_value=0.0, max_value=1.0)
+
+    def validate(self, data):
+        try:
+            threshold_grid(data["start"], data["stop"], data["step"])
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+        return data
+
+
 class EndUserSerializer(serializers.ModelSerializer):
     class Meta:
         model = EndUser
@@ -347,6 +409,55 @@ class EndUserSerializer(serializers.ModelSerializer):
         read_only_fields = ["id", "email", "full_name", "role", "created_at"]
 
 
+class EndUserListQuerySerializer(serializers.Serializer):
+    """Parámetros de consulta del listado paginado de EndUsers."""
+    cursor = serializers.CharField(required=False)
+    page_size = serializers.IntegerField(required=False, min_value=1)
+    role = serializers.CharField(required=False)
+    email = serializers.CharField(required=False, help_text="Prefijo del email.")
+
+    def validate_cursor(self, value):
+        try:
+            decode_cursor(value)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+        return value
+
+    def validate_page_size(self, value):
+        return min(value, settings.FACE_ENDUSER_MAX_PAGE_SIZE)
+
+
+class ExportQuerySerializer(serializers.Serializer):
+    """Formato y rango de fechas [since, until) de una exportación."""
+    fmt = serializers.ChoiceField(choices=["csv", "ndjson"], default="csv")
+    since = serializers.DateTimeField(required=False)
+    until = serializers.DateTimeField(required=False)
+
+    def validate(self, data):
+        if data.get("since") and data.get("until") and data["since"] >= data["until"]:
+            raise serializers.ValidationError("'since' debe ser anterior a 'until'.")
+        return data
+
+
+class EndUserBulkActionSerializer(serializers.Serializer):
+    """
+    Selección de EndUsers para una operación en bloque: lista de IDs y/o filtros
+    por rol y prefijo de email. Se exige al menos un criterio.
+    """
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, allow_empty=False, max_length=10000
+    )
+    role = serializers.CharField(required=False)
+    email = serializers.CharField(required=False, help_text="Prefijo del email.")
+
+    def validate(self, data):
+        if not any(data.get(key) for key in ("ids", "role", "email")):
+            raise serializers.ValidationError(
+                "Indica 'ids' o al menos un filtro ('role', 'email')."
+            )
+        return data
+
+
 class EndUserFaceFeedbackSerializer(serializers.Serializer):
     """
     Serializador para validar los datos del feedback de autenticación facial
@@ -354,14 +465,13 @@ class EndUserFaceFeedbackSerializer(serializers.Serializer):
     """
     user_id = serializers.IntegerField()
     password = serializers.CharField(write_only=True, required=False, allow_blank=True) 
-    face_image = serializers.ImageField(write_only=True)
+    face_image = FaceImageField(write_only=True)
 
     def validate(self, data):
         face_image = data.get("face_image")
         if face_image:
-            img_np = _bytes_to_array(face_image.read())
-            faces = _face_detect_and_align(img_np)
-            if not faces:
+            detection = _detect_face(self, face_image)
+            if not detection:
                 raise serializers.ValidationError(
                     {"face_image": "No se detectó ningún rostro en la imagen proporcionada."}
                 )
@@ -0,0 +1,29 @@
+"""
+Mantiene `LoginAttemptRollup` al crear intentos de login y al registrar su feedback.
+Los `bulk_create` de `attempt_log` no emiten señales y llaman a `track_created`.
+También invalida la caché de ClientApp por token cuando cambia una app.
+"""
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .app_cache import invalidate_app
+from .models import ClientApp, CustomUserLoginAttempt, EndUserLoginAttempt
+from .rollups import snapshot, track_saved
+
+
+@receiver(post_init, sender=EndUserLoginAttempt)
+@receiver(post_init, sender=CustomUserLoginAttempt)
+def attempt_loaded(sender, instance, **kwargs):
+    snapshot(instance)
+
+
+@receiver(post_save, sender=EndUserLoginAttempt)
+@receiver(post_save, sender=CustomUserLoginAttempt)
+def attempt_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        track_saved(instance, created)
+
+
+@receiver([post_save, post_delete], sender=ClientApp)
+def client_app_changed(sender, instance, **kwargs):
+    invalidate_app(instance.token)
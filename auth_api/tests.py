@@ -1,3 +1,905 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import tempfile
+import threading
+import zipfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from PIL import Image
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from facial_auth_app.admission import InferenceOverloadedError
+from facial_auth_app import gallery
+from facial_auth_app.content_storage import content_storage
+from facial_auth_app.embedding_cache import embedding_cache
+from facial_auth_app.gallery import app_scope as gallery_scope
+from facial_auth_app.models import FacialRecognitionProfile, GalleryState
+
+from . import app_cache, attempt_log, end_user_bulk
+from .async_views import AsyncFaceLoginView
+from .attempt_metrics import rollup_metrics
+from .bulk_enrollment import BulkEnrollment, open_archive
+from .calibration import MAX_GRID_POINTS, evaluate, load_labeled, threshold_grid
+from .exports import FORMULA_PREFIXES, _csv_value
+from .image_writer import ImageWriter, assign_pending_image
+from .models import (
+    ClientApp,
+    CustomUser,
+    CustomUserLoginAttempt,
+    EndUser,
+    EndUserLoginAttempt,
+    LoginAttemptRollup,
+)
+from .pagination import decode_cursor, encode_cursor, keyset_page
+from .retention import expired_attempts, purge
+from .rollups import app_scope, track_created, truncate_hour
+from .views import _run_burst
+
+
+class LoginAttemptMetricsTests(TestCase):
+    def setUp(self):
+        self.owner = CustomUser.objects.create_superuser(
+            "admin", "admin@example.com", "admin-password"
+        )
+        self.app = ClientApp.objects.create(owner=self.owner, name="App")
+        now = timezone.now()
+        attempts = [
+            ("success", "correcto", True, timedelta(hours=1)),
+            ("success", "incorrecto", False, timedelta(days=2)),
+            ("ambiguous_match", None, False, timedelta(days=10)),
+            ("no_match", None, False, timedelta(days=40)),
+            ("error", None, False, timedelta(days=40)),
+        ]
+        for initial_status, feedback, verified, age in attempts:
+            attempt = EndUserLoginAttempt.objects.create(
+                app=self.app,
+                initial_status=initial_status,
+                user_feedback=feedback,
+                is_verified_and_correct=verified,
+            )
+            EndUserLoginAttempt.objects.filter(pk=attempt.pk).update(timestamp=now - age)
+        # update() no pasa por las señales: los rollups se recalculan desde los intentos
+        call_command("backfill_login_rollups", stdout=StringIO())
+
+    def test_all_windows_in_two_queries(self):
+        with self.assertNumQueries(2):
+            metrics = rollup_metrics(
+                app_scope(self.app.id), EndUserLoginAttempt.objects.filter(app=self.app)
+            )
+
+        self.assertEqual(metrics["last_24_hours"]["total_attempts"], 1)
+        self.assertEqual(metrics["last_7_days"]["total_attempts"], 2)
+        self.assertEqual(metrics["last_30_days"]["total_attempts"], 3)
+        self.assertEqual(metrics["all_time"]["total_attempts"], 5)
+        self.assertEqual(metrics["all_time"]["initial_success"], 2)
+        self.assertEqual(metrics["all_time"]["initial_no_match"], 1)
+        self.assertEqual(metrics["all_time"]["confirmed_correct_by_feedback"], 1)
+        self.assertEqual(metrics["last_7_days"]["true_positive_rate"], "50.00%")
+        self.assertEqual(metrics["last_24_hours"]["false_positive_rate"], "0.00%")
+        self.assertEqual(metrics["all_time"]["initial_success_rate"], "40.00%")
+
+    def test_metrics_view_query_count_does_not_grow(self):
+        self.client.force_login(self.owner)
+        url = f"/admin/auth_api/clientapp/{self.app.pk}/metrics/"
+        with self.assertNumQueries(5):
+            # sesión, usuario, la app, los rollups y la hora en curso
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+
+class LoginAttemptRollupTests(TestCase):
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user("owner", "owner@example.com", "owner-password")
+        self.app = ClientApp.objects.create(owner=self.owner, name="App")
+        self.scope = app_scope(self.app.id)
+
+    def counts(self):
+        return {
+            (rollup.initial_status, rollup.feedback_outcome, rollup.distance_bucket): rollup.count
+            for rollup in LoginAttemptRollup.objects.filter(scope=self.scope, count__gt=0)
+        }
+
+    def test_new_attempt_bumps_its_hour_and_bucket(self):
+        attempt = EndUserLoginAttempt.objects.create(
+            app=self.app, initial_status="success", best_match_distance=0.12
+        )
+        rollup = LoginAttemptRollup.objects.get(scope=self.scope)
+        self.assertEqual(rollup.hour, truncate_hour(attempt.timestamp))
+        self.assertEqual(self.counts(), {("success", "none", 2): 1})
+
+    def test_feedback_moves_the_count(self):
+        confirmed = EndUserLoginAttempt.objects.create(app=self.app, initial_status="success")
+        rejected = EndUserLoginAttempt.objects.create(app=self.app, initial_status="success")
+
+        confirmed.user_feedback, confirmed.is_verified_and_correct = "correcto", True
+        confirmed.save(update_fields=["user_feedback", "is_verified_and_correct"])
+        rejected = EndUserLoginAttempt.objects.get(pk=rejected.pk)
+        rejected.user_feedback, rejected.is_verified_and_correct = "incorrecto", False
+        rejected.save(update_fields=["user_feedback", "is_verified_and_correct"])
+
+        self.assertEqual(
+            self.counts(), {("success", "confirmed", -1): 1, ("success", "rejected", -1): 1}
+        )
+
+    def test_saving_twice_counts_once(self):
+        attempt = EndUserLoginAttempt.objects.create(app=self.app, initial_status="no_match")
+        attempt.save()
+        EndUserLoginAttempt.objects.get(pk=attempt.pk).save()
+        self.assertEqual(self.counts(), {("no_match", "none", -1): 1})
+
+    def test_bulk_created_attempts(self):
+        attempts = EndUserLoginAttempt.objects.bulk_create(
+            EndUserLoginAttempt(app=self.app, initial_status="error") for _ in range(3)
+        )
+        track_created(attempts)
+        attempts[0].save()
+        self.assertEqual(self.counts(), {("error", "none", -1): 3})
+
+    def test_current_hour_is_computed_live(self):
+        EndUserLoginAttempt.objects.create(app=self.app, initial_status="success")
+        live = EndUserLoginAttempt.objects.filter(app=self.app)
+        self.assertEqual(rollup_metrics(self.scope, live)["all_time"]["total_attempts"], 1)
+        # La fila de la hora en curso no se suma: esa hora sale de los intentos
+        LoginAttemptRollup.objects.filter(scope=self.scope).update(count=50)
+        self.assertEqual(rollup_metrics(self.scope, live)["all_time"]["total_attempts"], 1)
+
+    def test_backfill(self):
+        # Intento anterior a los rollups: bulk_create sin track_created no lo cuenta
+        [old] = EndUserLoginAttempt.objects.bulk_create(
+            [EndUserLoginAttempt(app=self.app, initial_status="success", best_match_distance=0.01)]
+        )
+        current = EndUserLoginAttempt.objects.create(app=self.app, initial_status="no_match")
+        hour = truncate_hour(timezone.now()) - timedelta(hours=3)
+        EndUserLoginAttempt.objects.filter(pk=old.pk).update(
+            timestamp=hour + timedelta(minutes=5),
+            user_feedback="correcto",
+            is_verified_and_correct=True,
+        )
+        # Fila obsoleta en el rango recalculado: debe desaparecer
+        LoginAttemptRollup.objects.create(
+            scope=self.scope, hour=hour, initial_status="error", feedback_outcome="none", count=4
+        )
+
+        for _ in range(2):
+            call_command("backfill_login_rollups", app=self.app.id, stdout=StringIO())
+            self.assertEqual(
+                set(
+                    LoginAttemptRollup.objects.filter(scope=self.scope).values_list(
+                        "hour", "initial_status", "feedback_outcome", "distance_bucket", "count"
+                    )
+                ),
+                {
+                    (hour, "success", "confirmed", 0, 1),
+                    # La hora en curso la mantiene el conteo incremental
+                    (truncate_hour(current.timestamp), "no_match", "none", -1, 1),
+                },
+            )
+        self.assertFalse(LoginAttemptRollup.objects.filter(count=0).exists())
+
+
+@override_settings(FACE_LOGIN_ATTEMPT_BATCH_SIZE=10, FACE_LOGIN_ATTEMPT_FLUSH_SECONDS=1)
+class AttemptLogTests(TestCase):
+    """Búfer de intentos con ids reservados (en producción, PostgreSQL)."""
+
+    def setUp(self):
+        owner = CustomUser.objects.create_user("owner", "owner@example.com", "owner-password")
+        self.app = ClientApp.objects.create(owner=owner, name="App")
+        reserved = iter(range(1000, 2000))
+        self.addCleanup(mock.patch.stopall)
+        mock.patch("auth_api.attempt_log._buffering_enabled", return_value=True).start()
+        mock.patch(
+            "auth_api.attempt_log._reserve_id", side_effect=lambda model: next(reserved)
+        ).start()
+        mock.patch("auth_api.attempt_log._last_reserved_id", return_value=1005).start()
+        mock.patch("auth_api.attempt_log._AttemptBuffer._ensure_flusher").start()
+        self.sleep = mock.patch("auth_api.attempt_log.time.sleep").start()
+
+    def find(self, attempt_id):
+        return attempt_log.find_attempt(
+            EndUserLoginAttempt.objects.all(), id=attempt_id, app=self.app
+        )
+
+    def test_stage_flush_find(self):
+        attempt = attempt_log.stage(
+            EndUserLoginAttempt(app=self.app, initial_status="no_match"), b"image"
+        )
+        attempt_log.record(attempt)
+        self.assertEqual(attempt.pk, 1000)
+        self.assertFalse(EndUserLoginAttempt.objects.filter(pk=1000).exists())
+
+        found = self.find(1000)
+        self.assertEqual(found.initial_status, "no_match")
+        self.assertTrue(found.submitted_image.name)
+        self.sleep.assert_not_called()
+        self.assertEqual(LoginAttemptRollup.objects.get().count, 1)
+
+    def test_unissued_id_fails_without_waiting(self):
+        with self.assertRaises(EndUserLoginAttempt.DoesNotExist):
+            self.find(5000)
+        self.sleep.assert_not_called()
+
+    def test_old_id_fails_without_waiting(self):
+        newer = EndUserLoginAttempt.objects.create(id=1002, app=self.app, initial_status="error")
+        EndUserLoginAttempt.objects.filter(pk=newer.pk).update(
+            timestamp=timezone.now() - timedelta(hours=1)
+        )
+        with self.assertRaises(EndUserLoginAttempt.DoesNotExist):
+            self.find(1001)
+        self.sleep.assert_not_called()
+
+    def test_recently_reserved_id_waits_one_flush(self):
+        with self.assertRaises(EndUserLoginAttempt.DoesNotExist):
+            self.find(1003)
+        self.sleep.assert_called_once_with(1)
+
+
+class EndUserBulkTests(TestCase):
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user("owner", "owner@example.com", "owner-password")
+        self.app = ClientApp.objects.create(owner=self.owner, name="App")
+        self.users = [
+            EndUser.objects.create(
+                app=self.app, email=f"{name}@example.com", role=role, face_encoding=b""
+            )
+            for name, role in [("ana", "staff"), ("andres", "guest"), ("bea", "staff")]
+        ]
+        self.ids = [user.id for user in self.users]
+
+    def revision(self):
+        scope = gallery_scope(self.app.id)
+        return GalleryState.objects.filter(scope=scope).values_list("revision", flat=True).first()
+
+    def select(self, **criteria):
+        return end_user_bulk.select_end_users(self.app, **criteria)
+
+    def test_select_end_users(self):
+        self.assertEqual(
+            set(self.select(role="staff").values_list("email", flat=True)),
+            {"ana@example.com", "bea@example.com"},
+        )
+        self.assertEqual(self.select(email="an", role="guest").get().id, self.ids[1])
+        self.assertEqual(self.select(ids=self.ids[:2]).count(), 2)
+
+    def test_soft_delete_and_restore_bump_once(self):
+        revision = self.revision()
+        self.assertEqual(end_user_bulk.soft_delete(self.app, self.select(ids=self.ids[:2])), 2)
+        self.assertEqual(self.revision(), revision + 1)
+        self.assertEqual(end_user_bulk.soft_delete(self.app, self.select(ids=self.ids[:2])), 0)
+        self.assertEqual(self.revision(), revision + 1)
+
+        self.assertEqual(end_user_bulk.restore(self.app, self.select()), 2)
+        self.assertEqual(self.revision(), revision + 2)
+        self.assertFalse(EndUser.objects.filter(deleted=True).exists())
+
+    def test_purge_only_deleted_with_a_single_bump(self):
+        end_user_bulk.soft_delete(self.app, self.select(ids=self.ids[:2]))
+        revision = self.revision()
+        # post_delete se emite por fila; la galería se invalida una vez
+        self.assertEqual(end_user_bulk.purge(self.app, self.select(), chunk_size=1), 2)
+        self.assertEqual(self.revision(), revision + 1)
+        self.assertEqual(list(EndUser.objects.values_list("id", flat=True)), self.ids[2:])
+
+    def test_delete_view_uses_soft_delete(self):
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        revision = self.revision()
+        url = f"/api/apps/{self.app.id}/users/{self.ids[0]}/delete/"
+        self.assertEqual(client.delete(url).status_code, 204)
+        self.assertTrue(EndUser.objects.get(id=self.ids[0]).deleted)
+        self.assertEqual(self.revision(), revision + 1)
+
+        other_app = ClientApp.objects.create(owner=self.owner, name="Other")
+        stranger = EndUser.objects.create(app=other_app, email="x@example.com", face_encoding=b"")
+        for user_id in (stranger.id, 999999):
+            url = f"/api/apps/{self.app.id}/users/{user_id}/delete/"
+            self.assertEqual(client.delete(url).status_code, 404)
+        self.assertFalse(EndUser.objects.get(id=stranger.id).deleted)
+
+
+def _png(shade: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 32), (shade, shade, shade)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def _fake_embeddings(images_np, version=None):
+    # Un vector distinto por tono de gris: sin duplicados faciales entre imágenes
+    results = []
+    for image_np in images_np:
+        embedding = np.zeros(8, dtype=np.float32)
+        embedding[int(image_np[0, 0, 0]) % 8] = 1.0
+        results.append({"embedding": embedding, "box": (0, 0, 32, 32), "score": 0.9})
+    return results
+
+
+@override_settings(FACE_BULK_ENROLL_BATCH_SIZE=2, FACE_BULK_ENROLL_MAX_WAIT=5)
+class BulkEnrollmentTests(TestCase):
+    def setUp(self):
+        owner = CustomUser.objects.create_user("owner", "owner@example.com", "owner-password")
+        self.app = ClientApp.objects.create(owner=owner, name="App")
+        self.addCleanup(mock.patch.stopall)
+        self.embed = mock.patch(
+            "facial_auth_app.services._embed_array_batch", side_effect=_fake_embeddings
+        ).start()
+        mock.patch("facial_auth_app.services.get_inference_pool", return_value=None).start()
+
+    def enroll(self, rows, images):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            for name, shade in images.items():
+                archive.writestr(name, _png(shade))
+            archive.writestr("manifest.json", json.dumps(rows))
+        archive, rows = open_archive(buffer)
+        return list(BulkEnrollment(self.app, archive).run(rows))
+
+    def test_row_errors(self):
+        encoding = np.eye(8, dtype=np.float32)[7].tobytes()
+        EndUser.objects.create(app=self.app, email="taken@example.com", face_encoding=encoding)
+        rows = [
+            {"email": "ok@example.com", "image": "a.png", "full_name": 42},
+            {"email": "bad-email", "image": "a.png"},
+            {"email": "ok@example.com", "image": "b.png"},
+            {"email": "taken@example.com", "image": "b.png"},
+            {"email": "lost@example.com", "image": "missing.png"},
+            {"email": ["x@example.com"], "image": "b.png"},
+            {"image": "b.png"},
+        ]
+        results = self.enroll(rows, {"a.png": 1, "b.png": 2})
+
+        self.assertEqual([r["index"] for r in results], list(range(len(rows))))
+        self.assertEqual(
+            [r["status"] for r in results],
+            ["created"] + ["error"] * (len(rows) - 1),
+        )
+        self.assertIn("texto", results[5]["detail"])
+        self.assertEqual(EndUser.objects.get(email="ok@example.com").full_name, "42")
+
+    def test_duplicate_face_in_batch(self):
+        rows = [
+            {"email": "a@example.com", "image": "a.png"},
+            {"email": "b@example.com", "image": "a.png"},
+        ]
+        results = self.enroll(rows, {"a.png": 1})
+        self.assertEqual([r["status"] for r in results], ["created", "duplicate"])
+
+    def test_overload_stops_with_resume_index(self):
+        rows = [{"email": f"user{i}@example.com", "image": f"{i}.png"} for i in range(4)]
+        clock = [0.0]
+        admitted = []
+
+        def admit(jobs=1):
+            if admitted:
+                raise InferenceOverloadedError(2)
+            admitted.append(jobs)
+            return mock.MagicMock()
+
+        def sleep(seconds):
+            clock[0] += seconds
+
+        with (
+            mock.patch("auth_api.bulk_enrollment.inference_admission.admit", side_effect=admit),
+            mock.patch("auth_api.bulk_enrollment.time.monotonic", side_effect=lambda: clock[0]),
+            mock.patch("auth_api.bulk_enrollment.time.sleep", side_effect=sleep),
+        ):
+            results = self.enroll(rows, {f"{i}.png": i for i in range(4)})
+
+        self.assertEqual([r["status"] for r in results], ["created", "created", "error"])
+        self.assertEqual(results[-1]["index"], 2)
+        self.assertEqual(EndUser.objects.count(), 2)
+
+    def test_uses_inference_pool(self):
+        pool = mock.Mock()
+        pool.embed_many.side_effect = _fake_embeddings
+        with mock.patch("facial_auth_app.services.get_inference_pool", return_value=pool):
+            results = self.enroll([{"email": "a@example.com", "image": "a.png"}], {"a.png": 1})
+        self.assertEqual(results[0]["status"], "created")
+        pool.embed_many.assert_called_once()
+        self.embed.assert_not_called()
+
+
+class HotPathIndexTests(TestCase):
+    """Las consultas frecuentes deben usar los índices compuestos/parciales."""
+
+    APPS = 20
+    USERS_PER_APP = 200
+    ATTEMPTS_PER_APP = 500
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = CustomUser.objects.create_user("owner", "owner@example.com", "owner-password")
+        cls.users = CustomUser.objects.bulk_create(
+            CustomUser(username=f"user{i}", email=f"user{i}@example.com") for i in range(200)
+        )
+        cls.apps = ClientApp.objects.bulk_create(
+            ClientApp(owner=owner, name=f"App {i}", token=f"{i:040x}") for i in range(cls.APPS)
+        )
+        statuses = ["success", "ambiguous_match", "no_match", "error"]
+        EndUser.objects.bulk_create(
+            EndUser(
+                app=app,
+                email=f"user{i}@example.com",
+                face_encoding=b"",
+                deleted=i % 10 == 0,
+            )
+            for app in cls.apps
+            for i in range(cls.USERS_PER_APP)
+        )
+        EndUserLoginAttempt.objects.bulk_create(
+            EndUserLoginAttempt(app=app, initial_status=statuses[i % len(statuses)])
+            for app in cls.apps
+            for i in range(cls.ATTEMPTS_PER_APP)
+        )
+        CustomUserLoginAttempt.objects.bulk_create(
+            CustomUserLoginAttempt(user=user, initial_status="success")
+            for user in cls.users
+            for _ in range(20)
+        )
+        FacialRecognitionProfile.objects.bulk_create(
+            FacialRecognitionProfile(user=user, face_encoding=b"", is_active=i % 4 == 0)
+            for user in cls.users
+            for i in range(8)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, plan)
+
+    def test_active_end_users_of_app(self):
+        app = self.apps[7]
+        self.assertUsesIndex(
+            EndUser.objects.filter(app=app, deleted=False).order_by("created_at", "id"),
+            "enduser_app_active_idx",
+        )
+
+    def test_login_attempts_by_app_and_time(self):
+        since = timezone.now() - timedelta(days=1)
+        self.assertUsesIndex(
+            EndUserLoginAttempt.objects.filter(app=self.apps[3], timestamp__gte=since),
+            "enduserattempt_app_ts_idx",
+        )
+
+    def test_login_attempts_by_app_and_status(self):
+        self.assertUsesIndex(
+            EndUserLoginAttempt.objects.filter(app=self.apps[3], initial_status="success"),
+            "enduserattempt_app_status_idx",
+        )
+
+    def test_customuser_attempts_by_user_and_time(self):
+        since = timezone.now() - timedelta(days=1)
+        self.assertUsesIndex(
+            CustomUserLoginAttempt.objects.filter(user=self.users[5], timestamp__gte=since),
+            "customattempt_user_ts_idx",
+        )
+
+    def test_active_profiles_of_user(self):
+        self.assertUsesIndex(
+            FacialRecognitionProfile.objects.filter(user=self.users[5], is_active=True),
+            "profile_user_active_idx",
+        )
+
+
+class ThresholdCalibrationTests(TestCase):
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user("owner", "owner@example.com", "owner-password")
+        self.app = ClientApp.objects.create(owner=self.owner, name="App")
+        self.alice, self.bob = (
+            EndUser.objects.create(app=self.app, email=email, face_encoding=b"")
+            for email in ("alice@example.com", "bob@example.com")
+        )
+
+    def attempt(self, distance, best_match, feedback=None, confirmed_by=None):
+        return EndUserLoginAttempt.objects.create(
+            app=self.app,
+            initial_status="ambiguous_match",
+            best_match_user=best_match,
+            best_match_distance=distance,
+            user_feedback=feedback,
+            is_verified_and_correct=feedback == "correcto",
+            confirmed_by_feedback=confirmed_by,
+        )
+
+    def test_threshold_grid(self):
+        np.testing.assert_allclose(threshold_grid(0.1, 0.3, 0.1), [0.1, 0.2, 0.3])
+        self.assertEqual(len(threshold_grid(0.0, 1.0, 1 / (MAX_GRID_POINTS - 1))), MAX_GRID_POINTS)
+        for start, stop, step in [(0.1, 0.3, 0), (0.3, 0.1, 0.01), (0.0, 1.0, 0.0001)]:
+            with self.assertRaises(ValueError):
+                threshold_grid(start, stop, step)
+
+    def test_evaluate_known_thresholds(self):
+        distances = np.array([0.1, 0.2, 0.25, 0.4, np.inf])
+        genuine = np.array([True, True, False, False, False])
+        table = evaluate(distances, genuine, np.array([0.15, 0.3]), fallback=0.5)
+        self.assertEqual(table["far"], [0.0, 0.3333])
+        self.assertEqual(table["frr"], [0.5, 0.0])
+        self.assertEqual(table["success"], [1, 3])
+        self.assertEqual(table["ambiguous"], [3, 1])
+        self.assertEqual(table["no_match"], [1, 1])
+
+        # Por encima del fallback se acepta como mucho hasta el fallback
+        capped = evaluate(distances, genuine, np.array([0.3]), fallback=0.2)
+        self.assertEqual(capped["success"], [2])
+        self.assertEqual(capped["far"], [0.0])
+
+    def test_evaluate_without_impostors(self):
+        table = evaluate(np.array([0.1]), np.array([True]), np.array([0.2]), fallback=0.5)
+        self.assertEqual(table["far"], [None])
+        self.assertEqual(table["frr"], [0.0])
+
+    def test_labels_follow_who_confirmed(self):
+        self.attempt(0.1, self.alice, "correcto", confirmed_by=self.alice)
+        # Bob confirmó un intento cuya mejor coincidencia era Alice: distancia de impostor
+        self.attempt(0.12, self.alice, "correcto", confirmed_by=self.bob)
+        self.attempt(None, self.alice, "incorrecto")
+        # Confirmado sin coincidencia: no hay distancia que evaluar
+        self.attempt(None, None, "correcto", confirmed_by=self.bob)
+        self.attempt(0.05, self.alice)
+
+        distances, genuine = load_labeled(self.app.login_attempts.order_by("id"))
+        np.testing.assert_array_equal(distances, [0.1, 0.12, np.inf])
+        np.testing.assert_array_equal(genuine, [True, False, False])
+
+
+class ClientAppCalibrationViewTests(TestCase):
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user("owner", "owner@example.com", "owner-password")
+        self.app = ClientApp.objects.create(owner=self.owner, name="App")
+        self.url = f"/api/apps/{self.app.id}/calibration/"
+        self.client = APIClient()
+
+    def test_owner_gets_report(self):
+        self.client.force_authenticate(self.owner)
+        response = self.client.get(self.url, {"start": 0.1, "stop": 0.2, "step": 0.05})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["threshold"] for row in response.data["thresholds"]], [0.1, 0.15, 0.2])
+        self.assertIsNone(response.data["recommended_threshold"])
+
+    def test_only_owner(self):
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        other = CustomUser.objects.create_user("other", "other@example.com", "other-password")
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_rejects_invalid_grid(self):
+        self.client.force_authenticate(self.owner)
+        for params in [{"step": 0.0001}, {"start": 0.4, "stop": 0.2}, {"step": 0}]:
+            self.assertEqual(self.client.get(self.url, params).status_code, 400, params)
+
+
+class BurstEarlyStopTests(TestCase):
+    def setUp(self):
+        embedding = {"embedding": np.ones(4, dtype=np.float32), "box": (0, 0, 4, 4), "score": 0.9}
+        patchers = [
+            mock.patch("facial_auth_app.burst._embed_frame", return_value=embedding),
+            mock.patch(
+                "facial_auth_app.burst._bytes_to_array", return_value=np.zeros((8, 8, 3))
+            ),
+            mock.patch("auth_api.views.probe_versions", return_value=["v1"]),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.frames = [(None, b"frame")] * 3
+
+    def test_stops_once_confident(self):
+        match = mock.Mock(return_value=[{"distance": 0.05}])
+        burst = _run_burst(gallery_scope(1), self.frames, None, match, 0.18)
+        self.assertEqual(burst.frames, 1)
+        match.assert_called_once()
+
+    def test_processes_every_frame_while_unsure(self):
+        match = mock.Mock(return_value=[{"distance": 0.3}])
+        burst = _run_burst(gallery_scope(1), self.frames, None, match, 0.18)
+        self.assertEqual((burst.frames, burst.detector_runs), (3, 1))
+        self.assertEqual(match.call_count, 3)
+
+
+class InferenceOverloadResponseTests(TestCase):
+    def test_face_login_returns_503_with_retry_after(self):
+        upload = io.BytesIO(_png(120))
+        upload.name = "rostro.png"
+        with mock.patch(
+            "facial_auth_app.services.inference_admission.enqueue",
+            side_effect=InferenceOverloadedError(3.2),
+        ):
+            response = APIClient().post(
+                "/api/auth/login/face/", {"face_image": upload}, format="multipart"
+            )
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "4")
+        self.assertEqual(response.data["detail"].code, "inference_overloaded")
+
+
+class ClientAppCacheTests(TestCase):
+    def setUp(self):
+        app_cache._backend().clear()
+        self.addCleanup(app_cache._backend().clear)
+        self.owner = CustomUser.objects.create_user("owner", "owner@example.com", "owner-password")
+        self.app = ClientApp.objects.create(owner=self.owner, name="App", description="Demo")
+
+    def test_second_lookup_skips_the_database(self):
+        app_cache.get_app_by_token(self.app.token)
+        with self.assertNumQueries(0):
+            cached = app_cache.get_app_by_token(self.app.token)
+        self.assertEqual((cached.id, cached.CONFIDENCE_THRESHOLD), (self.app.id, 0.18))
+        # Los campos no cacheados se cargan al usarlos
+        with self.assertNumQueries(1):
+            self.assertEqual(cached.description, "Demo")
+
+    def test_save_invalidates(self):
+        app_cache.get_app_by_token(self.app.token)
+        self.app.CONFIDENCE_THRESHOLD = 0.1
+        self.app.save()
+        self.assertEqual(app_cache.get_app_by_token(self.app.token).CONFIDENCE_THRESHOLD, 0.1)
+
+    def test_delete_and_cascade_invalidate(self):
+        other = ClientApp.objects.create(owner=self.owner, name="Otra")
+        app_cache.get_app_by_token(self.app.token)
+        app_cache.get_app_by_token(other.token)
+
+        self.app.delete()
+        with self.assertRaises(ClientApp.DoesNotExist):
+            app_cache.get_app_by_token(self.app.token)
+
+        self.owner.delete()
+        with self.assertRaises(ClientApp.DoesNotExist):
+            app_cache.get_app_by_token(other.token)
+
+    def test_entry_repopulated_before_commit_is_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.app.FALLBACK_THRESHOLD = 0.3
+            self.app.save()
+            # Una petición concurrente que aún ve los datos anteriores repuebla la caché
+            stale = dict(zip(app_cache.CACHED_FIELDS, app_cache._queryset(self.app.token).first()))
+            stale["FALLBACK_THRESHOLD"] = 0.25
+            app_cache._backend().set(app_cache._key(self.app.token), tuple(stale.values()))
+            self.assertEqual(app_cache.get_app_by_token(self.app.token).FALLBACK_THRESHOLD, 0.25)
+        self.assertEqual(app_cache.get_app_by_token(self.app.token).FALLBACK_THRESHOLD, 0.3)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.owner = CustomUser.objects.create_user("owner", "owner@example.com", "owner-password")
+        self.app = ClientApp.objects.create(owner=self.owner, name="App")
+        self.users = [
+            EndUser.objects.create(
+                app=self.app,
+                email=f"user{i}@example.com",
+                role="staff" if i % 2 else "guest",
+                face_encoding=b"",
+            )
+            for i in range(5)
+        ]
+        # Mismo created_at en las tres primeras: el id desempata
+        tied = timezone.now() - timedelta(hours=1)
+        EndUser.objects.filter(id__in=[user.id for user in self.users[:3]]).update(created_at=tied)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def test_cursor_round_trip(self):
+        user = EndUser.objects.get(id=self.users[0].id)
+        self.assertEqual(decode_cursor(encode_cursor(user)), (user.created_at, user.id))
+        for cursor in ("no-es-base64!", encode_cursor(user)[:-4], "YWJj"):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    def test_pages_cover_every_row_once_despite_ties(self):
+        seen, cursor = [], None
+        while True:
+            rows, cursor = keyset_page(EndUser.objects.filter(app=self.app), cursor, 2)
+            seen.extend(row.id for row in rows)
+            if cursor is None:
+                break
+        self.assertEqual(seen, [user.id for user in self.users])
+
+    def test_list_view_follows_next_links(self):
+        url = f"/api/apps/{self.app.id}/users/?page_size=2&role=staff"
+        emails = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            emails.extend(row["email"] for row in response.data["results"])
+            url = response.data["next"]
+        self.assertEqual(emails, ["user1@example.com", "user3@example.com"])
+
+    def test_list_view_rejects_invalid_cursor(self):
+        response = self.client.get(f"/api/apps/{self.app.id}/users/?cursor=roto")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("cursor", response.data)
+
+
+class ExportTests(TestCase):
+    def test_csv_value_escapes_formulas(self):
+        for prefix in FORMULA_PREFIXES:
+            self.assertEqual(_csv_value(f"{prefix}SUM(A1)"), f"'{prefix}SUM(A1)")
+        self.assertEqual(_csv_value("ana@example.com"), "ana@example.com")
+        self.assertEqual(_csv_value(-0.5), -0.5)
+        self.assertEqual(_csv_value(None), "")
+        moment = timezone.now()
+        self.assertEqual(_csv_value(moment), moment.isoformat())
+
+    def test_end_user_csv_export(self):
+        owner = CustomUser.objects.create_user("owner", "owner@example.com", "owner-password")
+        app = ClientApp.objects.create(owner=owner, name="App")
+        EndUser.objects.create(
+            app=app, email="ana@example.com", full_name="=1+1", face_encoding=b""
+        )
+        EndUser.objects.create(
+            app=app, email="borrado@example.com", face_encoding=b"", deleted=True
+        )
+        client = APIClient()
+        client.force_authenticate(owner)
+
+        response = client.get(f"/api/apps/{app.id}/users/export/?fmt=csv")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        content = b"".join(response.streaming_content).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual([row["email"] for row in rows], ["ana@example.com"])
+        self.assertEqual(rows[0]["full_name"], "'=1+1")
+
+
+class LoginAttemptRetentionTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = self.settings(MEDIA_ROOT=media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        owner = CustomUser.objects.create_user("owner", "owner@example.com", "owner-password")
+        self.app = ClientApp.objects.create(
+            owner=owner, name="App", login_attempt_retention_days=30
+        )
+        self.other_app = ClientApp.objects.create(owner=owner, name="Sin límite")
+        self.expired = [self._attempt(self.app, days=40, shade=i) for i in range(3)]
+        self.recent = self._attempt(self.app, days=5, shade=10)
+        self._attempt(self.other_app, days=400, shade=20)
+
+    def _attempt(self, app, days, shade):
+        attempt = EndUserLoginAttempt.objects.create(
+            app=app,
+            initial_status="no_match",
+            submitted_image=ContentFile(_png(shade), name="intento.png"),
+        )
+        EndUserLoginAttempt.objects.filter(pk=attempt.pk).update(
+            timestamp=timezone.now() - timedelta(days=days)
+        )
+        return attempt
+
+    def _expired_queryset(self):
+        (label, queryset), = expired_attempts(self.app.id)
+        self.assertIn(str(self.app.id), label)
+        return queryset
+
+    def test_only_apps_with_retention_expire(self):
+        self.assertEqual(len(expired_attempts()), 1)
+        self.assertEqual(
+            set(self._expired_queryset().values_list("pk", flat=True)),
+            {attempt.pk for attempt in self.expired},
+        )
+        with self.settings(FACE_CUSTOMUSER_ATTEMPT_RETENTION_DAYS=7):
+            self.assertEqual(expired_attempts()[-1][0], "customuser")
+
+    def test_purge_deletes_rows_and_images_in_batches(self):
+        names = [attempt.submitted_image.name for attempt in self.expired]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(purge(self._expired_queryset(), chunk_size=2), (3, 3))
+        self.assertEqual(EndUserLoginAttempt.objects.filter(app=self.app).count(), 1)
+        self.assertFalse(any(content_storage.exists(name) for name in names))
+        self.assertTrue(content_storage.exists(self.recent.submitted_image.name))
+
+    def test_images_only_keeps_rows(self):
+        names = [attempt.submitted_image.name for attempt in self.expired]
+        self.assertEqual(purge(self._expired_queryset(), images_only=True), (3, 3))
+        self.assertFalse(any(content_storage.exists(name) for name in names))
+        kept = EndUserLoginAttempt.objects.filter(pk__in=[a.pk for a in self.expired])
+        self.assertEqual(list(kept.values_list("submitted_image", flat=True)), [""] * 3)
+        # Una segunda pasada ya no encuentra imágenes
+        self.assertEqual(purge(self._expired_queryset(), images_only=True), (0, 0))
+
+
+@override_settings(FACE_IMAGE_WRITER_THREADS=0, FACE_IMAGE_WRITER_RETRIES=1)
+class ImageWriterTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = self.settings(MEDIA_ROOT=media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        owner = CustomUser.objects.create_user("owner", "owner@example.com", "owner-password")
+        self.app = ClientApp.objects.create(owner=owner, name="App")
+        self.writer = ImageWriter()
+
+    def _attempt(self):
+        attempt = EndUserLoginAttempt(app=self.app, initial_status="no_match")
+        assign_pending_image(attempt, "submitted_image")
+        attempt.save()
+        return attempt
+
+    def test_image_written_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            attempt = self._attempt()
+            self.writer.write_later(attempt, "submitted_image", _png(40))
+        self.assertFalse(content_storage.exists(attempt.submitted_image.name))
+
+        for callback in callbacks:
+            callback()
+        attempt.refresh_from_db()
+        self.assertTrue(attempt.submitted_image.name.startswith("blobs/"))
+        self.assertTrue(content_storage.exists(attempt.submitted_image.name))
+
+    def test_discarded_attempt_is_not_written(self):
+        with (
+            mock.patch.object(content_storage, "save") as save,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            attempt = self._attempt()
+            self.writer.write_later(attempt, "submitted_image", _png(40))
+            attempt.delete()
+        save.assert_not_called()
+
+    def test_failed_write_clears_the_reference(self):
+        with (
+            mock.patch.object(ImageWriter, "_write", side_effect=OSError("storage caído")),
+            mock.patch("auth_api.image_writer.time.sleep") as sleep,
+            self.assertLogs("auth_api.image_writer", "ERROR"),
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            attempt = self._attempt()
+            self.writer.write_later(attempt, "submitted_image", _png(40))
+        sleep.assert_called_once()
+        attempt.refresh_from_db()
+        self.assertEqual(attempt.submitted_image.name, "")
+
+
+class AsyncFaceLoginViewTests(TestCase):
+    def setUp(self):
+        embedding_cache.backend.clear()
+        gallery._cache.clear()
+        user = CustomUser.objects.create_user(
+            "ana", "ana@example.com", "pw", face_auth_enabled=True
+        )
+        FacialRecognitionProfile.objects.create(
+            user=user, face_encoding=np.array([1, 0, 0], dtype=np.float32).tobytes()
+        )
+
+    async def _post(self):
+        upload = io.BytesIO(_png(80))
+        upload.name = "rostro.png"
+        request = AsyncRequestFactory().post("/api/auth/login/face/", {"face_image": upload})
+        return await AsyncFaceLoginView.as_view()(request)
+
+    async def test_inference_runs_in_the_bounded_executor(self):
+        threads = []
+
+        def compute(img_bytes, version=None):
+            threads.append(threading.current_thread().name)
+            embedding = np.array([1, 0, 0], dtype=np.float32)
+            return {"embedding": embedding, "box": (0, 0, 4, 4), "score": 0.9}
+
+        with mock.patch("facial_auth_app.services._compute_embedding", side_effect=compute):
+            response = await self._post()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads[0].startswith("face-inference"))
+
+    async def test_overload_returns_503(self):
+        with mock.patch(
+            "facial_auth_app.services.inference_admission.enqueue",
+            side_effect=InferenceOverloadedError(1.5),
+        ):
+            response = await self._post()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "2")
@@ -1,25 +1,52 @@
+from django.conf import settings
 from django.urls import path
 from auth_api.views import (
     RegisterView,
     LoginView,
     FaceLoginView,
     FaceLoginFeedbackView,
+    FaceBurstLoginView,
     ClientAppCreateView,
     ClientAppListView,
     ClientAppUpdateView,
     ClientAppDeleteView,
+    ClientAppCalibrationView,
     EndUserRegisterView,
     EndUserFaceLoginView,
+    EndUserFaceBurstLoginView,
     EndUserListView,
+    EndUserBulkRegisterView,
     EndUserDeleteView,
+    EndUserBulkDeleteView,
+    EndUserBulkRestoreView,
+    EndUserBulkPurgeView,
+    EndUserExportView,
+    LoginAttemptExportView,
     EndUserFaceFeedbackView,
+    FaceMetricsView,
 )
 
+if settings.FACE_AUTH_ASYNC_VIEWS:
+    # Bajo ASGI, las vistas con inferencia no bloquean un hilo durante el modelo
+    from auth_api.async_views import (
+        AsyncRegisterView as RegisterView,
+        AsyncFaceLoginView as FaceLoginView,
+        AsyncFaceLoginFeedbackView as FaceLoginFeedbackView,
+        AsyncEndUserRegisterView as EndUserRegisterView,
+        AsyncEndUserFaceLoginView as EndUserFaceLoginView,
+        AsyncEndUserFaceFeedbackView as EndUserFaceFeedbackView,
+    )
+
 urlpatterns = [
     # Rutas para el cliente de la API (tu usuario)
     path("auth/register/", RegisterView.as_view(), name="register"),
     path("auth/login/", LoginView.as_view(), name="login"),
     path("auth/login/face/", FaceLoginView.as_view(), name="facial-login"),
+    path(
+        "auth/login/face/burst/",
+        FaceBurstLoginView.as_view(),
+        name="facial-login-burst",
+    ),
     path(
         "auth/login/face/feedback/",
         FaceLoginFeedbackView.as_view(),
@@ -30,6 +57,11 @@ urlpatterns = [
     path("apps/", ClientAppListView.as_view(), name="list-apps"),
     path("apps/<int:pk>/update/", ClientAppUpdateView.as_view(), name="update-app"),
     path("apps/<int:pk>/delete/", ClientAppDeleteView.as_view(), name="delete-app"),
+    path(
+        "apps/<int:pk>/calibration/",
+        ClientAppCalibrationView.as_view(),
+        name="app-calibration",
+    ),
     # Rutas para los usuarios finales de las aplicaciones de terceros
     path(
         "apps/v1/<str:app_token>/register/",
@@ -41,6 +73,11 @@ urlpatterns = [
         EndUserFaceLoginView.as_view(),
         name="enduser-face-login",
     ),
+    path(
+        "apps/v1/<str:app_token>/face-login/burst/",
+        EndUserFaceBurstLoginView.as_view(),
+        name="enduser-face-login-burst",
+    ),
     path(
         "apps/v1/<str:app_token>/face-feedback/",
         EndUserFaceFeedbackView.as_view(),
@@ -50,9 +87,41 @@ urlpatterns = [
     path(
         "apps/<int:app_id>/users/", EndUserListView.as_view(), name="app-endusers-list"
     ),
+    path(
+        "apps/<int:app_id>/users/bulk-register/",
+        EndUserBulkRegisterView.as_view(),
+        name="app-endusers-bulk-register",
+    ),
     path(
         "apps/<int:app_id>/users/<int:user_id>/delete/",
         EndUserDeleteView.as_view(),
         name="app-enduser-delete",
     ),
+    path(
+        "apps/<int:app_id>/users/bulk-delete/",
+        EndUserBulkDeleteView.as_view(),
+        name="app-endusers-bulk-delete",
+    ),
+    path(
+        "apps/<int:app_id>/users/bulk-restore/",
+        EndUserBulkRestoreView.as_view(),
+        name="app-endusers-bulk-restore",
+    ),
+    path(
+        "apps/<int:app_id>/users/bulk-purge/",
+        EndUserBulkPurgeView.as_view(),
+        name="app-endusers-bulk-purge",
+    ),
+    path(
+        "apps/<int:app_id>/users/export/",
+        EndUserExportView.as_view(),
+        name="app-endusers-export",
+    ),
+    path(
+        "apps/<int:app_id>/login-attempts/export/",
+        LoginAttemptExportView.as_view(),
+        name="app-login-attempts-export",
+    ),
+    # Métricas operativas (solo staff)
+    path("metrics/face/", FaceMetricsView.as_view(), name="face-metrics"),
 ]
@@ -1,7 +1,14 @@
+import json
+import traceback
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions, generics, serializers as drf_serializers
+from rest_framework.utils.urls import replace_query_param
 from rest_framework_simplejwt.tokens import RefreshToken
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
 from django.contrib.auth import authenticate, get_user_model
 from django.core.exceptions import ValidationError
@@ -10,11 +17,16 @@ from django.db import transaction
 from facial_auth_app.services import (
     FacialRecognitionService,
     FaceAlreadyRegisteredError,
-    _bytes_to_array,
-    _face_detect_and_align,
-    _preprocess_for_embedding,
-    embedding_model,
+    _embed_image_bytes,
+    probe_versions,
 )
+from facial_auth_app.burst import BurstProbe
+from facial_auth_app.gallery import SYSTEM_SCOPE, app_scope, galleries_for, search_galleries
+from facial_auth_app.admission import InferenceOverloadedError, request_deadline
+from facial_auth_app.image_probe import ImageRejectedError, probe_upload
+from facial_auth_app import metrics
+from facial_auth_app.model_versions import current_model_version
+from facial_auth_app.stored_images import attach_face_box
 
 from auth_api.models import ClientApp, EndUser, EndUserFeedback, EndUserLoginAttempt, CustomUserLoginAttempt
 from auth_api.serializers import (
@@ -25,10 +37,25 @@ from auth_api.serializers import (
     EndUserRegistrationSerializer,
     FaceLoginFeedbackSerializer,
     EndUserSerializer,
+    EndUserBulkRegistrationSerializer,
+    EndUserListQuerySerializer,
+    EndUserBulkActionSerializer,
+    ExportQuerySerializer,
+    ThresholdCalibrationSerializer,
 )
+from auth_api.bulk_enrollment import BulkEnrollment, open_archive
+from auth_api import attempt_log
+from auth_api.app_cache import get_app_by_token
+from auth_api.calibration import calibrate
+from auth_api import end_user_bulk
+from auth_api.exports import END_USER_FIELDS, LOGIN_ATTEMPT_FIELDS, export_response, is_asgi
+from auth_api.pagination import keyset_page
 
 User = get_user_model()
 
+# Umbrales para CustomUser (el de fallback, 0.25, se aplica al buscar en la galería)
+CUSTOMUSER_CONFIDENCE_THRESHOLD = 0.18
+
 def home(request):
     return render(request, "home.html")
 
@@ -38,59 +65,84 @@ def get_tokens_for_user(user):
     return {"refresh": str(refresh), "access": str(refresh.access_token)}
 
 
+def _rejected_image_response(image):
+    """Devuelve un 400 si la imagen supera los límites de tamaño o píxeles, o None si es válida."""
+    try:
+        probe_upload(image)
+    except ImageRejectedError as e:
+        return Response({"detail": e.message}, status=status.HTTP_400_BAD_REQUEST)
+    return None
+
+
+def _register_user_response(serializer, validate_only=False):
+    """
+    Valida y registra un CustomUser, traduciendo los errores a respuestas de la API.
+    Con `validate_only` solo valida y devuelve None si los datos son correctos.
+    """
+    try:
+        serializer.is_valid(raise_exception=True)
+        if validate_only:
+            return None
+        user = serializer.save()
+        tokens = get_tokens_for_user(user)
+        return Response(
+            {
+                "user": UserSerializer(user).data,
+                "tokens": tokens,
+                "message": "Usuario registrado exitosamente",
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+    except drf_serializers.ValidationError as e:
+        errors = {
+            field: (
+                error_list[0] if isinstance(error_list, list) else str(error_list)
+            )
+            for field, error_list in e.detail.items()
+        }
+        return Response(
+            {"errors": errors, "message": "Error en los datos de registro"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    except FaceAlreadyRegisteredError as e:
+        return Response(
+            {
+                "errors": {"face_image": str(e)},
+                "message": "Error en el registro facial",
+                "detail": str(e),
+            },
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    except InferenceOverloadedError:
+        raise
+
+    except Exception as e:
+        traceback.print_exc()
+        return Response(
+            {
+                "errors": {"non_field_errors": str(e)},
+                "message": "Error en el servidor",
+            },
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+
+
 class RegisterView(APIView):
     permission_classes = [permissions.AllowAny]
 
     def post(self, request):
         force_register = request.data.get("force_register", "false").lower() == "true"
         serializer = RegistrationSerializer(
-            data=request.data, context={"force_register": force_register}
+            data=request.data,
+            context={
+                "force_register": force_register,
+                "deadline": request_deadline(request),
+            },
         )
-        try:
-            serializer.is_valid(raise_exception=True)
-            user = serializer.save()
-            tokens = get_tokens_for_user(user)
-            return Response(
-                {
-                    "user": UserSerializer(user).data,
-                    "tokens": tokens,
-                    "message": "Usuario registrado exitosamente",
-                },
-                status=status.HTTP_201_CREATED,
-            )
-
-        except drf_serializers.ValidationError as e:
-            errors = {
-                field: (
-                    error_list[0] if isinstance(error_list, list) else str(error_list)
-                )
-                for field, error_list in e.detail.items()
-            }
-            return Response(
-                {"errors": errors, "message": "Error en los datos de registro"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
-        except FaceAlreadyRegisteredError as e:
-            return Response(
-                {
-                    "errors": {"face_image": str(e)},
-                    "message": "Error en el registro facial",
-                    "detail": str(e),
-                },
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
-        except Exception as e:
-            import traceback
-            traceback.print_exc()
-            return Response(
-                {
-                    "errors": {"non_field_errors": str(e)},
-                    "message": "Error en el servidor",
-                },
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
+        return _register_user_response(serializer)
 
 
 class LoginView(APIView):
@@ -115,6 +167,140 @@ class LoginView(APIView):
         )
 
 
+def _start_system_login_attempt(request, img_bytes):
+    """
+    Prepara el intento de login de un CustomUser con la referencia a su imagen.
+    Se inserta una sola vez, ya con su estado final (ver `attempt_log.record`).
+    """
+    # El campo 'user' puede ser nulo inicialmente si el usuario no está autenticado
+    login_attempt = CustomUserLoginAttempt(
+        user=request.user if request.user.is_authenticated else None,
+        initial_status="error",  # Default a error, se actualizará
+    )
+    return attempt_log.stage(login_attempt, img_bytes)
+
+
+def _login_probes(scope, img_bytes, deadline):
+    """
+    Calcula la sonda del login con cada versión de modelo que hay que consultar
+    (ver `probe_versions`). Devuelve {versión: detección o None}.
+    """
+    versions = probe_versions(galleries_for(scope))
+    return {
+        version: _embed_image_bytes(img_bytes, deadline=deadline, version=version)
+        for version in versions
+    }
+
+
+def _match_system_users(detections):
+    """
+    Compara las sondas con los perfiles activos de los CustomUser con login facial,
+    cada una contra los embeddings de su misma versión de modelo.
+    Devuelve None si no hay usuarios con rostros registrados o la lista de
+    coincidencias ordenada por distancia.
+    """
+    galleries = galleries_for(SYSTEM_SCOPE)
+    if not any(len(gallery) for gallery in galleries.values()):
+        return None
+
+    # Umbral genérico para CustomUser
+    matches = search_galleries(galleries, detections, threshold=0.25)
+    users = User.objects.in_bulk([user_id for user_id, _, _ in matches])
+    return [
+        {"user": users[user_id], "distance": distance, "version": version}
+        for user_id, distance, version in matches
+        if user_id in users
+    ]
+
+
+def _finish_system_login(login_attempt, detections):
+    """Busca coincidencias para las sondas ({versión: detección}) y cierra el intento con su estado inicial."""
+    if not any(detections.values()):
+        login_attempt.initial_status = "no_match"
+        attempt_log.record(login_attempt)
+        return Response(
+            {"detail": "No se detectó ningún rostro en la imagen."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    matches = _match_system_users(detections)
+    if matches is None:
+        login_attempt.initial_status = "no_match"
+        attempt_log.record(login_attempt)
+        return Response(
+            {
+                "detail": "No hay usuarios con autenticación facial habilitada o rostros registrados."
+            },
+            status=status.HTTP_401_UNAUTHORIZED,
+        )
+
+    if not matches:
+        login_attempt.initial_status = "no_match"
+        attempt_log.record(login_attempt)
+        return Response(
+            {"detail": "Rostro no reconocido para ningún usuario del sistema."},
+            status=status.HTTP_401_UNAUTHORIZED,
+        )
+
+    best_match = matches[0]
+
+    login_attempt.best_match_user = best_match["user"]
+    login_attempt.best_match_distance = best_match["distance"]
+    login_attempt.embedding_model_version = best_match["version"]
+
+    if best_match["distance"] <= CUSTOMUSER_CONFIDENCE_THRESHOLD:
+        login_attempt.initial_status = "success"
+        # is_verified_and_correct se establecerá a True solo después del feedback 'correcto'
+        attempt_log.record(login_attempt)
+
+        user_data = UserSerializer(best_match["user"]).data
+        tokens = get_tokens_for_user(best_match["user"])
+
+        return Response(
+            {
+                "status": "success",
+                "user": user_data,
+                "tokens": tokens,
+                "message": "Ingreso facial exitoso. Por favor, confirma tu identidad.",
+                "confidence": round(1 - best_match["distance"], 3),
+                "login_attempt_id": login_attempt.id,  # Devolver el ID del intento
+            },
+            status=status.HTTP_200_OK,
+        )
+    else:
+        login_attempt.initial_status = "ambiguous_match"
+        attempt_log.record(login_attempt)
+        ambiguous_matches = [
+            {
+                "id": m["user"].id,
+                "username": m["user"].username,
+                "full_name": m["user"].full_name,
+                "distance": m["distance"],
+            }
+            for m in matches
+        ]
+        return Response(
+            {
+                "status": "ambiguous_match",
+                "matches": ambiguous_matches,
+                "detail": "Múltiples coincidencias, se requiere confirmación del usuario.",
+                "login_attempt_id": login_attempt.id,  # Devolver el ID del intento
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+def _login_error_response(login_attempt, exc):
+    """Marca el intento como error interno y devuelve la respuesta 500."""
+    traceback.print_exception(exc)
+    login_attempt.initial_status = "error"
+    attempt_log.record(login_attempt)
+    return Response(
+        {"detail": f"Error interno del servidor: {str(exc)}"},
+        status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+    )
+
+
 class FaceLoginView(APIView):
     permission_classes = [permissions.AllowAny]
 
@@ -124,148 +310,184 @@ class FaceLoginView(APIView):
         image_file = request.FILES.get("face_image")
 
         # Crear un registro de intento de login para CustomUser
-        # El campo 'user' puede ser nulo inicialmente si el usuario no está autenticado
-        login_attempt = CustomUserLoginAttempt.objects.create(
-            user=request.user if request.user.is_authenticated else None,
-            initial_status="error",  # Default a error, se actualizará
+        # Los bytes se leen una sola vez: la inferencia no espera a que se guarde la imagen
+        img_bytes = image_file.read()
+        login_attempt = _start_system_login_attempt(request, img_bytes)
+
+        try:
+            detections = _login_probes(SYSTEM_SCOPE, img_bytes, request_deadline(request))
+            return _finish_system_login(login_attempt, detections)
+        except InferenceOverloadedError:
+            # El intento no llegó a evaluarse: no se registra para no contar en las métricas
+            raise
+        except Exception as e:
+            return _login_error_response(login_attempt, e)
+
+
+def _collect_burst_frames(request):
+    """
+    Devuelve (fotogramas, None) con los archivos del campo "frames" en orden de
+    llegada, o (None, response) si faltan, sobran o alguno supera los límites.
+    Cada fotograma es una tupla (archivo, bytes).
+    """
+    frames = request.FILES.getlist("frames")
+    if not frames:
+        return None, Response(
+            {"detail": "Se requiere al menos un fotograma en 'frames'."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if len(frames) > settings.FACE_BURST_MAX_FRAMES:
+        return None, Response(
+            {"detail": f"Se admiten como máximo {settings.FACE_BURST_MAX_FRAMES} fotogramas."},
+            status=status.HTTP_400_BAD_REQUEST,
         )
-        login_attempt.submitted_image = image_file
-        login_attempt.save()  # Guardar para que la imagen se suba
+    for frame in frames:
+        rejected = _rejected_image_response(frame)
+        if rejected:
+            return None, rejected
+    return [(frame, frame.read()) for frame in frames], None
+
+
+def _run_burst(scope, frames, deadline, match, confidence_threshold):
+    """
+    Procesa los fotogramas en orden y se detiene en cuanto la evidencia acumulada
+    supera el umbral de confianza. Devuelve el BurstProbe con las sondas fusionadas.
+    """
+    burst = BurstProbe(probe_versions(galleries_for(scope)), deadline)
+    for _, img_bytes in frames:
+        burst.add_frame(img_bytes)
+        detections = burst.detections()
+        if not any(detections.values()):
+            continue
+        matches = match(detections)
+        if matches and matches[0]["distance"] <= confidence_threshold:
+            break
+    return burst
+
+
+def _with_burst_stats(response, burst):
+    if isinstance(response.data, dict):
+        response.data["frames_processed"] = burst.frames
+        response.data["detector_runs"] = burst.detector_runs
+    return response
+
+
+class FaceBurstLoginView(APIView):
+    """Login facial de un CustomUser a partir de una ráfaga corta de fotogramas."""
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request):
+        frames, response = _collect_burst_frames(request)
+        if response:
+            return response
 
-        image_file.seek(0)  # Resetear el puntero del archivo después de guardarlo
+        login_attempt = _start_system_login_attempt(request, frames[0][1])
 
         try:
-            image_np = _bytes_to_array(image_file.read())
-            faces = _face_detect_and_align(image_np)
-
-            if not faces:
-                login_attempt.initial_status = "no_match"
-                login_attempt.save()
-                return Response(
-                    {"detail": "No se detectó ningún rostro en la imagen."},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-            processed_face = _preprocess_for_embedding(faces[0])
-            emb = embedding_model(processed_face)[0].numpy()
-            unknown = emb.tobytes()
-
-            matches_by_user = {}
-            # FILTRO CLAVE: Obtener solo usuarios que tienen autenticación facial habilitada
-            # y al menos un perfil de reconocimiento facial con un encoding no nulo.
-            # Usamos 'facial_profiles' que es el related_name de la ForeignKey.
-            users_with_face_auth = User.objects.filter(
-                face_auth_enabled=True,
-                facial_profiles__face_encoding__isnull=False,  # Usar el related_name correcto
-            ).distinct()  # Usar distinct para evitar usuarios duplicados si tienen múltiples perfiles
-
-            if not users_with_face_auth.exists():
-                login_attempt.initial_status = "no_match"
-                login_attempt.save()
-                return Response(
-                    {
-                        "detail": "No hay usuarios con autenticación facial habilitada o rostros registrados."
-                    },
-                    status=status.HTTP_401_UNAUTHORIZED,
-                )
-
-            # Iterar a través de cada usuario y sus múltiples perfiles faciales
-            for user_obj in users_with_face_auth:
-                # Obtener todos los perfiles faciales activos para el usuario actual
-                # Asegúrate de que 'is_active' exista en tu modelo FacialRecognitionProfile
-                user_profiles = user_obj.facial_profiles.filter(
-                    is_active=True, face_encoding__isnull=False
-                )
-
-                for profile in user_profiles:
-                    face_encoding = profile.face_encoding
-
-                    match, dist = FacialRecognitionService.compare_faces(
-                        face_encoding,
-                        unknown,
-                        threshold=0.25,  # Umbral genérico para CustomUser o definir uno en CustomUser
-                    )
-                    if match:
-                        user_id = user_obj.id
-                        # Si este usuario ya es una posible coincidencia, mantenemos la mejor (distancia más pequeña)
-                        if (
-                            user_id not in matches_by_user
-                            or dist < matches_by_user[user_id]["distance"]
-                        ):
-                            matches_by_user[user_id] = {
-                                "user": user_obj,
-                                "distance": dist,
-                            }
-
-            if not matches_by_user:
-                login_attempt.initial_status = "no_match"
-                login_attempt.save()
-                return Response(
-                    {"detail": "Rostro no reconocido para ningún usuario del sistema."},
-                    status=status.HTTP_401_UNAUTHORIZED,
-                )
-
-            matches = sorted(matches_by_user.values(), key=lambda x: x["distance"])
-            best_match = matches[0]
-
-            login_attempt.best_match_user = best_match["user"]
-            login_attempt.best_match_distance = best_match["distance"]
-
-            # Definir umbrales para CustomUser (pueden ser fijos o configurables)
-            CUSTOMUSER_CONFIDENCE_THRESHOLD = 0.18
-            # CUSTOMUSER_FALLBACK_THRESHOLD = 0.25 # Ya usado en el filtro de umbral
-
-            if best_match["distance"] <= CUSTOMUSER_CONFIDENCE_THRESHOLD:
-                login_attempt.initial_status = "success"
-                # is_verified_and_correct se establecerá a True solo después del feedback 'correcto'
-                login_attempt.save()
-
-                user_data = UserSerializer(best_match["user"]).data
-                tokens = get_tokens_for_user(best_match["user"])
-
-                return Response(
-                    {
-                        "status": "success",
-                        "user": user_data,
-                        "tokens": tokens,
-                        "message": "Ingreso facial exitoso. Por favor, confirma tu identidad.",
-                        "confidence": round(1 - best_match["distance"], 3),
-                        "login_attempt_id": login_attempt.id,  # Devolver el ID del intento
-                    },
-                    status=status.HTTP_200_OK,
-                )
-            else:
-                login_attempt.initial_status = "ambiguous_match"
-                login_attempt.save()
-                ambiguous_matches = [
-                    {
-                        "id": m["user"].id,
-                        "username": m["user"].username,
-                        "full_name": m["user"].full_name,
-                        "distance": m["distance"],
-                    }
-                    for m in matches
-                ]
-                return Response(
-                    {
-                        "status": "ambiguous_match",
-                        "matches": ambiguous_matches,
-                        "detail": "Múltiples coincidencias, se requiere confirmación del usuario.",
-                        "login_attempt_id": login_attempt.id,  # Devolver el ID del intento
-                    },
-                    status=status.HTTP_200_OK,
-                )
+            burst = _run_burst(
+                SYSTEM_SCOPE,
+                frames,
+                request_deadline(request),
+                _match_system_users,
+                CUSTOMUSER_CONFIDENCE_THRESHOLD,
+            )
+            response = _finish_system_login(login_attempt, burst.detections())
+            return _with_burst_stats(response, burst)
+        except InferenceOverloadedError:
+            # El intento no llegó a evaluarse: no se registra para no contar en las métricas
+            raise
         except Exception as e:
-            import traceback
+            return _login_error_response(login_attempt, e)
+
+
+def _load_system_feedback(validated_data):
+    """
+    Resuelve el intento de login y el usuario del feedback de un CustomUser.
+    Devuelve (login_attempt, user, None) si hay que procesar la imagen, o
+    (None, None, response) si el feedback ya quedó resuelto o es inválido.
+    """
+    login_attempt_id = validated_data.get("login_attempt_id")
+    feedback_decision = validated_data.get("feedback_decision")
+    user_id = validated_data.get("user_id")
+    password = validated_data.get("password")
+
+    try:
+        login_attempt = attempt_log.find_attempt(
+            CustomUserLoginAttempt.objects.all(), id=login_attempt_id
+        )
+    except CustomUserLoginAttempt.DoesNotExist:
+        return None, None, Response(
+            {"detail": "Intento de login no encontrado."},
+            status=status.HTTP_404_NOT_FOUND,
+        )
 
-            traceback.print_exc()
-            login_attempt.initial_status = "error"
-            login_attempt.save()
+    if feedback_decision == "incorrecto":
+        login_attempt.user_feedback = "incorrecto"
+        login_attempt.is_verified_and_correct = False
+        login_attempt.save(
+            update_fields=["user_feedback", "is_verified_and_correct"]
+        )
+        return None, None, Response(
+            {"message": "Feedback de 'incorrecto' registrado."},
+            status=status.HTTP_200_OK,
+        )
+
+    # Si feedback_decision es 'correcto', user_id, password y face_image son obligatorios
+    # (validado por el serializer)
+    try:
+        user = User.objects.get(id=user_id)
+    except User.DoesNotExist:
+        return None, None, Response(
+            {"detail": "Usuario no encontrado."},
+            status=status.HTTP_404_NOT_FOUND,
+        )
+
+    if not user.check_password(password):
+        return None, None, Response(
+            {"detail": "Contraseña incorrecta."},
+            status=status.HTTP_401_UNAUTHORIZED,
+        )
+
+    return login_attempt, user, None
+
+
+def _store_system_feedback(login_attempt, user, face_image, result):
+    """Guarda el feedback 'correcto' de un CustomUser con la inferencia ya calculada."""
+    with transaction.atomic():
+        # Procesar y almacenar feedback para CustomUser
+        success = FacialRecognitionService.process_and_store_feedback(
+            user, face_image, result=result
+        )
+
+        if not success:
             return Response(
-                {"detail": f"Error interno del servidor: {str(e)}"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                {"detail": "No se detectó un rostro en la imagen de feedback."},
+                status=status.HTTP_400_BAD_REQUEST,
             )
 
+        login_attempt.confirmed_by_feedback = user
+        login_attempt.user = user  # Establecer el usuario real que intentó
+        login_attempt.user_feedback = "correcto"
+        login_attempt.is_verified_and_correct = True
+        login_attempt.save(
+            update_fields=[
+                "confirmed_by_feedback",
+                "user",
+                "user_feedback",
+                "is_verified_and_correct",
+            ]
+        )
+
+        tokens = get_tokens_for_user(user)
+        return Response(
+            {
+                "user": UserSerializer(user).data,
+                "tokens": tokens,
+                "message": "Verificación exitosa, bienvenido. Gracias por tu feedback.",
+            },
+            status=status.HTTP_200_OK,
+        )
+
 
 class FaceLoginFeedbackView(APIView):
     """
@@ -279,74 +501,20 @@ class FaceLoginFeedbackView(APIView):
         serializer = FaceLoginFeedbackSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        login_attempt_id = serializer.validated_data.get("login_attempt_id")
-        feedback_decision = serializer.validated_data.get("feedback_decision")
-        user_id = serializer.validated_data.get("user_id")
-        password = serializer.validated_data.get("password")
         face_image = request.FILES.get(
             "face_image"
         )  # Usar request.FILES para la imagen
 
-        try:
-            login_attempt = CustomUserLoginAttempt.objects.get(id=login_attempt_id)
-        except CustomUserLoginAttempt.DoesNotExist:
-            return Response(
-                {"detail": "Intento de login no encontrado."},
-                status=status.HTTP_404_NOT_FOUND,
-            )
-
-        with transaction.atomic():
-            if feedback_decision == "incorrecto":
-                login_attempt.user_feedback = "incorrecto"
-                login_attempt.is_verified_and_correct = False
-                login_attempt.save()
-                return Response(
-                    {"message": "Feedback de 'incorrecto' registrado."},
-                    status=status.HTTP_200_OK,
-                )
-
-            # Si feedback_decision es 'correcto', user_id, password y face_image son obligatorios
-            # (validado por el serializer)
-            try:
-                user = User.objects.get(id=user_id)
-            except User.DoesNotExist:
-                return Response(
-                    {"detail": "Usuario no encontrado."},
-                    status=status.HTTP_404_NOT_FOUND,
-                )
-
-            if not user.check_password(password):
-                return Response(
-                    {"detail": "Contraseña incorrecta."},
-                    status=status.HTTP_401_UNAUTHORIZED,
-                )
-
-            # Procesar y almacenar feedback para CustomUser
-            success = FacialRecognitionService.process_and_store_feedback(
-                user, face_image
-            )
-
-            if not success:
-                return Response(
-                    {"detail": "No se detectó un rostro en la imagen de feedback."},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-            login_attempt.confirmed_by_feedback = user
-            login_attempt.user = user  # Establecer el usuario real que intentó
-            login_attempt.user_feedback = "correcto"
-            login_attempt.is_verified_and_correct = True
-            login_attempt.save()
+        login_attempt, user, response = _load_system_feedback(
+            serializer.validated_data
+        )
+        if response:
+            return response
 
-            tokens = get_tokens_for_user(user)
-            return Response(
-                {
-                    "user": UserSerializer(user).data,
-                    "tokens": tokens,
-                    "message": "Verificación exitosa, bienvenido. Gracias por tu feedback.",
-                },
-                status=status.HTTP_200_OK,
-            )
+        result = _embed_image_bytes(
+            face_image.read(), deadline=request_deadline(request)
+        )
+        return _store_system_feedback(login_attempt, user, face_image, result)
 
 
 # -----------------------------
@@ -389,38 +557,141 @@ class ClientAppDeleteView(generics.DestroyAPIView):
 # -----------------------------
 # EndUsers
 # -----------------------------
+def _register_end_user_response(serializer, validate_only=False):
+    """
+    Valida y registra un EndUser, traduciendo los errores a respuestas de la API.
+    Con `validate_only` solo valida y devuelve None si los datos son correctos.
+    """
+    try:
+        serializer.is_valid(raise_exception=True)
+        if validate_only:
+            return None
+        serializer.save()
+        return Response(
+            {"message": "Usuario registrado exitosamente"},
+            status=status.HTTP_201_CREATED,
+        )
+    except FaceAlreadyRegisteredError as e:
+        return Response({"detail": str(e)}, status=status.HTTP_409_CONFLICT)
+    except drf_serializers.ValidationError as e:
+        return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+    except ValidationError as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except InferenceOverloadedError:
+        raise
+    except Exception:
+        return Response(
+            {"detail": "Ocurrió un error inesperado al registrar el usuario."},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+
+
 class EndUserRegisterView(APIView):
     permission_classes = [permissions.AllowAny]
 
     def post(self, request, app_token):
         try:
-            app = ClientApp.objects.get(token=app_token)
+            app = get_app_by_token(app_token)
         except ClientApp.DoesNotExist:
             return Response(
                 {"detail": "Token inválido"}, status=status.HTTP_403_FORBIDDEN
             )
 
         serializer = EndUserRegistrationSerializer(
-            data=request.data, context={"app": app}
+            data=request.data,
+            context={"app": app, "deadline": request_deadline(request)},
+        )
+        return _register_end_user_response(serializer)
+
+
+def _start_end_user_login_attempt(app, img_bytes):
+    """
+    Prepara el intento de login de un EndUser con la referencia a su imagen.
+    Se inserta una sola vez, ya con su estado final (ver `attempt_log.record`).
+    """
+    # El ID del intento se devuelve al cliente para el feedback
+    login_attempt = EndUserLoginAttempt(
+        app=app, initial_status="error"  # Default a error, se actualizará
+    )
+    return attempt_log.stage(login_attempt, img_bytes)
+
+
+def _match_end_users(app, detections):
+    """
+    Devuelve las coincidencias de las sondas entre los EndUser activos de la app,
+    comparando cada una solo con embeddings de su versión, ordenadas por distancia.
+    """
+    galleries = galleries_for(app_scope(app.id))
+    matches = search_galleries(galleries, detections, threshold=app.FALLBACK_THRESHOLD)
+    users = app.end_users.in_bulk([user_id for user_id, _, _ in matches])
+    return [
+        {"user": users[user_id], "distance": distance, "version": version}
+        for user_id, distance, version in matches
+        if user_id in users
+    ]
+
+
+def _finish_end_user_login(app, login_attempt, detections):
+    """Busca coincidencias para las sondas ({versión: detección}) y cierra el intento con su estado inicial."""
+    if not any(detections.values()):
+        login_attempt.initial_status = "no_match"
+        attempt_log.record(login_attempt)
+        return Response(
+            {"detail": "No se detectó ningún rostro en la imagen."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    matches = _match_end_users(app, detections)
+    if not matches:
+        login_attempt.initial_status = "no_match"
+        attempt_log.record(login_attempt)
+        return Response(
+            {"detail": "Rostro no reconocido"},
+            status=status.HTTP_401_UNAUTHORIZED,
+        )
+
+    best_match = matches[0]
+
+    login_attempt.best_match_user = best_match["user"]
+    login_attempt.best_match_distance = best_match["distance"]
+    login_attempt.embedding_model_version = best_match["version"]
+
+    if best_match["distance"] <= app.CONFIDENCE_THRESHOLD:
+        # Si hay un match de alta confianza, se registra como intento 'success'.
+        # La verificación final y el campo 'is_verified_and_correct'
+        # se actualizarán con el feedback del usuario.
+        login_attempt.initial_status = "success"
+        attempt_log.record(login_attempt)
+        return Response(
+            {
+                "status": "success",
+                "user": EndUserSerializer(best_match["user"]).data,
+                "message": "Ingreso facial exitoso. ¿Es usted?",
+                "confidence": round(1 - best_match["distance"], 3),
+                "login_attempt_id": login_attempt.id,
+            },
+            status=status.HTTP_200_OK,
+        )
+    else:
+        login_attempt.initial_status = "ambiguous_match"
+        attempt_log.record(login_attempt)
+        ambiguous_matches = [
+            {
+                "id": m["user"].id,
+                "full_name": m["user"].full_name,
+                "distance": m["distance"],
+            }
+            for m in matches
+        ]
+        return Response(
+            {
+                "status": "ambiguous_match",
+                "matches": ambiguous_matches,
+                "detail": "Múltiples coincidencias, se requiere confirmación del usuario.",
+                "login_attempt_id": login_attempt.id,
+            },
+            status=status.HTTP_200_OK,
         )
-        try:
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            return Response(
-                {"message": "Usuario registrado exitosamente"},
-                status=status.HTTP_201_CREATED,
-            )
-        except FaceAlreadyRegisteredError as e:
-            return Response({"detail": str(e)}, status=status.HTTP_409_CONFLICT)
-        except drf_serializers.ValidationError as e:
-            return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
-        except ValidationError as e:
-            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
-        except Exception:
-            return Response(
-                {"detail": "Ocurrió un error inesperado al registrar el usuario."},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
 
 
 class EndUserFaceLoginView(APIView):
@@ -428,7 +699,7 @@ class EndUserFaceLoginView(APIView):
 
     def post(self, request, app_token):
         try:
-            app = ClientApp.objects.get(token=app_token)
+            app = get_app_by_token(app_token)
         except ClientApp.DoesNotExist:
             return Response(
                 {"detail": "Token inválido"}, status=status.HTTP_403_FORBIDDEN
@@ -439,114 +710,210 @@ class EndUserFaceLoginView(APIView):
             return Response(
                 {"detail": "Imagen requerida"}, status=status.HTTP_400_BAD_REQUEST
             )
+        rejected = _rejected_image_response(image)
+        if rejected:
+            return rejected
 
-        # Crear un registro de intento de login. Se usará el ID para el feedback.
-        login_attempt = EndUserLoginAttempt.objects.create(
-            app=app, initial_status="error"  # Default a error, se actualizará
-        )
-        # Guardar la imagen en el modelo de intento de login
-        login_attempt.submitted_image = image
-        login_attempt.save()
+        img_bytes = image.read()
+        login_attempt = _start_end_user_login_attempt(app, img_bytes)
+
+        try:
+            detections = _login_probes(app_scope(app.id), img_bytes, request_deadline(request))
+            return _finish_end_user_login(app, login_attempt, detections)
+        except InferenceOverloadedError:
+            # El intento no llegó a evaluarse: no se registra para no contar en las métricas
+            raise
+        except Exception as e:
+            return _login_error_response(login_attempt, e)
+
+
+class EndUserFaceBurstLoginView(APIView):
+    """Login facial de un EndUser a partir de una ráfaga corta de fotogramas."""
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request, app_token):
+        try:
+            app = get_app_by_token(app_token)
+        except ClientApp.DoesNotExist:
+            return Response(
+                {"detail": "Token inválido"}, status=status.HTTP_403_FORBIDDEN
+            )
+
+        frames, response = _collect_burst_frames(request)
+        if response:
+            return response
 
-        image.seek(0)
+        login_attempt = _start_end_user_login_attempt(app, frames[0][1])
 
         try:
-            image_np = _bytes_to_array(image.read())
-            faces = _face_detect_and_align(image_np)
-
-            # ... (Lógica de detección de rostros y preprocesamiento se mantiene igual)
-
-            if not faces:
-                login_attempt.initial_status = "no_match"
-                login_attempt.save()
-                return Response(
-                    {"detail": "No se detectó ningún rostro en la imagen."},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-            processed_face = _preprocess_for_embedding(faces[0])
-            emb = embedding_model(processed_face)[0].numpy()
-            unknown = emb.tobytes()
-
-            matches_by_user = {}
-            for user in app.end_users.filter(deleted=False):
-                match, dist = FacialRecognitionService.compare_faces(
-                    user.face_encoding,
-                    unknown,
-                    threshold=app.FALLBACK_THRESHOLD,
-                )
-                if match:
-                    user_id = user.id
-                    if (
-                        user_id not in matches_by_user
-                        or dist < matches_by_user[user_id]["distance"]
-                    ):
-                        matches_by_user[user_id] = {"user": user, "distance": dist}
-
-            if not matches_by_user:
-                login_attempt.initial_status = "no_match"
-                login_attempt.save()
-                return Response(
-                    {"detail": "Rostro no reconocido"},
-                    status=status.HTTP_401_UNAUTHORIZED,
-                )
-
-            matches = sorted(matches_by_user.values(), key=lambda x: x["distance"])
-            best_match = matches[0]
-
-            login_attempt.best_match_user = best_match["user"]
-            login_attempt.best_match_distance = best_match["distance"]
-
-            if best_match["distance"] <= app.CONFIDENCE_THRESHOLD:
-                # Si hay un match de alta confianza, se registra como intento 'success'.
-                # La verificación final y el campo 'is_verified_and_correct'
-                # se actualizarán con el feedback del usuario.
-                login_attempt.initial_status = "success"
-                login_attempt.save()
-                return Response(
-                    {
-                        "status": "success",
-                        "user": EndUserSerializer(best_match["user"]).data,
-                        "message": "Ingreso facial exitoso. ¿Es usted?",
-                        "confidence": round(1 - best_match["distance"], 3),
-                        "login_attempt_id": login_attempt.id,
-                    },
-                    status=status.HTTP_200_OK,
-                )
-            else:
-                # El resto de la lógica para 'ambiguous_match' se mantiene igual
-                login_attempt.initial_status = "ambiguous_match"
-                login_attempt.save()
-                ambiguous_matches = [
-                    {
-                        "id": m["user"].id,
-                        "full_name": m["user"].full_name,
-                        "distance": m["distance"],
-                    }
-                    for m in matches
-                ]
-                return Response(
-                    {
-                        "status": "ambiguous_match",
-                        "matches": ambiguous_matches,
-                        "detail": "Múltiples coincidencias, se requiere confirmación del usuario.",
-                        "login_attempt_id": login_attempt.id,
-                    },
-                    status=status.HTTP_200_OK,
-                )
+            burst = _run_burst(
+                app_scope(app.id),
+                frames,
+                request_deadline(request),
+                lambda detections: _match_end_users(app, detections),
+                app.CONFIDENCE_THRESHOLD,
+            )
+            response = _finish_end_user_login(app, login_attempt, burst.detections())
+            return _with_burst_stats(response, burst)
+        except InferenceOverloadedError:
+            # El intento no llegó a evaluarse: no se registra para no contar en las métricas
+            raise
         except Exception as e:
-            # ... (Manejo de errores se mantiene igual)
+            return _login_error_response(login_attempt, e)
+
+
+def _load_end_user_feedback(data, face_image, app_token):
+    """
+    Valida el feedback de un EndUser y resuelve la app, el intento y el usuario.
+    Devuelve (app, login_attempt, end_user, None) si hay que procesar la imagen,
+    o (None, None, None, response) si el feedback ya quedó resuelto o es inválido.
+    """
+    login_attempt_id = data.get("login_attempt_id")
+    feedback_decision = data.get("feedback_decision")  # 'correcto' o 'incorrecto'
+
+    # Validar que los campos esenciales para cualquier feedback estén presentes
+    if not login_attempt_id:
+        return None, None, None, Response(
+            {"detail": "login_attempt_id es requerido."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if feedback_decision not in ["correcto", "incorrecto"]:
+        return None, None, None, Response(
+            {"detail": "feedback_decision debe ser 'correcto' o 'incorrecto'."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        app = get_app_by_token(app_token)
+    except ClientApp.DoesNotExist:
+        return None, None, None, Response(
+            {"detail": "Token de aplicación inválido"},
+            status=status.HTTP_403_FORBIDDEN,
+        )
 
-            import traceback
+    try:
+        login_attempt = attempt_log.find_attempt(
+            EndUserLoginAttempt.objects.all(), id=login_attempt_id, app=app
+        )
+    except EndUserLoginAttempt.DoesNotExist:
+        return None, None, None, Response(
+            {
+                "detail": "Intento de login no encontrado o no pertenece a esta aplicación."
+            },
+            status=status.HTTP_404_NOT_FOUND,
+        )
 
-            traceback.print_exc()
-            login_attempt.initial_status = "error"
-            login_attempt.save()
+    # --- Lógica para manejar el feedback 'incorrecto' ---
+    if feedback_decision == "incorrecto":
+        with transaction.atomic():
+            login_attempt.user_feedback = "incorrecto"
+            login_attempt.is_verified_and_correct = (
+                False  # Marcar como falso positivo/negativo corregido
+            )
+            login_attempt.save(
+                update_fields=["user_feedback", "is_verified_and_correct"]
+            )
+        return None, None, None, Response(
+            {"message": "Feedback de 'incorrecto' registrado. Intente nuevamente."},
+            status=status.HTTP_200_OK,
+        )
+
+    # --- Lógica para manejar el feedback 'correcto' ---
+    # Si el feedback es 'correcto', entonces 'user_id' y 'password' son obligatorios
+    user_id = data.get("user_id")
+    password = data.get("password")
+
+    if not user_id:
+        return None, None, None, Response(
+            {"detail": "user_id es requerido para feedback 'correcto'."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if not password:
+        return None, None, None, Response(
+            {"detail": "Contraseña es requerida para feedback 'correcto'."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    # La imagen es necesaria para actualizar el embedding
+    if not face_image:
+        return None, None, None, Response(
+            {"detail": "Imagen de rostro es requerida para feedback 'correcto'."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    rejected = _rejected_image_response(face_image)
+    if rejected:
+        return None, None, None, rejected
+
+    try:
+        end_user = EndUser.objects.get(id=user_id, app=app)
+    except EndUser.DoesNotExist:
+        return None, None, None, Response(
+            {"detail": "Usuario final no encontrado para esta aplicación."},
+            status=status.HTTP_404_NOT_FOUND,
+        )
+
+    # Lógica de verificación de contraseña del EndUser
+    if end_user.password:  # Si el usuario tiene contraseña configurada
+        if not end_user.password == password:  # Comparación directa para el EndUser
+            return None, None, None, Response(
+                {"detail": "Contraseña incorrecta para el usuario final."},
+                status=status.HTTP_401_UNAUTHORIZED,
+            )
+    else:  # Si el usuario no tiene contraseña configurada, y se envió una, es un error
+        if password:
+            return None, None, None, Response(
+                {
+                    "detail": "Este usuario final no requiere contraseña para confirmación."
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+    return app, login_attempt, end_user, None
+
+
+def _store_end_user_feedback(app, login_attempt, end_user, face_image, detection):
+    """Actualiza el embedding del EndUser con el feedback 'correcto' ya procesado."""
+    with transaction.atomic():
+        if not detection:
             return Response(
-                {"detail": f"Error interno del servidor: {str(e)}"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                {"detail": "No se detectó un rostro en la imagen de feedback."},
+                status=status.HTTP_400_BAD_REQUEST,
             )
 
+        new_embedding = detection["embedding"]
+
+        end_user.face_encoding = new_embedding.tobytes()
+        end_user.embedding_model_version = current_model_version()
+        end_user.save(update_fields=["face_encoding", "embedding_model_version"])
+
+        EndUserFeedback.objects.create(
+            end_user=end_user,
+            app=app,
+            submitted_image=attach_face_box(face_image, detection),
+            feedback_type="confirmed_login",
+        )
+
+        # Actualizar el registro de intento de login
+        login_attempt.confirmed_by_feedback = end_user
+        login_attempt.attempting_end_user = end_user
+        login_attempt.user_feedback = "correcto"
+        login_attempt.is_verified_and_correct = True
+        login_attempt.save(
+            update_fields=[
+                "confirmed_by_feedback",
+                "attempting_end_user",
+                "user_feedback",
+                "is_verified_and_correct",
+            ]
+        )
+
+        return Response(
+            {
+                "user": EndUserSerializer(end_user).data,
+                "message": "Feedback procesado y perfil de usuario final actualizado.",
+            },
+            status=status.HTTP_200_OK,
+        )
+
 
 class EndUserFaceFeedbackView(APIView):
     """
@@ -558,144 +925,233 @@ class EndUserFaceFeedbackView(APIView):
     permission_classes = [permissions.AllowAny]
 
     def post(self, request, app_token):
-        login_attempt_id = request.data.get("login_attempt_id")
-        feedback_decision = request.data.get(
-            "feedback_decision"
-        )  # 'correcto' o 'incorrecto'
+        face_image = request.FILES.get("face_image")
+        app, login_attempt, end_user, response = _load_end_user_feedback(
+            request.data, face_image, app_token
+        )
+        if response:
+            return response
 
-        # Validar que los campos esenciales para cualquier feedback estén presentes
-        if not login_attempt_id:
-            return Response(
-                {"detail": "login_attempt_id es requerido."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-        if feedback_decision not in ["correcto", "incorrecto"]:
-            return Response(
-                {"detail": "feedback_decision debe ser 'correcto' o 'incorrecto'."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+        detection = _embed_image_bytes(
+            face_image.read(), deadline=request_deadline(request)
+        )
+        return _store_end_user_feedback(
+            app, login_attempt, end_user, face_image, detection
+        )
 
+
+class ClientAppCalibrationView(APIView):
+    """
+    FAR/FRR y reparto success/ambiguous/no_match de una rejilla de umbrales,
+    calculados con los intentos con feedback de la app (ver `auth_api.calibration`).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
         try:
-            app = ClientApp.objects.get(token=app_token)
+            app = ClientApp.objects.get(id=pk, owner=request.user)
         except ClientApp.DoesNotExist:
             return Response(
-                {"detail": "Token de aplicación inválido"},
-                status=status.HTTP_403_FORBIDDEN,
+                {"detail": "App not found"}, status=status.HTTP_404_NOT_FOUND
             )
 
+        serializer = ThresholdCalibrationSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(calibrate(app, **serializer.validated_data), status=status.HTTP_200_OK)
+
+
+class EndUserListView(APIView):
+    """
+    EndUsers activos de la app, paginados por cursor sobre (created_at, id).
+    Filtros opcionales: `role` (exacto) y `email` (prefijo); `page_size` y `cursor`.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, app_id):
         try:
-            login_attempt = EndUserLoginAttempt.objects.get(
-                id=login_attempt_id, app=app
-            )
-        except EndUserLoginAttempt.DoesNotExist:
+            app = ClientApp.objects.get(id=app_id, owner=request.user)
+        except ClientApp.DoesNotExist:
             return Response(
-                {
-                    "detail": "Intento de login no encontrado o no pertenece a esta aplicación."
-                },
-                status=status.HTTP_404_NOT_FOUND,
+                {"detail": "App not found"}, status=status.HTTP_404_NOT_FOUND
             )
 
-        # --- Lógica para manejar el feedback 'incorrecto' ---
-        if feedback_decision == "incorrecto":
-            with transaction.atomic():
-                login_attempt.user_feedback = "incorrecto"
-                login_attempt.is_verified_and_correct = (
-                    False  # Marcar como falso positivo/negativo corregido
-                )
-                login_attempt.save()
-            return Response(
-                {"message": "Feedback de 'incorrecto' registrado. Intente nuevamente."},
-                status=status.HTTP_200_OK,
+        query = EndUserListQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query.validated_data
+
+        # Solo las columnas que usa EndUserSerializer: face_encoding no se carga
+        end_users = app.end_users.filter(deleted=False).only(*EndUserSerializer.Meta.fields)
+        if params.get("role"):
+            end_users = end_users.filter(role=params["role"])
+        if params.get("email"):
+            end_users = end_users.filter(email__istartswith=params["email"])
+
+        page, next_cursor = keyset_page(
+            end_users,
+            params.get("cursor"),
+            params.get("page_size", settings.FACE_ENDUSER_PAGE_SIZE),
+        )
+        next_url = None
+        if next_cursor:
+            next_url = replace_query_param(
+                request.build_absolute_uri(), "cursor", next_cursor
             )
+        return Response(
+            {"next": next_url, "results": EndUserSerializer(page, many=True).data},
+            status=status.HTTP_200_OK,
+        )
 
-        # --- Lógica para manejar el feedback 'correcto' ---
-        # Si el feedback es 'correcto', entonces 'user_id' y 'password' son obligatorios
-        user_id = request.data.get("user_id")
-        password = request.data.get("password")
-        face_image = request.FILES.get(
-            "face_image"
-        )  # La imagen es necesaria para actualizar el embedding
 
-        if not user_id:
-            return Response(
-                {"detail": "user_id es requerido para feedback 'correcto'."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-        if not password:
-            return Response(
-                {"detail": "Contraseña es requerida para feedback 'correcto'."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-        if not face_image:
+def _ndjson_stream(results):
+    """Serializa los resultados como NDJSON; un error inesperado se informa como última línea."""
+    try:
+        for result in results:
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+    except Exception as e:
+        traceback.print_exception(e)
+        yield json.dumps(
+            {"status": "error", "detail": "Ocurrió un error inesperado; la inscripción se detuvo."},
+            ensure_ascii=False,
+        ) + "\n"
+
+
+async def _aiterate(lines):
+    """
+    Recorre un generador síncrono desde un iterador asíncrono: bajo ASGI, Django 4.2
+    acumula en memoria los iteradores síncronos de StreamingHttpResponse.
+    """
+    lines = iter(lines)
+    done = object()
+    while True:
+        line = await sync_to_async(next)(lines, done)
+        if line is done:
+            return
+        yield line
+
+
+class EndUserBulkRegisterView(APIView):
+    """
+    Inscripción masiva de EndUsers desde un ZIP (imágenes + manifest.csv/json).
+    Devuelve un resultado por fila en NDJSON a medida que se procesa cada lote.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, app_id):
+        try:
+            app = ClientApp.objects.get(id=app_id, owner=request.user)
+        except ClientApp.DoesNotExist:
             return Response(
-                {"detail": "Imagen de rostro es requerida para feedback 'correcto'."},
-                status=status.HTTP_400_BAD_REQUEST,
+                {"detail": "App not found"}, status=status.HTTP_404_NOT_FOUND
             )
 
+        serializer = EndUserBulkRegistrationSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            archive, rows = open_archive(serializer.validated_data["archive"])
+        except ValidationError as e:
+            return Response({"detail": e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        enrollment = BulkEnrollment(
+            app, archive, force_register=serializer.validated_data["force_register"]
+        )
+        lines = _ndjson_stream(enrollment.run(rows))
+        if is_asgi(request):
+            lines = _aiterate(lines)
+        return StreamingHttpResponse(lines, content_type="application/x-ndjson")
+
+
+class _EndUserBulkActionView(APIView):
+    """
+    Base de las operaciones en bloque sobre los EndUsers de una app. El cuerpo
+    lleva `ids` y/o los filtros `role` y `email` (prefijo).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    action = None
+    result_key = None
+
+    def post(self, request, app_id):
         try:
-            end_user = EndUser.objects.get(id=user_id, app=app)
-        except EndUser.DoesNotExist:
+            app = ClientApp.objects.get(id=app_id, owner=request.user)
+        except ClientApp.DoesNotExist:
             return Response(
-                {"detail": "Usuario final no encontrado para esta aplicación."},
-                status=status.HTTP_404_NOT_FOUND,
+                {"detail": "App not found"}, status=status.HTTP_404_NOT_FOUND
             )
 
-        # Lógica de verificación de contraseña del EndUser
-        if end_user.password:  # Si el usuario tiene contraseña configurada
-            if not end_user.password == password:  # Comparación directa para el EndUser
-                return Response(
-                    {"detail": "Contraseña incorrecta para el usuario final."},
-                    status=status.HTTP_401_UNAUTHORIZED,
-                )
-        else:  # Si el usuario no tiene contraseña configurada, y se envió una, es un error
-            if password:
-                return Response(
-                    {
-                        "detail": "Este usuario final no requiere contraseña para confirmación."
-                    },
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
+        serializer = EndUserBulkActionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        end_users = end_user_bulk.select_end_users(app, **serializer.validated_data)
+        count = self.action(app, end_users)
+        return Response({self.result_key: count}, status=status.HTTP_200_OK)
+
+
+class EndUserBulkDeleteView(_EndUserBulkActionView):
+    """Baja lógica (soft delete) de los EndUsers seleccionados."""
+    action = staticmethod(end_user_bulk.soft_delete)
+    result_key = "deleted"
+
+
+class EndUserBulkRestoreView(_EndUserBulkActionView):
+    """Restaura los EndUsers seleccionados que estaban dados de baja."""
+    action = staticmethod(end_user_bulk.restore)
+    result_key = "restored"
 
-        with transaction.atomic():
-            img_np = _bytes_to_array(face_image.read())
-            faces = _face_detect_and_align(img_np)
-
-            if not faces:
-                return Response(
-                    {"detail": "No se detectó un rostro en la imagen de feedback."},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-            processed_face_for_embedding = _preprocess_for_embedding(faces[0])
-            new_embedding = embedding_model(processed_face_for_embedding)[0].numpy()
-
-            end_user.face_encoding = new_embedding.tobytes()
-            end_user.save(update_fields=["face_encoding"])
-
-            EndUserFeedback.objects.create(
-                end_user=end_user,
-                app=app,
-                submitted_image=face_image,
-                feedback_type="confirmed_login",
-            )
 
-            # Actualizar el registro de intento de login
-            login_attempt.confirmed_by_feedback = end_user
-            login_attempt.attempting_end_user = end_user
-            login_attempt.user_feedback = "correcto"
-            login_attempt.is_verified_and_correct = True
-            login_attempt.save()
+class EndUserBulkPurgeView(_EndUserBulkActionView):
+    """Borra definitivamente los EndUsers seleccionados que ya estaban dados de baja."""
+    action = staticmethod(end_user_bulk.purge)
+    result_key = "purged"
 
+
+def _in_date_range(queryset, field, params):
+    if params.get("since"):
+        queryset = queryset.filter(**{f"{field}__gte": params["since"]})
+    if params.get("until"):
+        queryset = queryset.filter(**{f"{field}__lt": params["until"]})
+    return queryset
+
+
+class LoginAttemptExportView(APIView):
+    """
+    Exporta en streaming los intentos de login de la app (`fmt=csv|ndjson`),
+    opcionalmente entre `since` y `until`, en orden cronológico.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, app_id):
+        try:
+            app = ClientApp.objects.get(id=app_id, owner=request.user)
+        except ClientApp.DoesNotExist:
             return Response(
-                {
-                    "user": EndUserSerializer(end_user).data,
-                    "message": "Feedback procesado y perfil de usuario final actualizado.",
-                },
-                status=status.HTTP_200_OK,
+                {"detail": "App not found"}, status=status.HTTP_404_NOT_FOUND
             )
 
+        query = ExportQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query.validated_data
+
+        attempts = _in_date_range(app.login_attempts.all(), "timestamp", params)
+        return export_response(
+            attempts.order_by("timestamp", "id"),
+            LOGIN_ATTEMPT_FIELDS,
+            params["fmt"],
+            f"app-{app.id}-login-attempts",
+            asynchronous=is_asgi(request),
+        )
 
-class EndUserListView(APIView):
+
+class EndUserExportView(APIView):
+    """
+    Exporta en streaming los EndUsers activos de la app (`fmt=csv|ndjson`),
+    opcionalmente dados de alta entre `since` y `until`.
+    """
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, app_id):
@@ -706,9 +1162,19 @@ class EndUserListView(APIView):
                 {"detail": "App not found"}, status=status.HTTP_404_NOT_FOUND
             )
 
-        end_users = app.end_users.filter(deleted=False)
-        serializer = EndUserSerializer(end_users, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        query = ExportQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query.validated_data
+
+        end_users = _in_date_range(app.end_users.filter(deleted=False), "created_at", params)
+        return export_response(
+            end_users.order_by("created_at", "id"),
+            END_USER_FIELDS,
+            params["fmt"],
+            f"app-{app.id}-users",
+            asynchronous=is_asgi(request),
+        )
 
 
 class EndUserDeleteView(APIView):
@@ -722,15 +1188,26 @@ class EndUserDeleteView(APIView):
                 {"detail": "App not found"}, status=status.HTTP_404_NOT_FOUND
             )
 
-        try:
-            user = app.end_users.get(id=user_id)
-        except EndUser.DoesNotExist:
+        end_users = end_user_bulk.select_end_users(app, ids=[user_id])
+        if not end_users.exists():
             return Response(
                 {"detail": "User not found"}, status=status.HTTP_404_NOT_FOUND
             )
 
-        user.deleted = True
-        user.save()
+        # Mismo camino que la baja en bloque: un UPDATE y una sola invalidación
+        end_user_bulk.soft_delete(app, end_users)
         return Response(
             {"message": "User deleted (soft)"}, status=status.HTTP_204_NO_CONTENT
         )
+
+
+class FaceMetricsView(APIView):
+    """Contadores operativos del reconocimiento facial (solo personal administrativo)."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        counters = metrics.snapshot()
+        return Response(
+            {"counters": counters, "detector": metrics.detector_summary(counters)},
+            status=status.HTTP_200_OK,
+        )
@@ -174,6 +174,10 @@ if not DEBUG:
 # Media files
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
+# Caché en disco de las miniaturas del admin (se puede borrar en cualquier momento)
+FACE_THUMBNAIL_ROOT = os.environ.get(
+    "FACE_THUMBNAIL_ROOT", os.path.join(BASE_DIR, "cache", "thumbnails")
+)
 
 # REST Framework
 REST_FRAMEWORK = {
@@ -213,3 +217,132 @@ CSRF_COOKIE_SAMESITE = "None"
 CSRF_COOKIE_SECURE = True
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# Reconocimiento facial
+# Política para elegir el rostro cuando la imagen tiene varias detecciones:
+# "score" (mayor puntuación), "area" (rostro más grande) o "center" (más centrado)
+FACE_SELECTION_POLICY = os.environ.get("FACE_SELECTION_POLICY", "score")
+
+# Versión de los modelos de detección + embedding (ver MODEL_REGISTRY en
+# facial_auth_app/services.py). Cada embedding guardado queda etiquetado con ella.
+FACE_MODEL_VERSION = os.environ.get("FACE_MODEL_VERSION", "v1")
+# Durante una migración de modelo, versión anterior que se mantiene cargada: mientras
+# queden embeddings suyos, la sonda del login también se calcula con ese modelo.
+FACE_PREVIOUS_MODEL_VERSION = os.environ.get("FACE_PREVIOUS_MODEL_VERSION", "")
+# Galerías de embeddings (system y una por ClientApp) que cada proceso mantiene en memoria
+FACE_GALLERY_CACHE_SCOPES = int(os.environ.get("FACE_GALLERY_CACHE_SCOPES", 64))
+# Primera pasada de detección con el clasificador Haar (versiones con "cascade"): lado
+# máximo de la imagen reducida, tamaño mínimo del rostro relativo a la imagen y peso
+# mínimo del clasificador para aceptar el camino rápido sin Faster R-CNN
+FACE_CASCADE_MAX_SIDE = int(os.environ.get("FACE_CASCADE_MAX_SIDE", 480))
+FACE_CASCADE_MIN_FACE_RATIO = float(os.environ.get("FACE_CASCADE_MIN_FACE_RATIO", 0.2))
+FACE_CASCADE_MIN_WEIGHT = float(os.environ.get("FACE_CASCADE_MIN_WEIGHT", 3.0))
+
+# Caché de embeddings por hash de la imagen subida (reintentos y feedback reutilizan
+# la inferencia). Por defecto es local a cada worker; para compartirla entre workers
+# basta con apuntar el backend a Redis o Memcached, que aplican su propia expulsión.
+FACE_EMBEDDING_CACHE_ALIAS = "face_embeddings"
+FACE_EMBEDDING_CACHE_BACKEND = os.environ.get(
+    "FACE_EMBEDDING_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+)
+
+# Caché de ClientApp por token para los endpoints públicos de EndUsers. Se invalida
+# al guardar o borrar la app; con LocMemCache los demás workers la renuevan al vencer
+# el TTL (segundos).
+FACE_CLIENT_APP_CACHE_ALIAS = "client_apps"
+FACE_CLIENT_APP_CACHE_BACKEND = os.environ.get(
+    "FACE_CLIENT_APP_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+)
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    FACE_EMBEDDING_CACHE_ALIAS: {
+        "BACKEND": FACE_EMBEDDING_CACHE_BACKEND,
+        "LOCATION": os.environ.get("FACE_EMBEDDING_CACHE_LOCATION", "face-embeddings"),
+        "TIMEOUT": int(os.environ.get("FACE_EMBEDDING_CACHE_TTL", 600)),
+    },
+    FACE_CLIENT_APP_CACHE_ALIAS: {
+        "BACKEND": FACE_CLIENT_APP_CACHE_BACKEND,
+        "LOCATION": os.environ.get("FACE_CLIENT_APP_CACHE_LOCATION", "client-apps"),
+        "TIMEOUT": int(os.environ.get("FACE_CLIENT_APP_CACHE_TTL", 60)),
+    },
+}
+
+if FACE_EMBEDDING_CACHE_BACKEND.endswith("LocMemCache"):
+    CACHES[FACE_EMBEDDING_CACHE_ALIAS]["OPTIONS"] = {
+        "MAX_ENTRIES": int(os.environ.get("FACE_EMBEDDING_CACHE_MAX_ENTRIES", 500)),
+    }
+
+# Número máximo de inferencias simultáneas por proceso (executor async y admisión)
+FACE_INFERENCE_MAX_WORKERS = int(os.environ.get("FACE_INFERENCE_MAX_WORKERS", 2))
+# Sirve login, registro y feedback facial con las vistas async (requiere ASGI, p. ej. uvicorn)
+FACE_AUTH_ASYNC_VIEWS = os.environ.get("FACE_AUTH_ASYNC_VIEWS", "false").lower() == "true"
+# Procesos dedicados a la inferencia (0 = inferencia dentro del proceso web)
+FACE_INFERENCE_POOL_SIZE = int(os.environ.get("FACE_INFERENCE_POOL_SIZE", 0))
+# Control de admisión: tamaño máximo de la cola de inferencia, espera estimada máxima
+# (s) antes de responder 503 y deadline (s) tras el cual un trabajo en cola se descarta.
+# El deadline debe quedar por debajo del --timeout de gunicorn (0 lo desactiva).
+FACE_INFERENCE_MAX_QUEUE = int(os.environ.get("FACE_INFERENCE_MAX_QUEUE", 8))
+FACE_INFERENCE_MAX_WAIT = float(os.environ.get("FACE_INFERENCE_MAX_WAIT", 30))
+FACE_INFERENCE_DEADLINE = float(os.environ.get("FACE_INFERENCE_DEADLINE", 60))
+
+# Límites de las imágenes subidas, comprobados leyendo solo la cabecera: se rechazan
+# las que superan MAX_BYTES o MAX_PIXELS y se reducen al decodificar las que superan
+# DOWNSCALE_PIXELS (la detección trabaja a 640x640, no se pierde información útil).
+FACE_IMAGE_MAX_BYTES = int(os.environ.get("FACE_IMAGE_MAX_BYTES", 10 * 1024 * 1024))
+FACE_IMAGE_MAX_PIXELS = int(os.environ.get("FACE_IMAGE_MAX_PIXELS", 40_000_000))
+FACE_IMAGE_DOWNSCALE_PIXELS = int(os.environ.get("FACE_IMAGE_DOWNSCALE_PIXELS", 4_000_000))
+
+# Inscripción masiva de EndUsers: imágenes por lote de inferencia, filas máximas por
+# archivo y segundos que un lote espera turno de inferencia antes de detenerla
+FACE_BULK_ENROLL_BATCH_SIZE = int(os.environ.get("FACE_BULK_ENROLL_BATCH_SIZE", 16))
+FACE_BULK_ENROLL_MAX_ITEMS = int(os.environ.get("FACE_BULK_ENROLL_MAX_ITEMS", 5000))
+FACE_BULK_ENROLL_MAX_WAIT = float(os.environ.get("FACE_BULK_ENROLL_MAX_WAIT", 60))
+
+# Login por ráfaga: fotogramas máximos por petición y distancia coseno a partir de la
+# cual se considera que la cara se movió y se vuelve a ejecutar el detector
+FACE_BURST_MAX_FRAMES = int(os.environ.get("FACE_BURST_MAX_FRAMES", 5))
+FACE_BURST_REDETECT_DISTANCE = float(os.environ.get("FACE_BURST_REDETECT_DISTANCE", 0.35))
+
+# Escritura en segundo plano de las imágenes de los intentos de login (0 hilos = en la petición)
+FACE_IMAGE_WRITER_THREADS = int(os.environ.get("FACE_IMAGE_WRITER_THREADS", 1))
+FACE_IMAGE_WRITER_QUEUE = int(os.environ.get("FACE_IMAGE_WRITER_QUEUE", 64))
+FACE_IMAGE_WRITER_RETRIES = int(os.environ.get("FACE_IMAGE_WRITER_RETRIES", 3))
+FACE_IMAGE_WRITER_FLUSH_TIMEOUT = float(os.environ.get("FACE_IMAGE_WRITER_FLUSH_TIMEOUT", 10))
+
+# Registro de intentos de login: con más de 1 y PostgreSQL se insertan en lotes con
+# bulk_create (ids reservados de la secuencia); con 1 se inserta uno por petición
+FACE_LOGIN_ATTEMPT_BATCH_SIZE = int(os.environ.get("FACE_LOGIN_ATTEMPT_BATCH_SIZE", 1))
+FACE_LOGIN_ATTEMPT_FLUSH_SECONDS = float(os.environ.get("FACE_LOGIN_ATTEMPT_FLUSH_SECONDS", 1))
+
+# Imágenes de rostro guardadas: copia re-codificada y reducida en lugar del archivo subido.
+# Calidad por modelo ("app.Modelo"); los modelos de FACE_STORED_IMAGE_FACE_CROP guardan
+# solo el rostro con un margen proporcional a su caja
+FACE_STORED_IMAGE_FORMAT = os.environ.get("FACE_STORED_IMAGE_FORMAT", "WEBP")
+FACE_STORED_IMAGE_MAX_SIDE = int(os.environ.get("FACE_STORED_IMAGE_MAX_SIDE", 640))
+FACE_STORED_IMAGE_QUALITY = int(os.environ.get("FACE_STORED_IMAGE_QUALITY", 85))
+# Ej.: {"auth_api.EndUserLoginAttempt": 70}. Con calidades distintas, la misma imagen
+# guardada por dos modelos ya no se deduplica en el almacén
+FACE_STORED_IMAGE_QUALITY_BY_MODEL = {}
+FACE_STORED_IMAGE_FACE_CROP = [
+    label
+    for label in os.environ.get("FACE_STORED_IMAGE_FACE_CROP", "").split(",")
+    if label
+]
+FACE_STORED_IMAGE_CROP_MARGIN = float(os.environ.get("FACE_STORED_IMAGE_CROP_MARGIN", 0.5))
+
+# Días que se conservan los intentos de login de CustomUser (0 = sin límite). Los de
+# EndUser se configuran por app en ClientApp.login_attempt_retention_days
+FACE_CUSTOMUSER_ATTEMPT_RETENTION_DAYS = int(os.environ.get("FACE_CUSTOMUSER_ATTEMPT_RETENTION_DAYS", 0))
+
+# Imágenes de rostro en el almacén direccionado por contenido (deduplicado entre modelos)
+FACE_MEDIA_CONTENT_ADDRESSED = os.environ.get("FACE_MEDIA_CONTENT_ADDRESSED", "true").lower() == "true"
+
+# Listado de EndUsers: tamaño de página por defecto y máximo que puede pedir el cliente
+FACE_ENDUSER_PAGE_SIZE = int(os.environ.get("FACE_ENDUSER_PAGE_SIZE", 100))
+FACE_ENDUSER_MAX_PAGE_SIZE = int(os.environ.get("FACE_ENDUSER_MAX_PAGE_SIZE", 1000))
+
+# Filas que se leen de la base de datos por lote en las exportaciones CSV/NDJSON
+FACE_EXPORT_CHUNK_SIZE = int(os.environ.get("FACE_EXPORT_CHUNK_SIZE", 2000))
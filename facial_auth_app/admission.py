@@ -0,0 +1,160 @@
+"""
+Control de admisión para la inferencia facial.
+
+Lleva la cuenta de las inferencias en curso y en cola de este proceso, estima la
+espera con un promedio móvil del tiempo de servicio y rechaza con 503 +
+Retry-After cuando la cola supera FACE_INFERENCE_MAX_QUEUE o la espera estimada
+supera FACE_INFERENCE_MAX_WAIT. Los trabajos cuyo deadline ya pasó cuando les
+toca turno se descartan antes de ejecutar la detección.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class InferenceOverloadedError(APIException):
+    """La cola de inferencia está llena o la espera estimada supera el límite."""
+
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = (
+        "El servicio de reconocimiento facial está saturado. Intenta de nuevo en unos segundos."
+    )
+    default_code = "inference_overloaded"
+
+    def __init__(self, wait, detail=None):
+        super().__init__(detail)
+        # DRF envía `wait` como cabecera Retry-After
+        self.wait = max(1, math.ceil(wait))
+
+
+class InferenceDeadlineExceededError(InferenceOverloadedError):
+    """El trabajo esperó más que su deadline y se descartó antes de la detección."""
+
+    default_detail = "La solicitud expiró mientras esperaba turno para el reconocimiento facial."
+    default_code = "inference_deadline_exceeded"
+
+
+class _Ticket:
+    __slots__ = ("deadline", "queued", "jobs")
+
+    def __init__(self, deadline, jobs=1):
+        self.deadline = deadline
+        self.queued = True
+        # Imágenes que procesa el ticket (los lotes cuentan como varias)
+        self.jobs = jobs
+
+
+class InferenceAdmission:
+    def __init__(self, concurrency, max_queue, max_wait, initial_service_time=2.0):
+        self.concurrency = max(concurrency, 1)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.avg_service_time = initial_service_time
+        self.queued = 0
+        self.in_flight = 0
+        self.stats = {"admitted": 0, "rejected": 0, "expired": 0}
+        self._slots = threading.Semaphore(self.concurrency)
+        self._lock = threading.Lock()
+
+    def estimated_wait(self) -> float:
+        """Segundos que esperaría un trabajo nuevo hasta terminar, según la carga actual."""
+        pending = self.queued + self.in_flight
+        return (pending + 1) * self.avg_service_time / self.concurrency
+
+    def enqueue(self, deadline=None, jobs=1) -> _Ticket:
+        """Reserva un lugar en la cola o lanza InferenceOverloadedError."""
+        with self._lock:
+            wait = self.estimated_wait()
+            if self.queued >= self.max_queue or wait > self.max_wait:
+                self.stats["rejected"] += 1
+                raise InferenceOverloadedError(wait)
+            self.queued += 1
+        return _Ticket(deadline, jobs)
+
+    def leave_queue(self, ticket: _Ticket) -> None:
+        """Saca el ticket de la cola; es idempotente para poder llamarlo al cancelar."""
+        with self._lock:
+            if ticket.queued:
+                ticket.queued = False
+                self.queued -= 1
+
+    @contextmanager
+    def run(self, ticket: _Ticket):
+        """Espera un turno de inferencia para el ticket respetando su deadline."""
+        timeout = None
+        if ticket.deadline is not None:
+            timeout = max(ticket.deadline - time.monotonic(), 0)
+        acquired = self._slots.acquire(timeout=timeout)
+        self.leave_queue(ticket)
+
+        if not acquired or (
+            ticket.deadline is not None and time.monotonic() >= ticket.deadline
+        ):
+            if acquired:
+                self._slots.release()
+            with self._lock:
+                self.stats["expired"] += 1
+            raise InferenceDeadlineExceededError(self.estimated_wait())
+
+        with self._lock:
+            self.in_flight += 1
+            self.stats["admitted"] += 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            with self._lock:
+                self.in_flight -= 1
+                per_job = elapsed / ticket.jobs
+                self.avg_service_time = 0.8 * self.avg_service_time + 0.2 * per_job
+            self._slots.release()
+
+    @contextmanager
+    def admit(self, deadline=None, jobs=1):
+        """Encola y ejecuta en un solo paso (camino síncrono)."""
+        ticket = self.enqueue(deadline, jobs)
+        try:
+            with self.run(ticket):
+                yield
+        finally:
+            self.leave_queue(ticket)
+
+
+def request_deadline(request):
+    """
+    Deadline (reloj monotónico) para la inferencia de una petición: FACE_INFERENCE_DEADLINE
+    segundos desde su llegada. Si el proxy envía X-Request-Start (t=<epoch> en s, ms o µs)
+    se cuenta desde ahí, incluyendo el tiempo que la petición pasó encolada antes de Django.
+    """
+    budget = settings.FACE_INFERENCE_DEADLINE
+    if not budget:
+        return None
+
+    elapsed = 0.0
+    header = request.META.get("HTTP_X_REQUEST_START", "")
+    try:
+        started = float(header.removeprefix("t="))
+    except ValueError:
+        started = None
+    if started:
+        # Normalizamos micro y milisegundos a segundos
+        if started > 1e14:
+            started /= 1e6
+        elif started > 1e11:
+            started /= 1e3
+        elapsed = max(time.time() - started, 0.0)
+
+    return time.monotonic() + budget - elapsed
+
+
+inference_admission = InferenceAdmission(
+    concurrency=settings.FACE_INFERENCE_MAX_WORKERS,
+    max_queue=settings.FACE_INFERENCE_MAX_QUEUE,
+    max_wait=settings.FACE_INFERENCE_MAX_WAIT,
+)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class FacialAuthAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'facial_auth_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,119 @@
+"""
+Login facial por ráfaga: varios fotogramas de una misma captura procesados en
+orden de llegada.
+
+Solo el primer fotograma pasa por el detector; los siguientes reutilizan la caja
+del anterior (mismo tamaño de imagen) y van directo al modelo de embedding. Si el
+embedding del fotograma se aleja demasiado de lo acumulado, la cara se movió y se
+vuelve a detectar. Las cajas se guardan por configuración de detector: una
+versión que recorta distinto (p. ej. v1 frente a v1-cascade) usa su propia caja,
+porque sus embeddings solo son comparables con recortes de su mismo detector.
+Las sondas de cada versión de modelo se fusionan promediando los embeddings
+normalizados, de modo que cada fotograma suma evidencia.
+"""
+import numpy as np
+from django.conf import settings
+
+from .admission import inference_admission
+from .inference_pool import get_inference_pool
+from .services import (
+    MODEL_REGISTRY,
+    MODEL_VERSION,
+    _bytes_to_array,
+    _embed_array,
+    exif_transpose_for,
+)
+
+
+def _embed_frame(image_np, version, box, deadline):
+    with inference_admission.admit(deadline):
+        pool = get_inference_pool()
+        if pool is not None:
+            return pool.embed(image_np, version, box)
+        return _embed_array(image_np, version, box)
+
+
+def _detector_key(version):
+    """Versiones con la misma clave producen la misma caja para una imagen."""
+    config = MODEL_REGISTRY[version]
+    return config["detector"], bool(config.get("cascade")), exif_transpose_for(version)
+
+
+def _unit(embedding):
+    embedding = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(embedding)
+    return embedding / norm if norm > 0 else embedding
+
+
+class BurstProbe:
+    def __init__(self, versions, deadline=None):
+        self.versions = versions
+        self.deadline = deadline
+        self.frames = 0
+        self.detector_runs = 0
+        self._boxes = {}
+        self._shape = None
+        self._sums = {}
+        self._counts = {}
+
+    def add_frame(self, img_bytes: bytes) -> None:
+        """Procesa un fotograma y suma su sonda a la evidencia acumulada."""
+        image_np = _bytes_to_array(img_bytes)
+        self.frames += 1
+        if image_np.shape != self._shape:
+            self._boxes = {}
+            self._shape = image_np.shape
+
+        if self._probe(image_np, MODEL_VERSION) is None:
+            return
+        # Las demás versiones reutilizan la caja de su detector (la recién obtenida
+        # si es el mismo que el de la versión activa)
+        for version in self.versions:
+            if version == MODEL_VERSION:
+                continue
+            if exif_transpose_for(version) == exif_transpose_for(MODEL_VERSION):
+                self._probe(image_np, version)
+            else:
+                # Con otra orientación cambian la imagen y las cajas
+                self._probe(_bytes_to_array(img_bytes, version), version)
+
+    def _probe(self, image_np, version):
+        key = _detector_key(version)
+        box = self._boxes.get(key)
+        result = _embed_frame(image_np, version, box, self.deadline)
+        if box is not None and result is not None and self._moved(version, result["embedding"]):
+            box = None
+            result = _embed_frame(image_np, version, None, self.deadline)
+        if box is None:
+            self.detector_runs += 1
+
+        if result is not None:
+            self._boxes[key] = result["box"]
+            self._add(version, result["embedding"])
+        return result
+
+    def _moved(self, version, embedding) -> bool:
+        if not self._counts.get(version):
+            return False
+        fused = _unit(self._sums[version])
+        distance = 1.0 - float(fused @ _unit(embedding))
+        return distance > settings.FACE_BURST_REDETECT_DISTANCE
+
+    def _add(self, version, embedding) -> None:
+        unit = _unit(embedding)
+        if version in self._sums:
+            self._sums[version] = self._sums[version] + unit
+        else:
+            self._sums[version] = unit
+        self._counts[version] = self._counts.get(version, 0) + 1
+
+    def detections(self) -> dict:
+        """Sondas fusionadas con el mismo formato que `_login_probes`: {versión: detección o None}."""
+        return {
+            version: (
+                {"embedding": self._sums[version] / self._counts[version]}
+                if self._counts.get(version)
+                else None
+            )
+            for version in self.versions
+        }
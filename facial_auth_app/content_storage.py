@@ -0,0 +1,107 @@
+"""
+Almacenamiento direccionado por contenido para las imágenes de rostro.
+
+Cada archivo se nombra con el SHA-256 de sus bytes (blobs/ab/cd/<sha>.<ext>), así
+los bytes idénticos se escriben una sola vez aunque los guarden varios modelos
+(p. ej. el feedback y el perfil creado a partir de él). `StoredBlob` cuenta las
+referencias de cada archivo: `save` suma una, `delete` resta una y el archivo solo
+se borra (con sus miniaturas) al quedar sin referencias. Los nombres anteriores (fuera de blobs/) se
+siguen leyendo y se borran como en FileSystemStorage; `migrate_face_media` los
+traslada al almacén.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .thumbnails import delete_thumbnails
+
+BLOB_DIR = "blobs"
+
+
+def is_blob_name(name: str) -> bool:
+    return bool(name) and name.startswith(f"{BLOB_DIR}/")
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def _blob_name(self, name, content) -> str:
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        sha = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return f"{BLOB_DIR}/{sha[:2]}/{sha[2:4]}/{sha}{extension}"
+
+    def _write_blob(self, name, content) -> None:
+        # Escritura atómica: un lector concurrente nunca ve el archivo a medias
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                content.seek(0)
+                for chunk in content.chunks():
+                    f.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp_path, self.file_permissions_mode)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def save(self, name, content, max_length=None):
+        from .models import StoredBlob
+
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        blob_name = self._blob_name(name or content.name, content)
+
+        with transaction.atomic():
+            while True:
+                try:
+                    with transaction.atomic():
+                        StoredBlob.objects.create(name=blob_name, size=content.size, refs=1)
+                    created = True
+                    break
+                except IntegrityError:
+                    pass
+                # Si un delete() concurrente quitó la última referencia entre el
+                # create fallido y el update, la fila ya no existe: se vuelve a crear
+                if StoredBlob.objects.filter(name=blob_name).update(refs=F("refs") + 1):
+                    created = False
+                    break
+            if created or not self.exists(blob_name):
+                self._write_blob(blob_name, content)
+        return blob_name
+
+    def delete(self, name):
+        from .models import StoredBlob
+
+        if not is_blob_name(name):
+            super().delete(name)
+            delete_thumbnails(name)
+            return
+
+        with transaction.atomic():
+            blob = StoredBlob.objects.select_for_update().filter(name=name).first()
+            if blob is not None and blob.refs > 1:
+                StoredBlob.objects.filter(pk=blob.pk).update(refs=F("refs") - 1)
+                return
+            if blob is not None:
+                blob.delete()
+            super().delete(name)
+            delete_thumbnails(name)
+
+
+content_storage = ContentAddressedStorage()
+
+
+def face_image_storage():
+    """Storage de los StoredFaceImageField según FACE_MEDIA_CONTENT_ADDRESSED."""
+    return content_storage if settings.FACE_MEDIA_CONTENT_ADDRESSED else default_storage
@@ -0,0 +1,74 @@
+import hashlib
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+
+
+class EmbeddingCache:
+    """
+    Caché de resultados de inferencia (detección + embedding) indexada por el
+    hash SHA-256 de los bytes subidos.
+
+    Se apoya en el framework de caché de Django: el alias configurado en
+    `FACE_EMBEDDING_CACHE_ALIAS` define el backend, el TTL (`TIMEOUT`) y el
+    límite de entradas, por lo que puede compartirse entre workers usando
+    Redis o Memcached en lugar de la caché en memoria local.
+    """
+
+    KEY_PREFIX = "face-embedding"
+
+    def __init__(self, alias=None):
+        self.alias = alias or settings.FACE_EMBEDDING_CACHE_ALIAS
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def key_for(self, img_bytes: bytes, version: str | None = None) -> str:
+        digest = hashlib.sha256(img_bytes).hexdigest()
+        # La política de selección y la versión del modelo cambian el resultado,
+        # así que forman parte de la clave
+        version = version or settings.FACE_MODEL_VERSION
+        return f"{self.KEY_PREFIX}:{version}:{settings.FACE_SELECTION_POLICY}:{digest}"
+
+    def get(self, key: str):
+        """
+        Devuelve una tupla (encontrado, resultado). El resultado es None cuando
+        la imagen ya se procesó y no se detectó ningún rostro.
+        """
+        return self._from_payload(self.backend.get(key))
+
+    def set(self, key: str, result) -> None:
+        self.backend.set(key, self._to_payload(result))
+
+    async def aget(self, key: str):
+        return self._from_payload(await self.backend.aget(key))
+
+    async def aset(self, key: str, result) -> None:
+        await self.backend.aset(key, self._to_payload(result))
+
+    @staticmethod
+    def _to_payload(result):
+        # Guardamos solo tipos primitivos para que cualquier backend pueda serializarlos
+        if result is None:
+            return {"embedding": None, "box": None, "score": None}
+        return {
+            "embedding": result["embedding"].astype(np.float32).tobytes(),
+            "box": tuple(result["box"]),
+            "score": result["score"],
+        }
+
+    @staticmethod
+    def _from_payload(payload):
+        if payload is None:
+            return False, None
+        if payload["embedding"] is None:
+            return True, None
+        return True, {
+            "embedding": np.frombuffer(payload["embedding"], dtype=np.float32),
+            "box": payload["box"],
+            "score": payload["score"],
+        }
+
+
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,172 @@
+"""
+Galerías de embeddings para la búsqueda 1:N del login facial.
+
+Una galería reúne los embeddings normalizados de un ámbito ("system" para los
+perfiles de los CustomUser, "app:<id>" para los EndUser de una ClientApp),
+separados por versión de modelo: una sonda solo se compara con embeddings de su
+misma versión. Cada proceso guarda las galerías en memoria y las reconstruye
+cuando cambia la revisión del ámbito en `GalleryState`, que se incrementa con
+`bump_gallery` en cada alta, baja o cambio de embedding.
+"""
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from django.db.models import F
+
+from .models import FacialRecognitionProfile, GalleryState
+
+SYSTEM_SCOPE = "system"
+
+
+def app_scope(app_id) -> str:
+    return f"app:{app_id}"
+
+
+_deferred = threading.local()
+
+
+@contextmanager
+def deferred_bumps():
+    """
+    Agrupa los `bump_gallery` del bloque (p. ej. los de las señales de un borrado
+    masivo) en uno solo por ámbito al salir.
+    """
+    if getattr(_deferred, "scopes", None) is not None:
+        yield
+        return
+    _deferred.scopes = set()
+    try:
+        yield
+    finally:
+        scopes, _deferred.scopes = _deferred.scopes, None
+        for scope in scopes:
+            bump_gallery(scope)
+
+
+def bump_gallery(scope: str) -> None:
+    """Invalida las copias en memoria de la galería en todos los procesos."""
+    if getattr(_deferred, "scopes", None) is not None:
+        _deferred.scopes.add(scope)
+        return
+    if GalleryState.objects.filter(scope=scope).update(revision=F("revision") + 1):
+        return
+    _, created = GalleryState.objects.get_or_create(scope=scope, defaults={"revision": 1})
+    if not created:
+        GalleryState.objects.filter(scope=scope).update(revision=F("revision") + 1)
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class Gallery:
+    """Embeddings normalizados de una versión de modelo y el dueño de cada fila."""
+
+    def __init__(self, owner_ids: np.ndarray, matrix: np.ndarray):
+        self.owner_ids = owner_ids
+        self.matrix = matrix
+
+    def __len__(self):
+        return len(self.owner_ids)
+
+    def distances(self, embedding: np.ndarray) -> np.ndarray:
+        """Distancia coseno de la sonda a cada fila de la galería."""
+        probe = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(probe)
+        if norm > 0:
+            probe = probe / norm
+        return 1.0 - self.matrix @ probe
+
+    def search(self, embedding: np.ndarray, threshold: float):
+        """Devuelve [(owner_id, distancia)] bajo el umbral, la mejor por dueño y ordenadas."""
+        if not len(self):
+            return []
+        distances = self.distances(embedding)
+        hits = np.flatnonzero(distances < threshold)
+        best = {}
+        for i in hits[np.argsort(distances[hits], kind="stable")]:
+            best.setdefault(int(self.owner_ids[i]), float(distances[i]))
+        return list(best.items())
+
+
+def _gallery_rows(scope: str):
+    if scope == SYSTEM_SCOPE:
+        return FacialRecognitionProfile.objects.filter(
+            user__face_auth_enabled=True, is_active=True
+        ).values_list("embedding_model_version", "user_id", "face_encoding")
+
+    from auth_api.models import EndUser
+
+    app_id = int(scope.split(":", 1)[1])
+    return EndUser.objects.filter(app_id=app_id, deleted=False).values_list(
+        "embedding_model_version", "id", "face_encoding"
+    )
+
+
+def _build_galleries(scope: str) -> dict:
+    rows_by_version = defaultdict(list)
+    for version, owner_id, encoding in _gallery_rows(scope).iterator():
+        rows_by_version[version].append((owner_id, bytes(encoding)))
+
+    galleries = {}
+    for version, rows in rows_by_version.items():
+        # Se descartan los embeddings corruptos (tamaño distinto al de su versión)
+        size = Counter(len(encoding) for _, encoding in rows).most_common(1)[0][0]
+        rows = [row for row in rows if len(row[1]) == size and size % 4 == 0]
+        if not rows:
+            continue
+        owner_ids = np.array([owner_id for owner_id, _ in rows], dtype=np.int64)
+        matrix = np.frombuffer(b"".join(encoding for _, encoding in rows), dtype=np.float32)
+        galleries[version] = Gallery(owner_ids, _normalize_rows(matrix.reshape(len(rows), -1)))
+    return galleries
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def galleries_for(scope: str) -> dict:
+    """
+    Devuelve {versión: Gallery} del ámbito. Solo consulta la revisión en la base de
+    datos; las filas se vuelven a cargar únicamente si la revisión cambió.
+    """
+    revision = (
+        GalleryState.objects.filter(scope=scope).values_list("revision", flat=True).first()
+        or 0
+    )
+    with _cache_lock:
+        cached = _cache.get(scope)
+        if cached and cached[0] == revision:
+            _cache.move_to_end(scope)
+            return cached[1]
+
+    galleries = _build_galleries(scope)
+    with _cache_lock:
+        _cache[scope] = (revision, galleries)
+        _cache.move_to_end(scope)
+        while len(_cache) > settings.FACE_GALLERY_CACHE_SCOPES:
+            _cache.popitem(last=False)
+    return galleries
+
+
+def search_galleries(galleries: dict, detections: dict, threshold: float):
+    """
+    Busca cada sonda ({versión: detección}) en la galería de su misma versión y
+    combina los resultados con la mejor distancia por dueño.
+    Devuelve [(owner_id, distancia, versión)] ordenado por distancia.
+    """
+    best = {}
+    for version, detection in detections.items():
+        gallery = galleries.get(version)
+        if not detection or gallery is None:
+            continue
+        for owner_id, distance in gallery.search(detection["embedding"], threshold):
+            if owner_id not in best or distance < best[owner_id][0]:
+                best[owner_id] = (distance, version)
+    matches = [(owner_id, distance, version) for owner_id, (distance, version) in best.items()]
+    return sorted(matches, key=lambda match: match[1])
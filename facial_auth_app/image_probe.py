@@ -0,0 +1,108 @@
+import io
+
+from PIL import Image, UnidentifiedImageError
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+from . import metrics
+
+EXIF_ORIENTATION_TAG = 0x0112
+# Transformación que deja derecha una imagen según su orientación EXIF
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+class ImageRejectedError(ValidationError):
+    pass
+
+
+def probe_upload(upload) -> dict:
+    """
+    Valida una imagen subida leyendo solo su cabecera (PIL abre los archivos de
+    forma perezosa y no decodifica los píxeles). Rechaza archivos que superan
+    FACE_IMAGE_MAX_BYTES o FACE_IMAGE_MAX_PIXELS antes de la decodificación completa.
+    Devuelve el formato, las dimensiones, la orientación EXIF y si habrá que reducirla.
+    """
+    if upload.size > settings.FACE_IMAGE_MAX_BYTES:
+        metrics.incr("image.rejected_bytes")
+        raise ImageRejectedError(
+            f"La imagen supera el tamaño máximo de {settings.FACE_IMAGE_MAX_BYTES // (1024 * 1024)} MB."
+        )
+
+    position = upload.tell()
+    try:
+        with Image.open(upload) as img:
+            width, height = img.size
+            image_format = img.format
+            orientation = exif_orientation(img)
+    except Image.DecompressionBombError:
+        metrics.incr("image.rejected_pixels")
+        raise ImageRejectedError("La imagen tiene demasiados píxeles.")
+    except (UnidentifiedImageError, OSError):
+        raise ImageRejectedError("El archivo enviado no es una imagen válida.")
+    finally:
+        upload.seek(position)
+
+    pixels = width * height
+    if pixels > settings.FACE_IMAGE_MAX_PIXELS:
+        metrics.incr("image.rejected_pixels")
+        raise ImageRejectedError("La imagen tiene demasiados píxeles.")
+
+    return {
+        "format": image_format,
+        "width": width,
+        "height": height,
+        "orientation": orientation,
+        "downscale": pixels > settings.FACE_IMAGE_DOWNSCALE_PIXELS,
+    }
+
+
+def downscale_target(width: int, height: int):
+    """Tamaño al que se reduce una imagen que supera FACE_IMAGE_DOWNSCALE_PIXELS, o None."""
+    max_pixels = settings.FACE_IMAGE_DOWNSCALE_PIXELS
+    if width * height <= max_pixels:
+        return None
+    scale = (max_pixels / (width * height)) ** 0.5
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def exif_orientation(img: Image.Image) -> int:
+    return img.getexif().get(EXIF_ORIENTATION_TAG, 1)
+
+
+def apply_orientation(img: Image.Image, orientation: int) -> Image.Image:
+    """Aplica a `img` la orientación EXIF indicada (1 = ya está derecha)."""
+    transpose = ORIENTATION_TRANSPOSE.get(orientation)
+    return img.transpose(transpose) if transpose is not None else img
+
+
+def decode_image(img_bytes: bytes, exif_transpose: bool = False) -> Image.Image:
+    """
+    Decodifica una imagen a RGB. Las imágenes por encima de
+    FACE_IMAGE_DOWNSCALE_PIXELS se reducen mientras se decodifican (en JPEG,
+    `draft` decodifica directamente a escala reducida). Con `exif_transpose` se
+    aplica además la orientación EXIF; cambia los embeddings de las fotos giradas,
+    por eso depende de la versión de modelo (ver "exif_transpose" en
+    MODEL_REGISTRY). Las cajas de rostro de la inferencia están en las
+    coordenadas de esta imagen.
+    """
+    img = Image.open(io.BytesIO(img_bytes))
+    if img.width * img.height > settings.FACE_IMAGE_MAX_PIXELS:
+        metrics.incr("image.rejected_pixels")
+        raise ImageRejectedError("La imagen tiene demasiados píxeles.")
+
+    target = downscale_target(img.width, img.height)
+    if target:
+        img.draft("RGB", target)
+        img.thumbnail(target)
+        metrics.incr("image.downscaled")
+
+    orientation = exif_orientation(img) if exif_transpose else 1
+    return apply_orientation(img.convert("RGB"), orientation)
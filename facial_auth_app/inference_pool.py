@@ -0,0 +1,127 @@
+"""
+Pool opcional de procesos de inferencia.
+
+Cada proceso del pool carga los modelos una sola vez al arrancar. Las imágenes
+decodificadas se pasan a través de bloques de `multiprocessing.shared_memory`
+(solo viajan el nombre del bloque, la forma y el dtype) y los procesos devuelven
+el embedding con la caja y la puntuación del rostro elegido, junto con los
+contadores de `metrics` que generó la inferencia. Esos contadores se suman en el
+proceso padre: el hijo no comparte la caché en memoria local con él.
+
+Se activa con FACE_INFERENCE_POOL_SIZE > 0; con 0 la inferencia sigue corriendo
+dentro del proceso que atiende la petición.
+"""
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+from django.conf import settings
+
+from . import metrics
+
+
+def _init_worker():
+    """Prepara Django en el proceso hijo; importar services carga los modelos."""
+    import django
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+    django.setup()
+    from facial_auth_app import services  # noqa: F401
+
+
+def _embed_shared_image(block_name: str, shape, dtype: str, version=None, box=None):
+    """
+    Ejecuta la inferencia sobre la imagen publicada en el bloque de memoria
+    compartida. Devuelve (resultado, contadores de métricas).
+    """
+    from facial_auth_app.services import _embed_array
+
+    block = shared_memory.SharedMemory(name=block_name)
+    try:
+        image_np = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        with metrics.collect() as counts:
+            result = _embed_array(image_np, version, box)
+        # Soltamos las vistas sobre el bloque antes de cerrarlo
+        del image_np
+        return result, counts
+    finally:
+        block.close()
+
+
+class InferencePool:
+    def __init__(self, size: int):
+        self.size = size
+        self.executor = ProcessPoolExecutor(
+            max_workers=size,
+            # "spawn" evita heredar el estado de TF del proceso padre
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+
+    def submit(self, image_np: np.ndarray, version=None, box=None):
+        """
+        Publica la imagen en memoria compartida y encola su inferencia. Devuelve un
+        Future con (resultado, contadores de métricas); ver `embed`.
+        """
+        block = shared_memory.SharedMemory(create=True, size=max(image_np.nbytes, 1))
+        shared = np.ndarray(image_np.shape, dtype=image_np.dtype, buffer=block.buf)
+        shared[:] = image_np
+        del shared
+
+        def _release(_future):
+            block.close()
+            block.unlink()
+
+        try:
+            future = self.executor.submit(
+                _embed_shared_image,
+                block.name,
+                image_np.shape,
+                image_np.dtype.str,
+                version,
+                box,
+            )
+        except Exception:
+            _release(None)
+            raise
+        future.add_done_callback(_release)
+        return future
+
+    @staticmethod
+    def _collect(future):
+        result, counts = future.result()
+        metrics.incr_many(counts)
+        return result
+
+    def embed(self, image_np: np.ndarray, version=None, box=None):
+        return self._collect(self.submit(image_np, version, box))
+
+    def embed_many(self, images_np, version=None) -> list:
+        """Reparte varias imágenes entre los procesos del pool; resultados en el mismo orden."""
+        futures = [self.submit(image_np, version) for image_np in images_np]
+        return [self._collect(future) for future in futures]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_inference_pool():
+    """
+    Devuelve el pool del proceso actual o None si está desactivado. Se crea en el
+    primer uso para no arrancar procesos en el master de gunicorn con --preload.
+    """
+    global _pool
+    if settings.FACE_INFERENCE_POOL_SIZE <= 0:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = InferencePool(settings.FACE_INFERENCE_POOL_SIZE)
+    return _pool
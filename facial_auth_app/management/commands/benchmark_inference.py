@@ -0,0 +1,80 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from facial_auth_app.image_probe import ImageRejectedError
+from facial_auth_app.inference_pool import InferencePool
+from facial_auth_app.services import _bytes_to_array, _embed_array
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara el throughput de la inferencia dentro del proceso con el pool de "
+        "procesos de inferencia bajo carga concurrente."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--image",
+            required=True,
+            help=(
+                "Imagen de prueba con un rostro: sin rostro el modelo de embedding no "
+                "se ejecuta y solo se mediría la detección."
+            ),
+        )
+        parser.add_argument("--requests", type=int, default=40, help="Peticiones por escenario.")
+        parser.add_argument("--concurrency", type=int, default=8, help="Peticiones simultáneas.")
+        parser.add_argument("--pool-size", type=int, default=2, help="Procesos del pool de inferencia.")
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1 or options["concurrency"] < 1 or options["pool_size"] < 1:
+            raise CommandError("--requests, --concurrency y --pool-size deben ser mayores que 0.")
+
+        try:
+            with open(options["image"], "rb") as f:
+                image_np = _bytes_to_array(f.read())
+        except OSError as e:
+            raise CommandError(f"No se pudo leer la imagen: {e}")
+        except ImageRejectedError as e:
+            raise CommandError(e.messages[0])
+        if _embed_array(image_np) is None:
+            raise CommandError(
+                "No se detectó ningún rostro en la imagen: el benchmark no mediría el "
+                "modelo de embedding."
+            )
+
+        self._report("En proceso", self._run(_embed_array, image_np, options))
+
+        pool = InferencePool(options["pool_size"])
+        try:
+            # Calentamos los procesos para no medir la carga de los modelos
+            warmup = {"requests": options["pool_size"], "concurrency": options["pool_size"]}
+            self._run(pool.embed, image_np, warmup)
+            self._report(
+                f"Pool ({options['pool_size']} procesos)",
+                self._run(pool.embed, image_np, options),
+            )
+        finally:
+            pool.shutdown()
+
+    def _run(self, embed, image_np, options):
+        def timed(_):
+            start = time.perf_counter()
+            embed(image_np)
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            latencies = list(executor.map(timed, range(options["requests"])))
+        return time.perf_counter() - start, np.array(latencies)
+
+    def _report(self, label, measurement):
+        elapsed, latencies = measurement
+        self.stdout.write(
+            f"{label}: {len(latencies) / elapsed:.2f} req/s | "
+            f"p50 {np.percentile(latencies, 50) * 1000:.0f} ms | "
+            f"p95 {np.percentile(latencies, 95) * 1000:.0f} ms | "
+            f"total {elapsed:.2f} s"
+        )
@@ -0,0 +1,94 @@
+import os
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+
+from facial_auth_app.content_storage import BLOB_DIR
+from facial_auth_app.stored_images import (
+    StoredFaceImageField,
+    encode_for_storage,
+    storage_extension,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Traslada las imágenes de rostro guardadas con nombres anteriores al almacén "
+        "direccionado por contenido. Las que no están en FACE_STORED_IMAGE_FORMAT se "
+        "re-codifican. Las filas ya migradas se omiten, así que puede relanzarse."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=200, help="Filas leídas por consulta.")
+        parser.add_argument(
+            "--sleep", type=float, default=0.0, help="Segundos de pausa cada --batch-size filas."
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Solo cuenta las imágenes por migrar."
+        )
+
+    def handle(self, *args, **options):
+        if not settings.FACE_MEDIA_CONTENT_ADDRESSED:
+            raise CommandError("FACE_MEDIA_CONTENT_ADDRESSED está desactivado.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size debe ser mayor que 0.")
+
+        self.options = options
+        for model in apps.get_models():
+            for field in model._meta.fields:
+                if isinstance(field, StoredFaceImageField):
+                    self._migrate(model, field)
+
+    def _legacy_rows(self, model, field):
+        return (
+            model.objects.exclude(**{field.attname: ""})
+            .exclude(**{f"{field.attname}__isnull": True})
+            .exclude(**{f"{field.attname}__startswith": f"{BLOB_DIR}/"})
+            .order_by("pk")
+            .values_list("pk", field.attname)
+        )
+
+    def _migrate(self, model, field):
+        label = f"{model._meta.label}.{field.name}"
+        rows = self._legacy_rows(model, field)
+        if self.options["dry_run"]:
+            self.stdout.write(f"{label}: {rows.count()} imágenes por migrar.")
+            return
+
+        counts = {"migrated": 0, "missing": 0}
+        storage = field.storage
+        for i, (pk, name) in enumerate(rows.iterator(chunk_size=self.options["batch_size"]), 1):
+            try:
+                with storage.open(name, "rb") as f:
+                    data = f.read()
+            except OSError:
+                counts["missing"] += 1
+                continue
+
+            extension = os.path.splitext(name)[1].lower()
+            if extension != storage_extension():
+                data = encode_for_storage(data, model)
+                extension = storage_extension()
+            blob_name = storage.save(f"image{extension}", ContentFile(data))
+
+            updated = model.objects.filter(pk=pk, **{field.attname: name}).update(
+                **{field.attname: blob_name}
+            )
+            if updated:
+                storage.delete(name)
+                counts["migrated"] += 1
+            else:
+                # La fila cambió mientras tanto: se suelta la referencia recién creada
+                storage.delete(blob_name)
+
+            if self.options["sleep"] and i % self.options["batch_size"] == 0:
+                time.sleep(self.options["sleep"])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{label}: {counts['migrated']} migradas, {counts['missing']} sin archivo."
+            )
+        )
@@ -0,0 +1,170 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Mod
+
+from auth_api.models import EndUser, EndUserFeedback
+from facial_auth_app.gallery import SYSTEM_SCOPE, app_scope, bump_gallery
+from facial_auth_app.models import FacialRecognitionProfile
+from facial_auth_app.services import MODEL_VERSION, _bytes_to_array, _embed_array_batch
+
+SOURCES = ("profiles", "endusers")
+
+
+class Command(BaseCommand):
+    help = (
+        "Regenera los embeddings guardados con la versión de modelo activa "
+        "(FACE_MODEL_VERSION) a partir de las imágenes originales. Las filas ya "
+        "migradas se omiten, así que el comando puede relanzarse; con --checkpoint "
+        "también se saltan las filas sin imagen o sin rostro ya visitadas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--only", choices=SOURCES, help="Procesa solo perfiles de usuarios del sistema o solo EndUsers."
+        )
+        parser.add_argument("--batch-size", type=int, default=16, help="Imágenes por lote de inferencia.")
+        parser.add_argument(
+            "--shard",
+            default="0/1",
+            help="Fragmento a procesar como i/N (pk %% N == i) para repartir el trabajo entre procesos.",
+        )
+        parser.add_argument("--checkpoint", help="Archivo JSON donde se guarda el último pk procesado.")
+        parser.add_argument(
+            "--sleep", type=float, default=0.0, help="Segundos de pausa entre lotes para no saturar producción."
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size debe ser mayor que 0.")
+        try:
+            shard, shards = (int(part) for part in options["shard"].split("/"))
+        except ValueError:
+            raise CommandError("--shard debe tener el formato i/N.")
+        if shards < 1 or not 0 <= shard < shards:
+            raise CommandError("--shard fuera de rango.")
+
+        self.options = options
+        self.shard, self.shards = shard, shards
+        self.checkpoint = self._load_checkpoint(options["checkpoint"])
+
+        for source in SOURCES:
+            if options["only"] in (None, source):
+                self._reembed(source)
+
+    def _queryset(self, source):
+        if source == "profiles":
+            queryset = FacialRecognitionProfile.objects.annotate(source_image=F("face_image"))
+        else:
+            # Los EndUser no guardan la imagen de registro: usamos su último feedback confirmado
+            latest_feedback = EndUserFeedback.objects.filter(end_user=OuterRef("pk")).order_by("-timestamp")
+            queryset = EndUser.objects.filter(deleted=False).annotate(
+                source_image=Subquery(latest_feedback.values("submitted_image")[:1])
+            )
+
+        queryset = (
+            queryset.exclude(embedding_model_version=MODEL_VERSION)
+            .filter(pk__gt=self.checkpoint.get(source, 0))
+            .only("id", "app_id" if source == "endusers" else "user_id")
+        )
+        if self.shards > 1:
+            queryset = queryset.annotate(shard=Mod("pk", self.shards)).filter(shard=self.shard)
+        return queryset.order_by("pk")
+
+    def _reembed(self, source):
+        counts = {"updated": 0, "no_image": 0, "no_face": 0}
+        batch = []
+        # iterator() evita cargar toda la tabla (y sus embeddings) en memoria
+        for row in self._queryset(source).iterator(chunk_size=self.options["batch_size"] * 4):
+            batch.append(row)
+            if len(batch) >= self.options["batch_size"]:
+                self._process_batch(source, batch, counts)
+                batch = []
+        if batch:
+            self._process_batch(source, batch, counts)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{source}: {counts['updated']} actualizados, {counts['no_image']} sin imagen, "
+                f"{counts['no_face']} sin rostro (modelo {MODEL_VERSION})."
+            )
+        )
+
+    def _process_batch(self, source, batch, counts):
+        rows, images = [], []
+        for row in batch:
+            image_np = self._load_image(source, row.source_image)
+            if image_np is None:
+                counts["no_image"] += 1
+            else:
+                rows.append(row)
+                images.append(image_np)
+
+        updated = []
+        for row, result in zip(rows, _embed_array_batch(images) if images else []):
+            if result is None:
+                counts["no_face"] += 1
+                continue
+            row.face_encoding = result["embedding"].tobytes()
+            row.embedding_model_version = MODEL_VERSION
+            updated.append(row)
+
+        if updated:
+            type(updated[0]).objects.bulk_update(
+                updated, ["face_encoding", "embedding_model_version"]
+            )
+            # bulk_update no emite señales: invalidamos cada galería afectada una vez
+            scopes = (
+                {SYSTEM_SCOPE}
+                if source == "profiles"
+                else {app_scope(row.app_id) for row in updated}
+            )
+            for scope in scopes:
+                bump_gallery(scope)
+        counts["updated"] += len(updated)
+
+        self.checkpoint[source] = batch[-1].pk
+        self._save_checkpoint()
+        if self.options["sleep"]:
+            time.sleep(self.options["sleep"])
+
+    def _load_image(self, source, name):
+        if not name:
+            return None
+        model, field = (
+            (FacialRecognitionProfile, "face_image")
+            if source == "profiles"
+            else (EndUserFeedback, "submitted_image")
+        )
+        storage = model._meta.get_field(field).storage
+        try:
+            with storage.open(name, "rb") as f:
+                return _bytes_to_array(f.read())
+        except Exception as e:
+            self.stderr.write(f"No se pudo leer {name}: {e}")
+            return None
+
+    def _load_checkpoint(self, path):
+        if not path or not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("version") != MODEL_VERSION or checkpoint.get("shard") != self.options["shard"]:
+            raise CommandError(
+                f"El checkpoint {path} corresponde a otra versión de modelo o a otro fragmento."
+            )
+        return checkpoint
+
+    def _save_checkpoint(self):
+        path = self.options["checkpoint"]
+        if not path:
+            return
+        self.checkpoint.update({"version": MODEL_VERSION, "shard": self.options["shard"]})
+        # Escribimos en un temporal y lo renombramos para no dejar un checkpoint a medias
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.checkpoint, f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.23 on 2026-10-18 23:50
+
+from django.db import migrations, models
+import facial_auth_app.model_versions
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('facial_auth_app', '0004_alter_facialrecognitionprofile_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='facialrecognitionprofile',
+            name='embedding_model_version',
+            field=models.CharField(default=facial_auth_app.model_versions.current_model_version, max_length=32),
+        ),
+    ]
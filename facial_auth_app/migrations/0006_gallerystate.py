@@ -0,0 +1,21 @@
+# Generated by Django 4.2.23 on 2026-10-18 23:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('facial_auth_app', '0005_facialrecognitionprofile_embedding_model_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GalleryState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=64, unique=True)),
+                ('revision', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
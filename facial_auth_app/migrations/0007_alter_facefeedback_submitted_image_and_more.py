@@ -0,0 +1,25 @@
+# Generated by Django 4.2.23 on 2026-10-19 00:07
+
+from django.db import migrations
+import facial_auth_app.models
+import facial_auth_app.stored_images
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('facial_auth_app', '0006_gallerystate'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='facefeedback',
+            name='submitted_image',
+            field=facial_auth_app.stored_images.StoredFaceImageField(upload_to='face_feedback_images/'),
+        ),
+        migrations.AlterField(
+            model_name='facialrecognitionprofile',
+            name='face_image',
+            field=facial_auth_app.stored_images.StoredFaceImageField(blank=True, null=True, upload_to=facial_auth_app.models.user_face_image_path),
+        ),
+    ]
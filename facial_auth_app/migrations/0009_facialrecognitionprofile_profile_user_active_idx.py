@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-19 00:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('facial_auth_app', '0008_storedblob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='facialrecognitionprofile',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user'], name='profile_user_active_idx'),
+        ),
+    ]
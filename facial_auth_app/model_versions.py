@@ -0,0 +1,6 @@
+from django.conf import settings
+
+
+def current_model_version():
+    """Versión de modelo con la que se etiquetan los embeddings nuevos."""
+    return settings.FACE_MODEL_VERSION
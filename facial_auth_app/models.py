@@ -3,6 +3,8 @@ import uuid
 from django.db import models
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from .model_versions import current_model_version
+from .stored_images import StoredFaceImageField
 
 User = get_user_model()
 
@@ -19,7 +21,10 @@ class FacialRecognitionProfile(models.Model):
         User, on_delete=models.CASCADE, related_name="facial_profiles"
     )
     face_encoding = models.BinaryField()
-    face_image = models.ImageField(
+    embedding_model_version = models.CharField(
+        max_length=32, default=current_model_version
+    )
+    face_image = StoredFaceImageField(
         upload_to=user_face_image_path, null=True, blank=True
     )
     is_active = models.BooleanField(default=True)
@@ -33,6 +38,13 @@ class FacialRecognitionProfile(models.Model):
     class Meta:
         verbose_name = "Facial Recognition Profile"
         verbose_name_plural = "Facial Recognition Profiles"
+        indexes = [
+            models.Index(
+                fields=["user"],
+                condition=models.Q(is_active=True),
+                name="profile_user_active_idx",
+            ),
+        ]
 
 
 class FaceFeedback(models.Model):
@@ -43,10 +55,37 @@ class FaceFeedback(models.Model):
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name="face_feedback"
     )
-    submitted_image = models.ImageField(upload_to="face_feedback_images/")
+    submitted_image = StoredFaceImageField(upload_to="face_feedback_images/")
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return (
             f"Feedback for {self.user.email} on {self.created_at.strftime('%Y-%m-%d')}"
         )
+
+
+class GalleryState(models.Model):
+    """
+    Revisión de cada galería de embeddings ("system" o "app:<id>"). Se incrementa con
+    cada alta, baja o cambio de embedding para que los procesos invaliden su copia
+    en memoria de la galería.
+    """
+    scope = models.CharField(max_length=64, unique=True)
+    revision = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.scope} (rev {self.revision})"
+
+
+class StoredBlob(models.Model):
+    """
+    Archivo del almacén direccionado por contenido y cuántas filas lo referencian.
+    Se borra junto con el archivo cuando la última referencia desaparece.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(default=0)
+    refs = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refs} refs)"
@@ -1,14 +1,26 @@
 import os
+import time
+import logging
+import asyncio
 import cv2, io, numpy as np, tensorflow as tf, tensorflow_hub as hub
-from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
 from sklearn.metrics.pairwise import cosine_similarity
 from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.exceptions import ValidationError
+from django.core.exceptions import ImproperlyConfigured, ValidationError
 from .models import FacialRecognitionProfile, FaceFeedback
+from .embedding_cache import embedding_cache
+from .inference_pool import get_inference_pool
+from .admission import inference_admission
+from .gallery import SYSTEM_SCOPE, galleries_for, search_galleries
+from .image_probe import decode_image
+from .stored_images import attach_face_box
+from . import metrics
 
 print("DEBUG: Starting import of services.py")
 
+logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
@@ -18,34 +30,86 @@ os.environ["TFHUB_CACHE_DIR"] = MODEL_DIR
 # ------------------------------------------------------------------
 # 1. Cargar modelos una sola vez al arrancar Django
 # ------------------------------------------------------------------
-print("DEBUG: About to load face_detector model.")
-try:
-    face_detector = hub.load(
-        "https://tfhub.dev/tensorflow/faster_rcnn/resnet101_v1_640x640/1"
-    )
-    print("DEBUG: face_detector model loaded successfully.")
-except Exception as e:
-    print(f"ERROR: Failed to load face_detector model. Exception: {e}")
-
-print("DEBUG: About to load embedding_model.")
-try:
-    embedding_model = hub.load(
-        "https://tfhub.dev/google/imagenet/inception_resnet_v2/feature_vector/4"
-    )
-    print("DEBUG: embedding_model loaded successfully.")
-except Exception as e:
-    print(f"ERROR: Failed to load embedding_model. Exception: {e}")
+# Modelos de detección y embedding por versión. Los embeddings guardados se
+# etiquetan con la versión activa (FACE_MODEL_VERSION); para cambiar de modelo se
+# agrega una versión nueva aquí y se regeneran con `manage.py reembed_faces`.
+# Con "cascade" la detección prueba primero el clasificador Haar de OpenCV; como
+# cambia el recorte del rostro, los embeddings no son comparables con los de una
+# versión sin cascada y por eso es una versión aparte. Lo mismo con
+# "exif_transpose": aplicar la orientación EXIF cambia los embeddings de las fotos
+# giradas, así que solo lo hacen las versiones que lo declaran.
+MODEL_REGISTRY = {
+    "v1": {
+        "detector": "https://tfhub.dev/tensorflow/faster_rcnn/resnet101_v1_640x640/1",
+        "embedding": "https://tfhub.dev/google/imagenet/inception_resnet_v2/feature_vector/4",
+    },
+    "v1-cascade": {
+        "detector": "https://tfhub.dev/tensorflow/faster_rcnn/resnet101_v1_640x640/1",
+        "embedding": "https://tfhub.dev/google/imagenet/inception_resnet_v2/feature_vector/4",
+        "cascade": True,
+    },
+    "v1-exif": {
+        "detector": "https://tfhub.dev/tensorflow/faster_rcnn/resnet101_v1_640x640/1",
+        "embedding": "https://tfhub.dev/google/imagenet/inception_resnet_v2/feature_vector/4",
+        "exif_transpose": True,
+    },
+}
+
+for _version in filter(None, [settings.FACE_MODEL_VERSION, settings.FACE_PREVIOUS_MODEL_VERSION]):
+    if _version not in MODEL_REGISTRY:
+        raise ImproperlyConfigured(f"Versión de modelo desconocida: {_version}")
+MODEL_VERSION = settings.FACE_MODEL_VERSION
+# Versión anterior que se mantiene cargada durante una migración de modelo
+PREVIOUS_MODEL_VERSION = settings.FACE_PREVIOUS_MODEL_VERSION or None
+if PREVIOUS_MODEL_VERSION == MODEL_VERSION:
+    PREVIOUS_MODEL_VERSION = None
+
+
+def _load_models(version: str):
+    """Carga el detector y el modelo de embedding registrados para `version`."""
+    face_detector = embedding_model = None
+    logger.debug("Cargando el detector de rostros (%s)", version)
+    try:
+        face_detector = hub.load(MODEL_REGISTRY[version]["detector"])
+        logger.debug("Detector de rostros (%s) cargado", version)
+    except Exception:
+        logger.exception("No se pudo cargar el detector de rostros (%s)", version)
+
+    logger.debug("Cargando el modelo de embedding (%s)", version)
+    try:
+        embedding_model = hub.load(MODEL_REGISTRY[version]["embedding"])
+        logger.debug("Modelo de embedding (%s) cargado", version)
+    except Exception:
+        logger.exception("No se pudo cargar el modelo de embedding (%s)", version)
+    return face_detector, embedding_model
+
+
+face_detector, embedding_model = _load_models(MODEL_VERSION)
+LOADED_MODELS = {MODEL_VERSION: (face_detector, embedding_model)}
+if PREVIOUS_MODEL_VERSION:
+    LOADED_MODELS[PREVIOUS_MODEL_VERSION] = _load_models(PREVIOUS_MODEL_VERSION)
+
+# Clasificador Haar para la primera pasada de detección (ver "cascade" en MODEL_REGISTRY)
+face_cascade = cv2.CascadeClassifier(
+    os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml")
+)
 
 EMBEDDING_DIM = 1536
+# Puntuación mínima para considerar una detección como rostro
+FACE_SCORE_THRESHOLD = 0.5
 
 
 # ------------------------------------------------------------------
 # 2. Utils
 # ------------------------------------------------------------------
-def _bytes_to_array(img_bytes: bytes) -> np.ndarray:
-    """Convierte bytes crudos a RGB array."""
-    img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-    return np.array(img)
+def exif_transpose_for(version: str | None = None) -> bool:
+    """Si la versión de modelo (por defecto, la activa) aplica la orientación EXIF."""
+    return bool(MODEL_REGISTRY[version or MODEL_VERSION].get("exif_transpose"))
+
+
+def _bytes_to_array(img_bytes: bytes, version: str | None = None) -> np.ndarray:
+    """Convierte bytes crudos a RGB array para la versión de modelo (ver `decode_image`)."""
+    return np.array(decode_image(img_bytes, exif_transpose_for(version)))
 
 
 def _preprocess_for_detection(img_array: np.ndarray) -> tf.Tensor:
@@ -70,46 +134,274 @@ def _preprocess_for_embedding(img_array: np.ndarray) -> tf.Tensor:
     return img
 
 
-def _face_detect_and_align(img_array: np.ndarray):
+def _select_face_index(boxes: np.ndarray, scores: np.ndarray, img_shape, policy: str) -> int:
+    """
+    Elige una caja entre las candidatas según la política indicada.
+    `boxes` viene en píxeles con el orden (top, left, bottom, right).
+    """
+    if policy == "score":
+        return int(np.argmax(scores))
+    if policy == "area":
+        areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+        return int(np.argmax(areas))
+    if policy == "center":
+        h, w = img_shape[:2]
+        centers_y = (boxes[:, 0] + boxes[:, 2]) / 2.0
+        centers_x = (boxes[:, 1] + boxes[:, 3]) / 2.0
+        offsets = (centers_y - h / 2.0) ** 2 + (centers_x - w / 2.0) ** 2
+        return int(np.argmin(offsets))
+    raise ValueError(f"Política de selección de rostro desconocida: {policy}")
+
+
+def _cascade_detect(img_array: np.ndarray):
+    """
+    Primera pasada barata con el clasificador Haar de OpenCV sobre una copia reducida
+    en escala de grises. Devuelve la caja (top, left, bottom, right) solo si hay
+    exactamente un rostro grande y con peso suficiente; si no, None.
+    """
+    h, w = img_array.shape[:2]
+    scale = min(1.0, settings.FACE_CASCADE_MAX_SIDE / max(h, w))
+    gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+    if scale < 1.0:
+        gray = cv2.resize(gray, (max(1, int(w * scale)), max(1, int(h * scale))))
+
+    min_side = max(1, int(min(gray.shape) * settings.FACE_CASCADE_MIN_FACE_RATIO))
+    boxes, _, weights = face_cascade.detectMultiScale3(
+        gray,
+        scaleFactor=1.1,
+        minNeighbors=5,
+        minSize=(min_side, min_side),
+        outputRejectLevels=True,
+    )
+    if len(boxes) != 1 or np.ravel(weights)[0] < settings.FACE_CASCADE_MIN_WEIGHT:
+        return None
+
+    x, y, box_w, box_h = (float(v) / scale for v in boxes[0])
+    return int(y), int(x), min(h, int(y + box_h)), min(w, int(x + box_w))
+
+
+def _face_detect_and_align(
+    img_array: np.ndarray, policy: str | None = None, version: str | None = None
+):
     """
-    Detecta caras usando el modelo `face_detector`.
-    Devuelve los rostros recortados.
+    Detecta el rostro y elige uno solo según `policy` ("score": mayor puntuación,
+    "area": caja más grande, "center": más centrada).
+    Devuelve un dict con el recorte ("face"), la caja en píxeles ("box",
+    como (top, left, bottom, right)) y su puntuación ("score"), o None si no hay rostro.
+
+    Si la versión de modelo tiene "cascade" en MODEL_REGISTRY, primero se prueba el
+    clasificador Haar; Faster R-CNN solo corre cuando este no encuentra exactamente
+    un rostro claro. Los resultados del camino rápido llevan "score" None.
     """
+    version = version or MODEL_VERSION
+    if MODEL_REGISTRY[version].get("cascade"):
+        start = time.perf_counter()
+        box = _cascade_detect(img_array)
+        metrics.incr("detector.cascade_us", int((time.perf_counter() - start) * 1e6))
+        if box is not None:
+            metrics.incr("detector.fast_path")
+            top, left, bottom, right = box
+            return {
+                "face": img_array[top:bottom, left:right],
+                "box": box,
+                "score": None,
+            }
+
+    start = time.perf_counter()
+    detection = _rcnn_detect(img_array, policy, version)
+    metrics.incr("detector.full_path")
+    metrics.incr("detector.full_us", int((time.perf_counter() - start) * 1e6))
+    return detection
+
+
+def _rcnn_detect(img_array: np.ndarray, policy: str | None, version: str):
+    """Detección con el modelo Faster R-CNN de la versión indicada."""
+    policy = policy or settings.FACE_SELECTION_POLICY
+    detector = LOADED_MODELS[version][0]
+
     preprocessed_img = _preprocess_for_detection(img_array)
-    detections = face_detector(preprocessed_img)
+    detections = detector(preprocessed_img)
 
     if "detection_boxes" not in detections or "detection_scores" not in detections:
-        return []
+        return None
 
     boxes = detections["detection_boxes"][0].numpy()
     scores = detections["detection_scores"][0].numpy()
 
-    faces = []
-    for i in range(len(scores)):
-        if scores[i] > 0.5:
-            ymin, xmin, ymax, xmax = boxes[i]
+    keep = scores > FACE_SCORE_THRESHOLD
+    if not keep.any():
+        return None
+
+    # Pasamos las cajas normalizadas a píxeles y las recortamos a los límites de la imagen
+    h, w = img_array.shape[:2]
+    limits = np.array([h, w, h, w])
+    pixel_boxes = np.clip((boxes[keep] * limits).astype(np.int64), 0, limits)
+    scores = scores[keep]
+
+    # Descartamos las cajas vacías para evitar recortes inválidos
+    valid = (pixel_boxes[:, 2] > pixel_boxes[:, 0]) & (
+        pixel_boxes[:, 3] > pixel_boxes[:, 1]
+    )
+    if not valid.any():
+        return None
+    pixel_boxes, scores = pixel_boxes[valid], scores[valid]
+
+    index = _select_face_index(pixel_boxes, scores, img_array.shape, policy)
+    top, left, bottom, right = (int(v) for v in pixel_boxes[index])
+    return {
+        "face": img_array[top:bottom, left:right],
+        "box": (top, left, bottom, right),
+        "score": float(scores[index]),
+    }
+
+
+def _embed_array(image_np: np.ndarray, version: str | None = None, box=None):
+    """
+    Ejecuta detección y embedding sobre una imagen RGB ya decodificada.
+    Con `box` (top, left, bottom, right) se omite la detección y se usa esa caja,
+    p. ej. la del fotograma anterior de una ráfaga; el resultado lleva "score" None.
+    """
+    if box is None:
+        detection = _face_detect_and_align(image_np, version=version)
+        if not detection:
+            return None
+    else:
+        top, left, bottom, right = box
+        face = image_np[top:bottom, left:right]
+        if not face.size:
+            return None
+        detection = {"face": face, "box": tuple(box), "score": None}
+
+    model = LOADED_MODELS[version or MODEL_VERSION][1]
+    processed_face = _preprocess_for_embedding(detection["face"])
+    return {
+        "embedding": model(processed_face)[0].numpy(),
+        "box": detection["box"],
+        "score": detection["score"],
+    }
 
-            h, w, _ = img_array.shape
-            left, right, top, bottom = (
-                int(xmin * w),
-                int(xmax * w),
-                int(ymin * h),
-                int(ymax * h),
-            )
 
-            # Aseguramos que las coordenadas estén dentro de los límites de la imagen
-            left, top = max(0, left), max(0, top)
-            right, bottom = min(w, right), min(h, bottom)
+def _embed_faces(faces: list[np.ndarray], version: str | None = None) -> np.ndarray:
+    """Calcula los embeddings de varios recortes de rostro con una sola llamada al modelo."""
+    model = LOADED_MODELS[version or MODEL_VERSION][1]
+    batch = tf.concat([_preprocess_for_embedding(face) for face in faces], axis=0)
+    return model(batch).numpy()
 
-            # Verificar si las dimensiones de recorte son válidas para evitar errores con cv2
-            if bottom <= top or right <= left:
-                continue
 
-            face = img_array[top:bottom, left:right]
-            if (face.shape[0] > 0 and face.shape[1] > 0):
-                faces.append(face)
+def _embed_array_batch(images_np: list[np.ndarray], version: str | None = None):
+    """
+    Versión por lotes de `_embed_array`. El detector se ejecuta imagen por imagen
+    (su firma admite un solo elemento por llamada), pero todos los rostros
+    encontrados pasan juntos por el modelo de embedding.
+    Devuelve una lista alineada con `images_np` con un dict o None por imagen.
+    """
+    detections = [
+        _face_detect_and_align(image_np, version=version) for image_np in images_np
+    ]
+    found = [i for i, detection in enumerate(detections) if detection]
+
+    results = [None] * len(images_np)
+    if found:
+        embeddings = _embed_faces([detections[i]["face"] for i in found], version)
+        for i, embedding in zip(found, embeddings):
+            results[i] = {
+                "embedding": embedding,
+                "box": detections[i]["box"],
+                "score": detections[i]["score"],
+            }
+    return results
+
+
+def probe_versions(galleries: dict) -> list[str]:
+    """
+    Versiones con las que hay que calcular la sonda de un login: siempre la activa
+    y, durante una migración, la anterior mientras la galería aún tenga embeddings suyos.
+    """
+    versions = [MODEL_VERSION]
+    if PREVIOUS_MODEL_VERSION and len(galleries.get(PREVIOUS_MODEL_VERSION, ())):
+        versions.append(PREVIOUS_MODEL_VERSION)
+    return versions
+
+
+def _compute_embedding(img_bytes: bytes, version: str | None = None):
+    """
+    Decodifica los bytes y calcula detección + embedding, sin pasar por la caché.
+    Si el pool de procesos de inferencia está activo, el trabajo se hace allí.
+    """
+    image_np = _bytes_to_array(img_bytes, version)
+    pool = get_inference_pool()
+    if pool is not None:
+        return pool.embed(image_np, version)
+    return _embed_array(image_np, version)
+
+
+def _compute_embedding_batch(images_np: list[np.ndarray], version: str | None = None):
+    """
+    Versión por lotes de `_compute_embedding` para imágenes ya decodificadas. Con el
+    pool de inferencia activo las imágenes se reparten entre sus procesos.
+    """
+    pool = get_inference_pool()
+    if pool is not None:
+        return pool.embed_many(images_np, version)
+    return _embed_array_batch(images_np, version)
 
-    return faces
+
+def _embed_image_bytes(
+    img_bytes: bytes, deadline: float | None = None, version: str | None = None
+):
+    """
+    Detecta el rostro principal de la imagen y calcula su embedding.
+    Devuelve un dict con "embedding", "box" y "score", o None si no hay rostro.
+    Las imágenes ya procesadas (reintentos, feedback tras un login) se sirven
+    desde la caché sin volver a ejecutar los modelos. La inferencia pasa por el
+    control de admisión, que puede lanzar InferenceOverloadedError.
+    `version` elige el modelo (por defecto, FACE_MODEL_VERSION).
+    """
+    key = embedding_cache.key_for(img_bytes, version)
+    found, result = embedding_cache.get(key)
+    if found:
+        return result
+
+    with inference_admission.admit(deadline):
+        result = _compute_embedding(img_bytes, version)
+    embedding_cache.set(key, result)
+    return result
+
+
+# Executor acotado para las vistas async: limita cuántas inferencias de TF
+# corren a la vez sin bloquear el event loop mientras esperan.
+inference_executor = ThreadPoolExecutor(
+    max_workers=settings.FACE_INFERENCE_MAX_WORKERS,
+    thread_name_prefix="face-inference",
+)
+
+
+def _run_admitted(ticket, img_bytes: bytes, version: str | None = None):
+    with inference_admission.run(ticket):
+        return _compute_embedding(img_bytes, version)
+
+
+async def _aembed_image_bytes(
+    img_bytes: bytes, deadline: float | None = None, version: str | None = None
+):
+    """Versión async de `_embed_image_bytes` que delega la inferencia al executor."""
+    key = embedding_cache.key_for(img_bytes, version)
+    found, result = await embedding_cache.aget(key)
+    if found:
+        return result
+
+    # La reserva se hace aquí para que la cola cuente también los trabajos que
+    # esperan un hilo libre del executor
+    ticket = inference_admission.enqueue(deadline)
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(
+            inference_executor, _run_admitted, ticket, img_bytes, version
+        )
+    finally:
+        inference_admission.leave_queue(ticket)
+    await embedding_cache.aset(key, result)
+    return result
 
 
 class FaceAlreadyRegisteredError(ValidationError):
@@ -129,38 +421,35 @@ class FacialRecognitionService:
     @staticmethod
     def create_facial_profile(user_instance, image: InMemoryUploadedFile):
         """Crea el primer embedding de cara para un nuevo usuario."""
-        img_bytes = image.read()
-        image_np = _bytes_to_array(img_bytes)
-
-        faces = _face_detect_and_align(image_np)
-        if not faces:
+        result = _embed_image_bytes(image.read())
+        if not result:
             return None
 
-        processed_face_for_embedding = _preprocess_for_embedding(faces[0])
-        embedding = embedding_model(processed_face_for_embedding)[0].numpy()
+        embedding = result["embedding"]
         profile = FacialRecognitionProfile.objects.create(
             user=user_instance,
             face_encoding=embedding.tobytes(),
-            face_image=image,
+            face_image=attach_face_box(image, result),
             description="Initial registration",  # <--- Usamos el nuevo campo
         )
         return profile
 
     @staticmethod
-    def process_and_store_feedback(user_instance, image: InMemoryUploadedFile):
+    def process_and_store_feedback(
+        user_instance, image: InMemoryUploadedFile, result=None
+    ):
         """
         Procesa y guarda la imagen de feedback como un nuevo perfil
         para mejorar inmediatamente el sistema.
+        Si se pasa `result` (inferencia ya calculada, p. ej. en vistas async) se reutiliza.
         """
-        img_bytes = image.read()
-        image_np = _bytes_to_array(img_bytes)
-
-        faces = _face_detect_and_align(image_np)
-        if not faces:
+        if result is None:
+            result = _embed_image_bytes(image.read())
+        if not result:
             return False
 
-        processed_face_for_embedding = _preprocess_for_embedding(faces[0])
-        new_embedding = embedding_model(processed_face_for_embedding)[0].numpy()
+        new_embedding = result["embedding"]
+        attach_face_box(image, result)
 
         # Guarda la imagen de feedback
         FaceFeedback.objects.create(user=user_instance, submitted_image=image)
@@ -203,36 +492,25 @@ class FacialRecognitionService:
         - 'ambiguous_match': si encuentra una o más coincidencias posibles que requieren confirmación.
         - 'no_match': si no encuentra ninguna coincidencia.
         """
+        galleries = galleries_for(SYSTEM_SCOPE)
         img_bytes = image.read()
-        image_np = _bytes_to_array(img_bytes)
-        faces = _face_detect_and_align(image_np)
-
-        if not faces:
+        # Cada sonda se compara solo con los perfiles de su misma versión de modelo
+        detections = {
+            version: _embed_image_bytes(img_bytes, version=version)
+            for version in probe_versions(galleries)
+        }
+        if not any(detections.values()):
             return {"status": "no_match"}
 
-        processed_face_for_embedding = _preprocess_for_embedding(faces[0])
-        emb = embedding_model(processed_face_for_embedding)[0].numpy()
-
-        all_profiles = FacialRecognitionProfile.objects.select_related("user").filter(
-            user__face_auth_enabled=True
+        found = search_galleries(
+            galleries, detections, threshold=FacialRecognitionService.FALLBACK_THRESHOLD
         )
-
-        matches_by_user = {}
-        for profile in all_profiles:
-            # Comparamos el embedding de la imagen con CADA uno de los perfiles guardados
-            match, dist = FacialRecognitionService.compare_faces(
-                profile.face_encoding,
-                emb.tobytes(),
-                threshold=FacialRecognitionService.FALLBACK_THRESHOLD,
-            )
-            if match:
-                user_id = profile.user.id
-                if (
-                    user_id not in matches_by_user
-                    or dist < matches_by_user[user_id]["distance"]
-                ):
-                    matches_by_user[user_id] = {"user": profile.user, "distance": dist}
-
+        users = User.objects.in_bulk([user_id for user_id, _, _ in found])
+        matches_by_user = {
+            user_id: {"user": users[user_id], "distance": distance}
+            for user_id, distance, _ in found
+            if user_id in users
+        }
         if not matches_by_user:
             return {"status": "no_match"}
 
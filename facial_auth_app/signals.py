@@ -0,0 +1,31 @@
+"""
+Invalida las galerías de embeddings cuando cambia una fila que forma parte de ellas.
+Las operaciones masivas (bulk_create, bulk_update, update) no emiten señales y
+llaman a `bump_gallery` por su cuenta.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from auth_api.models import EndUser
+from .gallery import SYSTEM_SCOPE, app_scope, bump_gallery
+from .models import FacialRecognitionProfile
+
+User = get_user_model()
+
+
+@receiver([post_save, post_delete], sender=FacialRecognitionProfile)
+def profile_changed(sender, instance, **kwargs):
+    bump_gallery(SYSTEM_SCOPE)
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # Guardados parciales como el de last_login no afectan a la galería
+    if update_fields is None or "face_auth_enabled" in update_fields:
+        bump_gallery(SYSTEM_SCOPE)
+
+
+@receiver([post_save, post_delete], sender=EndUser)
+def end_user_changed(sender, instance, **kwargs):
+    bump_gallery(app_scope(instance.app_id))
@@ -0,0 +1,150 @@
+"""
+Almacenamiento de las imágenes de rostro re-codificadas.
+
+En lugar del archivo subido (a menudo varios MB) se guarda una copia reducida a
+FACE_STORED_IMAGE_MAX_SIDE píxeles por lado en FACE_STORED_IMAGE_FORMAT. La
+calidad se configura por modelo en FACE_STORED_IMAGE_QUALITY_BY_MODEL y los
+modelos listados en FACE_STORED_IMAGE_FACE_CROP guardan solo el rostro (con
+margen) cuando se conoce su caja; ver `attach_face_box`.
+"""
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import models, transaction
+from django.db.models.signals import post_delete
+from django.db.models.fields.files import ImageFieldFile
+from PIL import features
+
+from .content_storage import ContentAddressedStorage, face_image_storage
+from .image_probe import apply_orientation, decode_image, exif_orientation
+from .thumbnails import delete_thumbnails
+
+EXTENSIONS = {"WEBP": ".webp", "JPEG": ".jpg"}
+
+
+def storage_format() -> str:
+    image_format = settings.FACE_STORED_IMAGE_FORMAT.upper()
+    if image_format == "WEBP" and not features.check("webp"):
+        return "JPEG"
+    return image_format
+
+
+def storage_extension() -> str:
+    return EXTENSIONS[storage_format()]
+
+
+def _model_label(model) -> str:
+    return model._meta.label
+
+
+def quality_for(model) -> int:
+    return settings.FACE_STORED_IMAGE_QUALITY_BY_MODEL.get(
+        _model_label(model), settings.FACE_STORED_IMAGE_QUALITY
+    )
+
+
+def _crop(img, box):
+    top, left, bottom, right = box
+    margin = settings.FACE_STORED_IMAGE_CROP_MARGIN
+    pad_y, pad_x = int((bottom - top) * margin), int((right - left) * margin)
+    return img.crop(
+        (
+            max(0, left - pad_x),
+            max(0, top - pad_y),
+            min(img.width, right + pad_x),
+            min(img.height, bottom + pad_y),
+        )
+    )
+
+
+def _boxes_oriented() -> bool:
+    """Si las cajas de la versión de modelo activa están en la imagen ya orientada."""
+    # Import diferido: services importa este módulo
+    from .services import exif_transpose_for
+
+    return exif_transpose_for()
+
+
+def encode_for_storage(img_bytes: bytes, model, box=None) -> bytes:
+    """
+    Re-codifica una imagen para guardarla en un campo de `model`, siempre con la
+    orientación EXIF aplicada. `box` es la caja (top, left, bottom, right) de la
+    inferencia con la versión de modelo activa, en coordenadas de `decode_image`.
+    """
+    img = decode_image(img_bytes)
+    orientation = exif_orientation(img)
+    if box is not None and _model_label(model) in settings.FACE_STORED_IMAGE_FACE_CROP:
+        if _boxes_oriented():
+            img, orientation = apply_orientation(img, orientation), 1
+        img = _crop(img, box)
+    img = apply_orientation(img, orientation)
+
+    max_side = settings.FACE_STORED_IMAGE_MAX_SIDE
+    img.thumbnail((max_side, max_side))
+
+    buffer = io.BytesIO()
+    img.save(buffer, format=storage_format(), quality=quality_for(model))
+    return buffer.getvalue()
+
+
+def attach_face_box(upload, detection):
+    """Adjunta al archivo subido la caja del rostro detectado para el recorte al guardarlo."""
+    if detection and detection.get("box") is not None:
+        upload.face_box = detection["box"]
+    return upload
+
+
+def release_file(storage, name: str) -> None:
+    """Borra (o libera, en el almacén por contenido) el archivo y sus miniaturas."""
+    storage.delete(name)
+    # ContentAddressedStorage borra las miniaturas solo cuando borra el archivo
+    if not isinstance(storage, ContentAddressedStorage):
+        delete_thumbnails(name)
+
+
+class StoredFaceImageFieldFile(ImageFieldFile):
+    def save(self, name, content, save=True):
+        content.seek(0)
+        data = encode_for_storage(
+            content.read(), self.field.model, getattr(content, "face_box", None)
+        )
+        name = os.path.splitext(name)[0] + storage_extension()
+        super().save(name, ContentFile(data), save)
+
+
+class StoredFaceImageField(models.ImageField):
+    """
+    ImageField que guarda la imagen re-codificada y reducida en vez del archivo
+    original, en el almacén direccionado por contenido (ver `content_storage`).
+    Al borrar la fila se libera su referencia al archivo.
+    """
+
+    attr_class = StoredFaceImageFieldFile
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("storage", face_image_storage)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        # El storage depende de la configuración, no del esquema
+        if kwargs.get("storage") is face_image_storage:
+            del kwargs["storage"]
+        return name, path, args, kwargs
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        super().contribute_to_class(cls, name, **kwargs)
+        if not cls._meta.abstract:
+            post_delete.connect(
+                self._release_file,
+                sender=cls,
+                weak=False,
+                dispatch_uid=f"release-{cls._meta.label}-{name}",
+            )
+
+    def _release_file(self, sender, instance, **kwargs):
+        file = getattr(instance, self.attname)
+        if file and file.name:
+            transaction.on_commit(lambda: release_file(self.storage, file.name))
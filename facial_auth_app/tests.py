@@ -1,3 +1,698 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from PIL import Image
+
+from facial_auth_app import gallery, metrics
+from facial_auth_app.admission import (
+    InferenceAdmission,
+    InferenceDeadlineExceededError,
+    InferenceOverloadedError,
+)
+from facial_auth_app.burst import BurstProbe
+from facial_auth_app.content_storage import content_storage
+from facial_auth_app.embedding_cache import embedding_cache
+from facial_auth_app.gallery import (
+    SYSTEM_SCOPE,
+    deferred_bumps,
+    galleries_for,
+    search_galleries,
+)
+from facial_auth_app.image_probe import (
+    EXIF_ORIENTATION_TAG,
+    ImageRejectedError,
+    decode_image,
+    probe_upload,
+)
+from facial_auth_app.inference_pool import InferencePool
+from facial_auth_app.models import FacialRecognitionProfile, GalleryState, StoredBlob
+from facial_auth_app.stored_images import encode_for_storage, storage_extension
+from facial_auth_app.thumbnails import THUMBNAIL_SIZES, get_thumbnail
+
+
+def _png(size=(32, 32)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (120, 90, 60)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _rotated_jpeg(size=(40, 20), orientation=6):
+    """JPEG de `size` píxeles con una etiqueta de orientación EXIF."""
+    img = Image.new("RGB", size, (120, 90, 60))
+    exif = img.getexif()
+    exif[EXIF_ORIENTATION_TAG] = orientation
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+def _encoding(*values):
+    return np.array(values, dtype=np.float32).tobytes()
+
+
+class GalleryTests(TestCase):
+    def setUp(self):
+        # Las revisiones se repiten entre tests al deshacer la transacción
+        gallery._cache.clear()
+        User = get_user_model()
+        self.ana = User.objects.create_user("ana", "ana@example.com", "pw", face_auth_enabled=True)
+        self.bea = User.objects.create_user("bea", "bea@example.com", "pw", face_auth_enabled=True)
+
+    def _profile(self, user, encoding, version="v1"):
+        return FacialRecognitionProfile.objects.create(
+            user=user, face_encoding=encoding, embedding_model_version=version
+        )
+
+    def _revision(self):
+        return GalleryState.objects.get(scope=SYSTEM_SCOPE).revision
+
+    def test_probe_only_matches_embeddings_of_its_version(self):
+        self._profile(self.ana, _encoding(1, 0, 0))
+        self._profile(self.bea, _encoding(1, 0, 0), version="v1-cascade")
+        galleries = galleries_for(SYSTEM_SCOPE)
+
+        probe = {"embedding": np.array([1, 0, 0], dtype=np.float32)}
+        matches = search_galleries(galleries, {"v1": probe}, threshold=0.1)
+        self.assertEqual([(owner, version) for owner, _, version in matches], [(self.ana.id, "v1")])
+
+        matches = search_galleries(galleries, {"v1": probe, "v1-cascade": probe}, threshold=0.1)
+        self.assertEqual({owner for owner, _, _ in matches}, {self.ana.id, self.bea.id})
+
+    def test_best_distance_per_owner_sorted(self):
+        self._profile(self.ana, _encoding(1, 1, 0))
+        self._profile(self.ana, _encoding(1, 0, 0))
+        self._profile(self.bea, _encoding(1, 0.5, 0))
+        self._profile(self.bea, _encoding(1, 2, 0, 0))  # tamaño distinto: se descarta
+        v1 = galleries_for(SYSTEM_SCOPE)["v1"]
+
+        self.assertEqual(len(v1), 3)
+        matches = v1.search(np.array([1, 0, 0]), threshold=0.5)
+        self.assertEqual([owner for owner, _ in matches], [self.ana.id, self.bea.id])
+        self.assertAlmostEqual(matches[0][1], 0.0, places=6)
+
+    def test_changes_bump_revision_and_rebuild(self):
+        profile = self._profile(self.ana, _encoding(1, 0, 0))
+        revision = self._revision()
+        self.assertEqual(len(galleries_for(SYSTEM_SCOPE)["v1"]), 1)
+
+        # Sin cambios solo se consulta la revisión
+        with self.assertNumQueries(1):
+            galleries_for(SYSTEM_SCOPE)
+
+        self._profile(self.bea, _encoding(0, 1, 0))
+        self.assertEqual(self._revision(), revision + 1)
+        self.assertEqual(len(galleries_for(SYSTEM_SCOPE)["v1"]), 2)
+
+        profile.delete()
+        self.assertEqual(self._revision(), revision + 2)
+        self.assertEqual(len(galleries_for(SYSTEM_SCOPE)["v1"]), 1)
+
+    def test_partial_user_saves_do_not_bump(self):
+        revision = self._revision()
+        self.ana.save(update_fields=["last_login"])
+        self.assertEqual(self._revision(), revision)
+        self.ana.face_auth_enabled = False
+        self.ana.save(update_fields=["face_auth_enabled"])
+        self.assertEqual(self._revision(), revision + 1)
+
+    def test_deferred_bumps_collapse_per_scope(self):
+        revision = self._revision()
+        with deferred_bumps():
+            self._profile(self.ana, _encoding(1, 0, 0))
+            self._profile(self.bea, _encoding(0, 1, 0))
+            self.assertEqual(self._revision(), revision)
+        self.assertEqual(self._revision(), revision + 1)
+
+
+class ContentStorageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = self.settings(MEDIA_ROOT=media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def _refs(self, name):
+        return StoredBlob.objects.filter(name=name).values_list("refs", flat=True).first()
+
+    def test_identical_bytes_share_one_blob(self):
+        first = content_storage.save("a.jpg", ContentFile(b"rostro"))
+        second = content_storage.save("b.jpg", ContentFile(b"rostro"))
+        other = content_storage.save("c.jpg", ContentFile(b"otro rostro"))
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertTrue(first.startswith("blobs/"))
+        self.assertEqual(self._refs(first), 2)
+
+    def test_file_removed_with_last_reference(self):
+        name = content_storage.save("a.jpg", ContentFile(b"rostro"))
+        content_storage.save("b.jpg", ContentFile(b"rostro"))
+
+        content_storage.delete(name)
+        self.assertTrue(content_storage.exists(name))
+        self.assertEqual(self._refs(name), 1)
+
+        content_storage.delete(name)
+        self.assertFalse(content_storage.exists(name))
+        self.assertIsNone(self._refs(name))
+
+    def test_deleting_rows_releases_their_reference(self):
+        user = get_user_model().objects.create_user("ana", "ana@example.com", "pw")
+        profiles = [
+            FacialRecognitionProfile.objects.create(
+                user=user,
+                face_encoding=_encoding(1, 0),
+                face_image=ContentFile(_png(), name="rostro.png"),
+            )
+            for _ in range(2)
+        ]
+        name = profiles[0].face_image.name
+        self.assertEqual(profiles[1].face_image.name, name)
+        self.assertEqual(self._refs(name), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            profiles[0].delete()
+        self.assertEqual(self._refs(name), 1)
+        self.assertTrue(content_storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user.delete()
+        self.assertIsNone(self._refs(name))
+        self.assertFalse(content_storage.exists(name))
+
+
+class FaceSelectionTests(SimpleTestCase):
+    # (top, left, bottom, right) en una imagen de 100x100
+    BOXES = np.array([[0, 0, 20, 20], [40, 40, 60, 60], [50, 0, 100, 60]])
+    SCORES = np.array([0.99, 0.7, 0.8])
+
+    def test_policies(self):
+        from facial_auth_app.services import _select_face_index
+
+        shape = (100, 100, 3)
+        self.assertEqual(_select_face_index(self.BOXES, self.SCORES, shape, "score"), 0)
+        self.assertEqual(_select_face_index(self.BOXES, self.SCORES, shape, "area"), 2)
+        self.assertEqual(_select_face_index(self.BOXES, self.SCORES, shape, "center"), 1)
+        with self.assertRaises(ValueError):
+            _select_face_index(self.BOXES, self.SCORES, shape, "otra")
+
+    def test_rcnn_detect_crops_the_selected_face(self):
+        import tensorflow as tf
+
+        from facial_auth_app import services
+
+        # Cajas normalizadas; la última queda por debajo del umbral y la segunda está vacía
+        detector = mock.Mock(
+            return_value={
+                "detection_boxes": tf.constant(
+                    [[[0.0, 0.0, 0.2, 0.2], [0.5, 0.5, 0.5, 0.7], [0.1, 0.1, 0.9, 0.9]]]
+                ),
+                "detection_scores": tf.constant([[0.9, 0.95, 0.3]]),
+            }
+        )
+        image_np = np.zeros((100, 50, 3), dtype=np.uint8)
+        with mock.patch.dict(services.LOADED_MODELS, {"v1": (detector, None)}):
+            result = services._rcnn_detect(image_np, "area", "v1")
+
+        self.assertEqual(result["box"], (0, 0, 20, 10))
+        self.assertEqual(result["face"].shape, (20, 10, 3))
+        self.assertAlmostEqual(result["score"], 0.9, places=6)
+
+
+class CascadeDetectionTests(SimpleTestCase):
+    def _detect(self, cascade_box, version):
+        from facial_auth_app import services
+
+        full = {"face": None, "box": (0, 0, 4, 4), "score": 0.9}
+        image_np = np.zeros((10, 10, 3), dtype=np.uint8)
+        with (
+            mock.patch.object(services, "_cascade_detect", return_value=cascade_box) as cascade,
+            mock.patch.object(services, "_rcnn_detect", return_value=full) as rcnn,
+            metrics.collect() as counts,
+        ):
+            result = services._face_detect_and_align(image_np, version=version)
+        return result, counts, cascade, rcnn
+
+    def test_fast_path_skips_rcnn(self):
+        result, counts, _, rcnn = self._detect((2, 3, 8, 9), "v1-cascade")
+        self.assertEqual(result["box"], (2, 3, 8, 9))
+        self.assertEqual(result["face"].shape, (6, 6, 3))
+        self.assertIsNone(result["score"])
+        rcnn.assert_not_called()
+        self.assertEqual(counts["detector.fast_path"], 1)
+        self.assertNotIn("detector.full_path", counts)
+
+    def test_falls_back_to_rcnn(self):
+        result, counts, _, rcnn = self._detect(None, "v1-cascade")
+        self.assertEqual(result["score"], 0.9)
+        rcnn.assert_called_once()
+        self.assertEqual(counts["detector.full_path"], 1)
+        self.assertIn("detector.cascade_us", counts)
+
+    def test_versions_without_cascade_skip_it(self):
+        _, counts, cascade, _ = self._detect((2, 3, 8, 9), "v1")
+        cascade.assert_not_called()
+        self.assertEqual(counts["detector.full_path"], 1)
+
+    def test_detector_summary(self):
+        summary = metrics.detector_summary(
+            {
+                "detector.fast_path": 3,
+                "detector.full_path": 1,
+                "detector.full_us": 400_000,
+                "detector.cascade_us": 60_000,
+            }
+        )
+        self.assertEqual(summary["fast_path_ratio"], 0.75)
+        self.assertEqual(summary["avg_full_detection_ms"], 400)
+        self.assertEqual(summary["estimated_saved_ms"], 3 * 400 - 60)
+        self.assertIsNone(metrics.detector_summary({})["fast_path_ratio"])
+
+
+class EmbeddingCacheTests(SimpleTestCase):
+    def setUp(self):
+        embedding_cache.backend.clear()
+        self.addCleanup(embedding_cache.backend.clear)
+
+    def test_key_depends_on_bytes_version_and_policy(self):
+        key = embedding_cache.key_for(b"imagen", "v1")
+        self.assertEqual(key, embedding_cache.key_for(b"imagen"))
+        self.assertNotEqual(key, embedding_cache.key_for(b"otra", "v1"))
+        self.assertNotEqual(key, embedding_cache.key_for(b"imagen", "v1-cascade"))
+        with self.settings(FACE_SELECTION_POLICY="center"):
+            self.assertNotEqual(key, embedding_cache.key_for(b"imagen", "v1"))
+
+    def test_round_trip_and_cached_misses(self):
+        result = {"embedding": np.arange(4, dtype=np.float64), "box": [1, 2, 3, 4], "score": 0.9}
+        embedding_cache.set("con-rostro", result)
+        embedding_cache.set("sin-rostro", None)
+
+        found, cached = embedding_cache.get("con-rostro")
+        self.assertTrue(found)
+        self.assertEqual(cached["embedding"].dtype, np.float32)
+        np.testing.assert_array_equal(cached["embedding"], result["embedding"])
+        self.assertEqual(cached["box"], (1, 2, 3, 4))
+        self.assertEqual(embedding_cache.get("sin-rostro"), (True, None))
+        self.assertEqual(embedding_cache.get("desconocida"), (False, None))
+
+    def test_cached_image_skips_inference(self):
+        from facial_auth_app import services
+
+        result = {"embedding": np.ones(4, dtype=np.float32), "box": (0, 0, 4, 4), "score": 0.9}
+        with mock.patch.object(services, "_compute_embedding", return_value=result) as compute:
+            services._embed_image_bytes(b"imagen")
+            services._embed_image_bytes(b"imagen")
+            services._embed_image_bytes(b"imagen", version="v1-cascade")
+        self.assertEqual(compute.call_count, 2)
+
+
+class InferenceAdmissionTests(SimpleTestCase):
+    def test_rejects_when_queue_is_full(self):
+        admission = InferenceAdmission(concurrency=1, max_queue=1, max_wait=100)
+        admission.enqueue()
+        with self.assertRaises(InferenceOverloadedError) as ctx:
+            admission.enqueue()
+        self.assertEqual(ctx.exception.status_code, 503)
+        self.assertEqual(admission.stats["rejected"], 1)
+
+    def test_rejects_when_estimated_wait_exceeds_limit(self):
+        admission = InferenceAdmission(
+            concurrency=1, max_queue=10, max_wait=5, initial_service_time=2.2
+        )
+        admission.enqueue()
+        # Espera estimada: 2 trabajos x 2.2 s = 4.4 s; el tercero esperaría 6.6 s
+        admission.enqueue()
+        with self.assertRaises(InferenceOverloadedError) as ctx:
+            admission.enqueue()
+        self.assertEqual(ctx.exception.wait, 7)
+
+    def test_expired_job_is_dropped_before_running(self):
+        admission = InferenceAdmission(concurrency=1, max_queue=10, max_wait=100)
+        ran = mock.Mock()
+        with self.assertRaises(InferenceDeadlineExceededError):
+            with admission.admit(deadline=time.monotonic() - 1):
+                ran()
+        ran.assert_not_called()
+        self.assertEqual(admission.stats["expired"], 1)
+        self.assertEqual((admission.queued, admission.in_flight), (0, 0))
+        # El turno se liberó: el siguiente trabajo entra
+        with admission.admit():
+            ran()
+        ran.assert_called_once()
+
+    def test_leave_queue_is_idempotent(self):
+        admission = InferenceAdmission(concurrency=1, max_queue=10, max_wait=100)
+        ticket = admission.enqueue()
+        admission.leave_queue(ticket)
+        admission.leave_queue(ticket)
+        self.assertEqual(admission.queued, 0)
+
+
+class ImageProbeTests(SimpleTestCase):
+    def _upload(self, data):
+        return SimpleUploadedFile("rostro.jpg", data, content_type="image/jpeg")
+
+    @override_settings(FACE_IMAGE_MAX_BYTES=100)
+    def test_rejects_oversized_upload_before_opening_it(self):
+        with mock.patch("facial_auth_app.image_probe.Image.open") as image_open:
+            with self.assertRaises(ImageRejectedError):
+                probe_upload(self._upload(b"x" * 101))
+        image_open.assert_not_called()
+
+    @override_settings(FACE_IMAGE_MAX_PIXELS=30 * 30)
+    def test_rejects_too_many_pixels_from_the_header(self):
+        with self.assertRaisesMessage(ImageRejectedError, "demasiados píxeles"):
+            probe_upload(self._upload(_png((40, 40))))
+
+    def test_probe_reports_orientation_and_rewinds(self):
+        upload = self._upload(_rotated_jpeg())
+        info = probe_upload(upload)
+        self.assertEqual((info["width"], info["height"], info["orientation"]), (40, 20, 6))
+        self.assertEqual(upload.tell(), 0)
+
+    def test_rejects_non_images(self):
+        with self.assertRaisesMessage(ImageRejectedError, "no es una imagen"):
+            probe_upload(self._upload(b"no es una imagen"))
+
+    @override_settings(FACE_IMAGE_DOWNSCALE_PIXELS=20 * 20)
+    def test_downscales_large_images_while_decoding(self):
+        img = decode_image(_png((80, 40)))
+        self.assertLessEqual(img.width * img.height, 20 * 20)
+        self.assertEqual(img.width, 2 * img.height)
+
+    def test_orientation_only_applied_when_requested(self):
+        data = _rotated_jpeg()
+        self.assertEqual(decode_image(data).size, (40, 20))
+        self.assertEqual(decode_image(data, exif_transpose=True).size, (20, 40))
+
+    def test_model_version_controls_orientation(self):
+        from facial_auth_app import services
+
+        data = _rotated_jpeg()
+        self.assertEqual(services._bytes_to_array(data, "v1").shape[:2], (20, 40))
+        self.assertEqual(services._bytes_to_array(data, "v1-exif").shape[:2], (40, 20))
+
+
+@override_settings(
+    FACE_STORED_IMAGE_FACE_CROP=[FacialRecognitionProfile._meta.label],
+    FACE_STORED_IMAGE_CROP_MARGIN=0,
+    FACE_STORED_IMAGE_FORMAT="JPEG",
+)
+class StoredImageOrientationTests(SimpleTestCase):
+    def _stored_size(self, box, oriented):
+        with mock.patch("facial_auth_app.stored_images._boxes_oriented", return_value=oriented):
+            data = encode_for_storage(_rotated_jpeg(), FacialRecognitionProfile, box)
+        return Image.open(io.BytesIO(data)).size
+
+    def test_stored_image_is_upright(self):
+        self.assertEqual(self._stored_size(None, oriented=False), (20, 40))
+
+    def test_crop_box_in_raw_frame(self):
+        # Caja de 10x20 (ancho x alto) sobre la imagen sin girar: queda de 20x10
+        self.assertEqual(self._stored_size((0, 0, 20, 10), oriented=False), (20, 10))
+
+    def test_crop_box_in_oriented_frame(self):
+        self.assertEqual(self._stored_size((0, 0, 20, 10), oriented=True), (10, 20))
+
+
+@override_settings(FACE_BURST_REDETECT_DISTANCE=0.35)
+class BurstProbeTests(SimpleTestCase):
+    """Los modelos se sustituyen por `_embed_frame`: cada llamada devuelve el siguiente resultado."""
+
+    def _probe(self, results):
+        self.calls = []
+
+        def embed_frame(image_np, version, box, deadline):
+            self.calls.append(box)
+            return results.pop(0)
+
+        patchers = [
+            mock.patch("facial_auth_app.burst._embed_frame", side_effect=embed_frame),
+            mock.patch(
+                "facial_auth_app.burst._bytes_to_array", return_value=np.zeros((8, 8, 3))
+            ),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return BurstProbe(["v1"])
+
+    def _result(self, embedding, box=(1, 1, 5, 5)):
+        return {"embedding": np.array(embedding, dtype=np.float32), "box": box, "score": 0.9}
+
+    def test_reuses_box_and_fuses_frames(self):
+        burst = self._probe([self._result([3, 0]), self._result([1, 0.2])])
+        burst.add_frame(b"1")
+        burst.add_frame(b"2")
+
+        self.assertEqual(self.calls, [None, (1, 1, 5, 5)])
+        self.assertEqual((burst.frames, burst.detector_runs), (2, 1))
+        fused = burst.detections()["v1"]["embedding"]
+        expected = (np.array([1, 0]) + np.array([1, 0.2]) / np.linalg.norm([1, 0.2])) / 2
+        np.testing.assert_allclose(fused, expected, rtol=1e-6)
+
+    def test_redetects_when_the_face_moved(self):
+        burst = self._probe(
+            [self._result([1, 0]), self._result([0, 1]), self._result([1, 0.1], box=(2, 2, 6, 6))]
+        )
+        burst.add_frame(b"1")
+        burst.add_frame(b"2")
+
+        self.assertEqual(self.calls, [None, (1, 1, 5, 5), None])
+        self.assertEqual(burst.detector_runs, 2)
+        self.assertEqual(list(burst._boxes.values()), [(2, 2, 6, 6)])
+
+    def test_frames_without_face_add_no_evidence(self):
+        burst = self._probe([None, self._result([1, 0])])
+        burst.add_frame(b"1")
+        self.assertIsNone(burst.detections()["v1"])
+        burst.add_frame(b"2")
+        self.assertEqual(burst.detector_runs, 2)
+        np.testing.assert_allclose(burst.detections()["v1"]["embedding"], [1, 0])
+
+
+class StoredImageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = self.settings(MEDIA_ROOT=media_root.name, FACE_STORED_IMAGE_MAX_SIDE=50)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = get_user_model().objects.create_user("ana", "ana@example.com", "pw")
+
+    def _save(self, upload):
+        return FacialRecognitionProfile.objects.create(
+            user=self.user, face_encoding=_encoding(1, 0), face_image=upload
+        ).face_image
+
+    def test_saved_image_is_reencoded_and_downscaled(self):
+        stored = self._save(ContentFile(_png((200, 100)), name="rostro.png"))
+        self.assertTrue(stored.name.endswith(storage_extension()))
+        with stored.open("rb"), Image.open(stored) as img:
+            self.assertEqual(img.size, (50, 25))
+
+    @override_settings(
+        FACE_STORED_IMAGE_FACE_CROP=[FacialRecognitionProfile._meta.label],
+        FACE_STORED_IMAGE_CROP_MARGIN=0.5,
+    )
+    def test_face_crop_keeps_margin_within_bounds(self):
+        upload = ContentFile(_png((200, 100)), name="rostro.png")
+        # Caja de 20x20 (top, left, bottom, right); el margen la lleva a 40x40
+        upload.face_box = (40, 90, 60, 110)
+        with mock.patch("facial_auth_app.stored_images._boxes_oriented", return_value=True):
+            stored = self._save(upload)
+        with stored.open("rb"), Image.open(stored) as img:
+            self.assertEqual(img.size, (40, 40))
+
+    @override_settings(
+        FACE_STORED_IMAGE_QUALITY=85,
+        FACE_STORED_IMAGE_QUALITY_BY_MODEL={"facial_auth_app.FaceFeedback": 60},
+    )
+    def test_quality_per_model(self):
+        from facial_auth_app.models import FaceFeedback
+        from facial_auth_app.stored_images import quality_for
+
+        self.assertEqual(quality_for(FaceFeedback), 60)
+        self.assertEqual(quality_for(FacialRecognitionProfile), 85)
+
+
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        override = self.settings(
+            MEDIA_ROOT=os.path.join(root.name, "media"),
+            FACE_THUMBNAIL_ROOT=os.path.join(root.name, "thumbs"),
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        user = get_user_model().objects.create_user("ana", "ana@example.com", "pw")
+        self.profile = FacialRecognitionProfile.objects.create(
+            user=user,
+            face_encoding=_encoding(1, 0),
+            face_image=ContentFile(_png((400, 200)), name="rostro.png"),
+        )
+
+    def test_thumbnail_is_generated_once(self):
+        path = get_thumbnail(self.profile.face_image, "small")
+        with Image.open(path) as img:
+            self.assertEqual(max(img.size), THUMBNAIL_SIZES["small"])
+
+        with mock.patch("facial_auth_app.thumbnails._render") as render:
+            self.assertEqual(get_thumbnail(self.profile.face_image, "small"), path)
+        render.assert_not_called()
+
+    def test_thumbnails_removed_with_the_image(self):
+        paths = [get_thumbnail(self.profile.face_image, size) for size in THUMBNAIL_SIZES]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.delete()
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+
+
+class ReembedFacesCommandTests(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.checkpoint = os.path.join(root.name, "reembed.json")
+        override = self.settings(MEDIA_ROOT=os.path.join(root.name, "media"))
+        override.enable()
+        self.addCleanup(override.disable)
+
+        user = get_user_model().objects.create_user("ana", "ana@example.com", "pw")
+        self.profiles = [
+            FacialRecognitionProfile.objects.create(
+                user=user,
+                face_encoding=_encoding(1, 0),
+                embedding_model_version="v0",
+                face_image=ContentFile(_png(), name="rostro.png") if i != 1 else None,
+            )
+            for i in range(4)
+        ]
+        patcher = mock.patch(
+            "facial_auth_app.management.commands.reembed_faces._embed_array_batch",
+            side_effect=lambda images: [
+                {"embedding": np.full(3, 0.5, dtype=np.float32), "box": None, "score": 0.9}
+                for _ in images
+            ],
+        )
+        self.embed = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _run(self, *args):
+        out = io.StringIO()
+        args = ["--only", "profiles", "--batch-size", "2", *args]
+        call_command("reembed_faces", *args, stdout=out, stderr=io.StringIO())
+        return out.getvalue()
+
+    def _versions(self):
+        return list(
+            FacialRecognitionProfile.objects.order_by("pk").values_list(
+                "embedding_model_version", flat=True
+            )
+        )
+
+    def test_reembeds_rows_with_images_and_resumes(self):
+        revision = GalleryState.objects.get(scope=SYSTEM_SCOPE).revision
+        out = self._run("--checkpoint", self.checkpoint)
+
+        self.assertIn("3 actualizados, 1 sin imagen", out)
+        self.assertEqual(self._versions(), ["v1", "v0", "v1", "v1"])
+        # Una invalidación de galería por lote
+        self.assertEqual(GalleryState.objects.get(scope=SYSTEM_SCOPE).revision, revision + 2)
+        with open(self.checkpoint) as f:
+            self.assertEqual(json.load(f)["profiles"], self.profiles[-1].pk)
+
+        self.embed.reset_mock()
+        self.assertIn("0 actualizados, 0 sin imagen", self._run("--checkpoint", self.checkpoint))
+        self.embed.assert_not_called()
+
+    def test_shard_only_processes_its_rows(self):
+        shard = self.profiles[0].pk % 2
+        self._run("--shard", f"{shard}/2")
+        expected = ["v1" if p.pk % 2 == shard and p.face_image else "v0" for p in self.profiles]
+        self.assertEqual(self._versions(), expected)
+
+    def test_rejects_checkpoint_of_another_version(self):
+        with open(self.checkpoint, "w") as f:
+            json.dump({"version": "v0", "shard": "0/1", "profiles": 1}, f)
+        with self.assertRaisesMessage(CommandError, "otra versión de modelo"):
+            self._run("--checkpoint", self.checkpoint)
+
+
+class InferencePoolTests(SimpleTestCase):
+    """El pool se prueba con hilos en lugar de procesos: sin cargar modelos."""
+
+    def setUp(self):
+        patcher = mock.patch(
+            "facial_auth_app.inference_pool.ProcessPoolExecutor",
+            lambda max_workers, **kwargs: ThreadPoolExecutor(max_workers),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = InferencePool(2)
+        self.addCleanup(self.pool.shutdown)
+
+    def _fake_embed(self, image_np, version=None, box=None):
+        metrics.incr("embedding_calls")
+        return {"embedding": image_np.mean(axis=(0, 1)), "version": version}
+
+    def test_embed_reads_the_image_from_shared_memory(self):
+        image_np = np.arange(4 * 4 * 3, dtype=np.float32).reshape(4, 4, 3)
+        with mock.patch("facial_auth_app.services._embed_array", side_effect=self._fake_embed):
+            result = self.pool.embed(image_np, "v1")
+
+        np.testing.assert_allclose(result["embedding"], image_np.mean(axis=(0, 1)))
+        self.assertEqual(result["version"], "v1")
+
+    def test_embed_many_keeps_order_and_merges_metrics(self):
+        images = [np.full((2, 2, 3), value, dtype=np.float32) for value in (1, 2, 3)]
+        with (
+            mock.patch("facial_auth_app.services._embed_array", side_effect=self._fake_embed),
+            mock.patch.object(metrics, "incr_many") as incr_many,
+        ):
+            results = self.pool.embed_many(images)
+
+        self.assertEqual([r["embedding"][0] for r in results], [1, 2, 3])
+        self.assertEqual(incr_many.call_count, 3)
+        self.assertEqual(incr_many.call_args.args[0], {"embedding_calls": 1})
+
+
+class BenchmarkInferenceCommandTests(SimpleTestCase):
+    def _image_file(self):
+        image = tempfile.NamedTemporaryFile(suffix=".png")
+        image.write(_png())
+        image.flush()
+        self.addCleanup(image.close)
+        return image.name
+
+    def test_image_is_required(self):
+        with self.assertRaises(CommandError):
+            call_command("benchmark_inference")
+
+    def test_rejects_image_without_face(self):
+        with mock.patch(
+            "facial_auth_app.management.commands.benchmark_inference._embed_array",
+            return_value=None,
+        ), mock.patch(
+            "facial_auth_app.management.commands.benchmark_inference.InferencePool"
+        ) as pool:
+            with self.assertRaisesMessage(CommandError, "No se detectó ningún rostro"):
+                call_command("benchmark_inference", "--image", self._image_file())
+        pool.assert_not_called()
+
+    def test_rejects_unreadable_image(self):
+        with self.assertRaisesMessage(CommandError, "No se pudo leer la imagen"):
+            call_command("benchmark_inference", "--image", "/no/existe.png")
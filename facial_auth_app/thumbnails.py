@@ -0,0 +1,66 @@
+"""
+Miniaturas de las imágenes de rostro para el admin.
+
+Se generan la primera vez que se piden, en los tamaños fijos de THUMBNAIL_SIZES, y
+se guardan en FACE_THUMBNAIL_ROOT con un nombre derivado del archivo original.
+Como los nombres de las imágenes no se reutilizan para otro contenido, una
+miniatura nunca queda desactualizada; el directorio es una caché que puede
+borrarse en cualquier momento. Las miniaturas se borran junto con el archivo
+original (`delete_thumbnails`), para que la retención de imágenes las alcance.
+"""
+import hashlib
+import io
+import os
+import tempfile
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+THUMBNAIL_SIZES = {"small": 64, "preview": 300}
+
+
+def thumbnail_version(name: str) -> str:
+    """Identificador corto del archivo original, para invalidar cachés de navegador."""
+    return hashlib.sha1(name.encode()).hexdigest()[:16]
+
+
+def _thumbnail_path(name: str, size: str) -> str:
+    digest = hashlib.sha1(name.encode()).hexdigest()
+    return os.path.join(settings.FACE_THUMBNAIL_ROOT, size, digest[:2], f"{digest}.webp")
+
+
+def _render(data: bytes, side: int) -> bytes:
+    img = Image.open(io.BytesIO(data))
+    # draft evita decodificar un JPEG grande a resolución completa
+    img.draft("RGB", (side, side))
+    img = ImageOps.exif_transpose(img).convert("RGB")
+    img.thumbnail((side, side))
+    buffer = io.BytesIO()
+    img.save(buffer, format="WEBP", quality=80)
+    return buffer.getvalue()
+
+
+def get_thumbnail(field_file, size: str) -> str:
+    """Devuelve la ruta de la miniatura de `field_file`, generándola si no existe."""
+    path = _thumbnail_path(field_file.name, size)
+    if os.path.exists(path):
+        return path
+
+    with field_file.storage.open(field_file.name, "rb") as f:
+        data = _render(f.read(), THUMBNAIL_SIZES[size])
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return path
+
+
+def delete_thumbnails(name: str) -> None:
+    """Borra las miniaturas del archivo `name` (se llama al borrar el original)."""
+    for size in THUMBNAIL_SIZES:
+        try:
+            os.remove(_thumbnail_path(name, size))
+        except FileNotFoundError:
+            pass